@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Git 分段性能基准
+在临时目录中构建指定规模的仓库（文件数、今日提交、未提交变更、origin 远程分支、子模块），
+测量 get_git_info / get_today_code_lines / get_git_behind_info 的耗时，并按 git 子命令拆分
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATUS_SCRIPT = os.path.join(SCRIPT_DIR, 'status-final.py')
+
+# 参与测量的分段函数
+SEGMENTS = ['get_git_info', 'get_today_code_lines', 'get_git_behind_info']
+
+# status-final.py 中 git 调用的超时（秒）：log 为 5 秒，其余为 2 秒（fetch 在后台进程中执行，不计入）
+GIT_TIMEOUTS = {'log': 5}
+DEFAULT_GIT_TIMEOUT = 2
+
+# 构建仓库时使用的固定身份，避免依赖用户的 git 配置
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'bench', 'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'bench', 'GIT_COMMITTER_EMAIL': 'bench@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+# ================================
+# 构建仓库
+# ================================
+
+def git(args, cwd, env=None, input=None):
+    """执行 git 命令（构建仓库用）"""
+    full_env = dict(os.environ)
+    full_env.update(GIT_ENV)
+    if env:
+        full_env.update(env)
+    return subprocess.run(
+        ['git'] + args, cwd=cwd, env=full_env, input=input, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8'
+    ).stdout.strip()
+
+def _date_env(when):
+    stamp = when.strftime('%Y-%m-%dT%H:%M:%S')
+    return {'GIT_AUTHOR_DATE': stamp, 'GIT_COMMITTER_DATE': stamp}
+
+def build_repo(root, files=1000, commits_today=20, dirty=10, remote_branches=20,
+               submodules=0, packed_refs=False):
+    """在 root 下构建测试仓库，返回工作区路径"""
+    repo = os.path.join(root, 'repo')
+    origin = os.path.join(root, 'origin.git')
+    os.makedirs(repo)
+    git(['init', '-q', '-b', 'main'], repo)
+
+    # 初始提交（昨天）：files 个文件，分布在子目录中
+    for i in range(files):
+        directory = os.path.join(repo, 'src', f'pkg{i % 50:02d}')
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'file{i:05d}.py'), 'w', encoding='utf-8') as f:
+            f.write(''.join(f"line_{j} = {i * j}\n" for j in range(20)))
+    git(['add', '-A'], repo)
+    yesterday = datetime.now() - timedelta(days=1)
+    git(['commit', '-q', '-m', 'initial'], repo, env=_date_env(yesterday))
+
+    # 今日提交：每次修改几个文件
+    today = datetime.now().replace(hour=0, minute=0, second=1)
+    for c in range(commits_today):
+        for k in range(3):
+            i = (c * 7 + k) % max(1, files)
+            path = os.path.join(repo, 'src', f'pkg{i % 50:02d}', f'file{i:05d}.py')
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(f"change_{c}_{k} = {c}\n")
+        git(['commit', '-q', '-am', f'change {c}'], repo, env=_date_env(today + timedelta(seconds=c)))
+
+    # 子模块：每个都是只有一个提交的独立小仓库
+    for s in range(submodules):
+        sub = os.path.join(root, f'sub{s}')
+        os.makedirs(sub)
+        git(['init', '-q', '-b', 'main'], sub)
+        with open(os.path.join(sub, 'README'), 'w', encoding='utf-8') as f:
+            f.write(f"submodule {s}\n")
+        git(['add', '-A'], sub)
+        git(['commit', '-q', '-m', 'init'], sub)
+        git(['-c', 'protocol.file.allow=always', 'submodule', '-q', 'add', sub, f'modules/sub{s}'], repo)
+    if submodules:
+        git(['commit', '-q', '-m', 'add submodules'], repo, env=_date_env(today + timedelta(seconds=commits_today)))
+
+    # origin 是本地裸仓库，fetch 不需要网络
+    git(['init', '-q', '--bare', origin], root)
+    git(['remote', 'add', 'origin', origin], repo)
+    git(['push', '-q', 'origin', 'main'], repo)
+    git(['fetch', '-q', 'origin'], repo)
+    git(['branch', '-q', '--set-upstream-to=origin/main'], repo)
+
+    # 远程分支：一条比 HEAD 新的提交链，第 i 个分支指向链上第 i 个提交
+    tree = git(['rev-parse', 'HEAD^{tree}'], repo)
+    parent = git(['rev-parse', 'HEAD'], repo)
+    later = datetime.now() + timedelta(minutes=1)
+    for b in range(remote_branches):
+        parent = git(['commit-tree', tree, '-p', parent, '-m', f'remote {b}'], repo,
+                     env=_date_env(later + timedelta(seconds=b)))
+        git(['update-ref', f'refs/remotes/origin/feature-{b:04d}', parent], repo)
+    if packed_refs:
+        git(['pack-refs', '--all'], repo)
+
+    # 未提交的变更：一半已暂存，一半未暂存
+    for d in range(dirty):
+        i = (d * 13) % max(1, files)
+        path = os.path.join(repo, 'src', f'pkg{i % 50:02d}', f'file{i:05d}.py')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f"dirty_{d} = {d}\n")
+        if d % 2 == 0:
+            git(['add', path], repo)
+    return repo
+
+# ================================
+# 测量（每次测量都在全新进程中执行）
+# ================================
+
+class _TimedPopen(subprocess.Popen):
+    """记录从启动到 wait() 返回的耗时"""
+    calls = None
+
+    def __init__(self, args, *a, **kw):
+        self._bench_start = time.perf_counter()
+        self._bench_args = list(args)
+        self._bench_recorded = False
+        super().__init__(args, *a, **kw)
+
+    def wait(self, timeout=None):
+        try:
+            return super().wait(timeout)
+        finally:
+            if not self._bench_recorded and self.returncode is not None:
+                self._bench_recorded = True
+                _TimedPopen.calls.append({
+                    'cmd': _command_name(self._bench_args),
+                    'ms': (time.perf_counter() - self._bench_start) * 1000,
+                    'timeout': self.returncode < 0
+                })
+
+def _command_name(args):
+    """取 git 子命令名（跳过 -c 配置参数）"""
+    args = [str(a) for a in args]
+    if not args or os.path.basename(args[0]) not in ('git', 'git.exe'):
+        return os.path.basename(args[0]) if args else '?'
+    i = 1
+    while i < len(args) and args[i].startswith('-'):
+        i += 2 if args[i] == '-c' else 1
+    return args[i] if i < len(args) else 'git'
+
+def worker_main(func_name):
+    """worker 进程：导入状态栏脚本，统计其中每个子进程的耗时，执行一个分段函数"""
+    import importlib.util
+
+    calls = []
+    _TimedPopen.calls = calls
+    # subprocess.run / check_output 内部都通过 Popen 启动进程
+    subprocess.Popen = _TimedPopen
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('status_final', STATUS_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    output = getattr(module, func_name)()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({'import_ms': import_ms, 'ms': elapsed_ms, 'calls': calls, 'output': output}))
+
+def run_worker(home, repo, func_name):
+    """在全新进程中执行一次分段函数"""
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    env['GIT_CONFIG_NOSYSTEM'] = '1'
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', func_name],
+        stdin=subprocess.DEVNULL, cwd=repo, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', timeout=600
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def clear_caches(home):
+    """删除状态栏的所有缓存（冷启动）"""
+    claude_dir = os.path.join(home, '.claude')
+    os.makedirs(claude_dir, exist_ok=True)
+    for name in os.listdir(claude_dir):
+        if name.startswith('.status'):
+            path = os.path.join(claude_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+def summarize_calls(runs):
+    """按子命令汇总：每次运行的调用次数和耗时取中位数，最大耗时取所有运行中的最大值"""
+    names = sorted({call['cmd'] for run in runs for call in run['calls']})
+    summary = {}
+    for name in names:
+        per_run = [[c for c in run['calls'] if c['cmd'] == name] for run in runs]
+        durations = [c['ms'] for calls in per_run for c in calls]
+        summary[name] = {
+            'count': median([len(calls) for calls in per_run]),
+            'ms': median([sum(c['ms'] for c in calls) for calls in per_run]),
+            'max_ms': max(durations),
+            'timeouts': sum(1 for calls in per_run for c in calls if c['timeout']),
+        }
+    return summary
+
+def print_breakdown(label, result):
+    """打印一个分段的耗时和子进程拆分"""
+    print(f"  {Colors.BOLD}{label}{Colors.RESET}: {result['ms']:.1f}ms")
+    if not result['calls']:
+        print("      （没有启动子进程）")
+    for name, call in result['calls'].items():
+        limit = GIT_TIMEOUTS.get(name, DEFAULT_GIT_TIMEOUT) * 1000
+        mark = ''
+        if call['timeouts']:
+            mark = f"  {Colors.RED}超时 {call['timeouts']} 次{Colors.RESET}"
+        elif call['max_ms'] >= limit * 0.5:
+            mark = f"  {Colors.YELLOW}接近 {limit / 1000:.0f}s 超时{Colors.RESET}"
+        print(f"      git {name:<10} ×{call['count']:<3} {call['ms']:>8.1f}ms  (最大 {call['max_ms']:.1f}ms){mark}")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Git 分段性能基准（离线运行，HOME 指向临时目录）")
+    parser.add_argument('--files', type=int, default=1000, help="仓库中的文件数")
+    parser.add_argument('--commits-today', type=int, default=20, help="今日提交数")
+    parser.add_argument('--dirty', type=int, default=10, help="未提交变更的文件数")
+    parser.add_argument('--remote-branches', type=int, default=20, help="refs/remotes/origin/ 下的分支数")
+    parser.add_argument('--submodules', type=int, default=0, help="子模块数")
+    parser.add_argument('--packed-refs', action='store_true', help="把引用打包进 packed-refs")
+    parser.add_argument('--iterations', type=int, default=3, help="每项测量的重复次数（取中位数）")
+    parser.add_argument('--keep', action='store_true', help="保留生成的临时目录")
+    parser.add_argument('--json', metavar='PATH', help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    print_header("Git 分段性能基准")
+
+    root = tempfile.mkdtemp(prefix='claude-status-git-bench-')
+    try:
+        print_step("1/3", "构建测试仓库...")
+        start = time.perf_counter()
+        repo = build_repo(root, args.files, args.commits_today, args.dirty,
+                          args.remote_branches, args.submodules, args.packed_refs)
+        home = os.path.join(root, 'home')
+        print_info("仓库", repo)
+        print_info("规模", f"{args.files} 个文件，今日 {args.commits_today} 个提交，{args.dirty} 个未提交变更，"
+                          f"{args.remote_branches} 个远程分支，{args.submodules} 个子模块")
+        print_info("构建耗时", f"{time.perf_counter() - start:.1f}s")
+        print()
+
+        print_step("2/3", f"测量各分段（每项 {args.iterations} 次，全新进程）...")
+        results = {}
+        for func_name in SEGMENTS:
+            cold = []
+            warm = []
+            for _ in range(args.iterations):
+                clear_caches(home)
+                cold.append(run_worker(home, repo, func_name))
+            clear_caches(home)
+            run_worker(home, repo, func_name)
+            for _ in range(args.iterations):
+                warm.append(run_worker(home, repo, func_name))
+            results[func_name] = {
+                'cold': {'ms': median([r['ms'] for r in cold]), 'calls': summarize_calls(cold)},
+                'warm': {'ms': median([r['ms'] for r in warm]), 'calls': summarize_calls(warm)},
+                'import_ms': median([r['import_ms'] for r in cold + warm]),
+                'output': warm[-1]['output'],
+            }
+        print()
+
+        print_step("3/3", "结果（中位数）")
+        for func_name in SEGMENTS:
+            r = results[func_name]
+            print(f"\n  {Colors.CYAN}{func_name}{Colors.RESET}  输出: {r['output']}")
+            print_breakdown("冷启动", r['cold'])
+            print_breakdown("热启动", r['warm'])
+        print()
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, indent=2, ensure_ascii=False)
+            print_info("结果已写入", args.json)
+        return 0
+    finally:
+        if args.keep:
+            print_info("临时目录已保留", root)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--worker':
+        worker_main(sys.argv[2])
+        sys.exit(0)
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+状态栏端到端渲染耗时回归检查
+按 Claude Code 的方式调用 status-final.py（全新进程、stdin 传入 JSON、读取 stdout），
+统计冷启动和热启动的 p50/p95/p99 耗时、导入耗时和 CPU 时间，并与保存的基线比较
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import importlib.util
+import subprocess
+import time
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATUS_SCRIPT = os.path.join(SCRIPT_DIR, 'status-final.py')
+
+# 允许的回归幅度（相对基线的比例），以及绝对容差（毫秒），避免小数值上的抖动误报
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_SLACK_MS = 3
+# 与基线比较的指标
+COMPARED_METRICS = ('p50', 'p95')
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+def load_corpus_tools():
+    """复用 bench-transcripts.py 中的语料生成和缓存清理"""
+    spec = importlib.util.spec_from_file_location('bench_transcripts', os.path.join(SCRIPT_DIR, 'bench-transcripts.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(values, p):
+    """最近秩法百分位数"""
+    values = sorted(values)
+    if not values:
+        return 0
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def render_once(home, project, payload):
+    """以全新进程渲染一次，返回 (墙钟耗时ms, 子进程CPU耗时ms, stdout)"""
+    import resource
+
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, STATUS_SCRIPT], input=payload, cwd=project['workdir'], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', timeout=60
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_ms = ((after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:])
+    return wall_ms, cpu_ms, result.stdout
+
+def measure_import(home):
+    """在全新进程中只导入脚本（不渲染），返回耗时ms"""
+    code = ("import sys, time, importlib.util; start = time.perf_counter(); "
+            f"spec = importlib.util.spec_from_file_location('status_final', {STATUS_SCRIPT!r}); "
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec)); "
+            "print((time.perf_counter() - start) * 1000)")
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    result = subprocess.run([sys.executable, '-c', code], stdin=subprocess.DEVNULL, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:])
+    return float(result.stdout.strip().splitlines()[-1])
+
+def summarize(samples):
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples) if samples else 0,
+    }
+
+def compare_with_baseline(results, baseline, threshold, slack_ms):
+    """与基线比较，返回回归项列表 [(名称, 基线值, 当前值)]"""
+    regressions = []
+    for state in ('cold', 'warm'):
+        for metric in COMPARED_METRICS:
+            for kind in ('wall', 'cpu'):
+                try:
+                    old = baseline['results'][state][kind][metric]
+                except (KeyError, TypeError):
+                    continue
+                new = results[state][kind][metric]
+                if new > old * (1 + threshold) + slack_ms:
+                    regressions.append((f"{state} {kind} {metric}", old, new))
+    try:
+        old = baseline['results']['import']['p50']
+        new = results['import']['p50']
+        if new > old * (1 + threshold) + slack_ms:
+            regressions.append(("import p50", old, new))
+    except (KeyError, TypeError):
+        pass
+    return regressions
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="状态栏端到端渲染耗时回归检查（离线运行，HOME 指向临时目录）")
+    parser.add_argument('-n', '--iterations', type=int, default=20, help="冷/热启动各渲染的次数")
+    parser.add_argument('--sessions', type=int, default=10, help="模拟语料中每个项目的会话文件数")
+    parser.add_argument('--lines', type=int, default=200, help="每个会话文件的行数")
+    parser.add_argument('--git', action='store_true', help="把当前项目初始化为 git 仓库")
+    parser.add_argument('--baseline', metavar='PATH', help="与该基线文件比较，回归超过阈值时返回非零退出码")
+    parser.add_argument('--save-baseline', metavar='PATH', help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="允许的回归比例（默认 0.2 即 20%%）")
+    parser.add_argument('--slack', type=float, default=DEFAULT_SLACK_MS, help="绝对容差（毫秒）")
+    parser.add_argument('--keep', action='store_true', help="保留生成的临时目录")
+    args = parser.parse_args()
+
+    print_header("状态栏端到端渲染耗时")
+
+    tools = load_corpus_tools()
+    root = tempfile.mkdtemp(prefix='claude-status-render-bench-')
+    try:
+        print_step("1/3", "生成模拟环境...")
+        info = tools.generate_corpus(root, projects=2, sessions=args.sessions, lines=args.lines,
+                                     agent_files=1, tool_result_kb=5)
+        home = info['home']
+        project = info['projects'][0]
+        if args.git:
+            subprocess.run(['git', 'init', '-q', project['workdir']], check=True, stdout=subprocess.DEVNULL)
+        payload = json.dumps(tools.claude_payload(project))
+        print_info("语料", f"{info['files']} 个文件，共 {info['lines']} 行，{info['bytes'] / 1024 / 1024:.1f}MB")
+        print()
+
+        print_step("2/3", f"渲染（冷/热启动各 {args.iterations} 次）...")
+        samples = {'cold': {'wall': [], 'cpu': []}, 'warm': {'wall': [], 'cpu': []}}
+        output = ''
+        for _ in range(args.iterations):
+            tools.clear_caches(home)
+            wall_ms, cpu_ms, _ = render_once(home, project, payload)
+            samples['cold']['wall'].append(wall_ms)
+            samples['cold']['cpu'].append(cpu_ms)
+        tools.clear_caches(home)
+        render_once(home, project, payload)
+        for _ in range(args.iterations):
+            wall_ms, cpu_ms, output = render_once(home, project, payload)
+            samples['warm']['wall'].append(wall_ms)
+            samples['warm']['cpu'].append(cpu_ms)
+        import_samples = [measure_import(home) for _ in range(args.iterations)]
+        print_info("输出", output.strip())
+        print()
+
+        results = {
+            state: {kind: summarize(values) for kind, values in kinds.items()}
+            for state, kinds in samples.items()
+        }
+        results['import'] = summarize(import_samples)
+
+        print_step("3/3", "结果（毫秒）")
+        print(f"  {'':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for state, label in (('cold', '冷启动'), ('warm', '热启动')):
+            for kind in ('wall', 'cpu'):
+                r = results[state][kind]
+                print(f"  {label + ' ' + kind:<12}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}")
+        r = results['import']
+        print(f"  {'导入':<12}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}")
+        print()
+
+        if args.save_baseline:
+            with open(args.save_baseline, 'w', encoding='utf-8') as f:
+                json.dump({'python': sys.version.split()[0], 'args': vars(args), 'results': results}, f, indent=2)
+            print_success(f"基线已保存到 {args.save_baseline}")
+
+        failed = False
+        if args.baseline:
+            try:
+                with open(args.baseline, 'r', encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                print_error(f"无法读取基线: {e}")
+                return 1
+            regressions = compare_with_baseline(results, baseline, args.threshold, args.slack)
+            for name, old, new in regressions:
+                print_error(f"{name}: {old:.1f}ms → {new:.1f}ms（+{(new / old - 1) * 100 if old else 0:.0f}%）")
+            failed = bool(regressions)
+            if not failed:
+                print_success(f"未超过基线 {args.threshold * 100:.0f}% + {args.slack:.0f}ms")
+
+            print("\n" + "="*60)
+            if failed:
+                print(f"{Colors.RED}{Colors.BOLD}检查未通过 ✗{Colors.RESET}")
+            else:
+                print(f"{Colors.GREEN}{Colors.BOLD}检查通过 ✓{Colors.RESET}")
+            print("="*60 + "\n")
+
+        return 1 if failed else 0
+    finally:
+        if args.keep:
+            print_info("临时目录已保留", root)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
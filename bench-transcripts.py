@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Transcript 统计性能基准
+在临时目录中生成模拟的 ~/.claude/projects，测量项目 token/费用/时间、会话消息数
+以及整条状态栏在冷启动（无缓存）和热启动（有缓存）下的耗时、峰值内存和解析吞吐
+（冷启动按当前项目的全部行数计算，热启动按每次新追加的行数计算）
+"""
+
+import sys
+import os
+import json
+import random
+import shutil
+import tempfile
+import argparse
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATUS_SCRIPT = os.path.join(SCRIPT_DIR, 'status-final.py')
+
+# 参与测量的分段：名称 -> status-final.py 中的函数名
+SEGMENTS = [
+    ('tokens', 'get_project_token_info'),
+    ('cost', 'get_project_cost'),
+    ('time', 'get_project_time'),
+    ('messages', 'get_session_message_count'),
+    ('render', 'render_status_line'),
+]
+
+# 热启动测量前每次向当前会话追加的行数（有缓存时只需解析这些新行）
+WARM_APPEND_LINES = 20
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+# ================================
+# 模拟数据生成
+# ================================
+
+def claude_project_folder_name(path):
+    """Claude Code 的项目文件夹命名规则：路径中所有非字母数字字符替换为 '-'"""
+    return ''.join(c if c.isalnum() and c.isascii() else '-' for c in path)
+
+def _iso(ts):
+    return ts.strftime('%Y-%m-%dT%H:%M:%S.') + f"{ts.microsecond // 1000:03d}Z"
+
+def _transcript_line(rng, kind, session_id, cwd, ts, tool_result_kb, sidechain=False):
+    """生成一行接近真实格式的 transcript 记录"""
+    base = {
+        'parentUuid': str(uuid.UUID(int=rng.getrandbits(128))),
+        'isSidechain': sidechain,
+        'userType': 'external',
+        'cwd': cwd,
+        'sessionId': session_id,
+        'version': '2.0.31',
+        'gitBranch': 'main',
+    }
+    if kind == 'user':
+        base.update({
+            'type': 'user',
+            'message': {'role': 'user', 'content': 'please ' + ' '.join(rng.choice(['fix', 'add', 'refactor', 'test', 'the', 'parser', 'bug']) for _ in range(rng.randint(3, 40)))},
+        })
+    elif kind == 'tool_result':
+        # 大体积的工具结果行（读文件、命令输出等）是解析耗时的主要来源
+        content = ''.join(rng.choice('abcdefghij \n\t"\\{}') for _ in range(256)) * max(1, tool_result_kb * 4)
+        base.update({
+            'type': 'user',
+            'message': {'role': 'user', 'content': [{'tool_use_id': 'toolu_' + uuid.UUID(int=rng.getrandbits(128)).hex[:24], 'type': 'tool_result', 'content': content}]},
+        })
+        base['toolUseResult'] = {'stdout': content[:1024], 'stderr': '', 'interrupted': False}
+    else:
+        base.update({
+            'message': {
+                'model': rng.choice(['claude-sonnet-4-5-20250929', 'claude-opus-4-5-20251101', 'claude-haiku-4-5-20251001']),
+                'id': 'msg_' + uuid.UUID(int=rng.getrandbits(128)).hex[:24],
+                'type': 'message',
+                'role': 'assistant',
+                'content': [{'type': 'text', 'text': 'Done. ' * rng.randint(1, 60)}],
+                'stop_reason': None,
+                'usage': {
+                    'input_tokens': rng.randint(1, 50),
+                    'cache_creation_input_tokens': rng.randint(0, 5000),
+                    'cache_read_input_tokens': rng.randint(0, 80000),
+                    'output_tokens': rng.randint(1, 2000),
+                    'service_tier': 'standard'
+                }
+            },
+            'requestId': 'req_' + uuid.UUID(int=rng.getrandbits(128)).hex[:24],
+            'type': 'assistant',
+        })
+    base['uuid'] = str(uuid.UUID(int=rng.getrandbits(128)))
+    base['timestamp'] = _iso(ts)
+    return json.dumps(base, ensure_ascii=False, separators=(',', ':'))
+
+def _bookkeeping_line(rng, session_id, cwd, ts):
+    """生成一行不含会话信息的记录（文件快照、last-prompt），统计时应被忽略"""
+    if rng.random() < 0.7:
+        message_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        backups = {
+            os.path.join(cwd, 'src', f'module{i}.py'): {'backupFileName': uuid.UUID(int=rng.getrandbits(128)).hex[:16] + '@v1', 'version': 1, 'backupTime': _iso(ts)}
+            for i in range(rng.randint(0, 20))
+        }
+        return json.dumps({'type': 'file-history-snapshot', 'messageId': message_id,
+                           'snapshot': {'messageId': message_id, 'trackedFileBackups': backups, 'timestamp': _iso(ts)},
+                           'isSnapshotUpdate': False}, separators=(',', ':'))
+    return json.dumps({'type': 'last-prompt', 'lastPrompt': 'run the tests', 'leafUuid': session_id}, separators=(',', ':'))
+
+def _malformed_line(rng, valid_line):
+    """生成一行损坏的记录：截断的 JSON、乱码或空白行"""
+    choice = rng.randint(0, 2)
+    if choice == 0:
+        return valid_line[:rng.randint(1, max(1, len(valid_line) - 1))]
+    if choice == 1:
+        return 'garbage ' + uuid.UUID(int=rng.getrandbits(128)).hex
+    return '   '
+
+def generate_corpus(root, projects=3, sessions=10, lines=200, agent_files=2,
+                    malformed=0.01, tool_result_kb=20, seed=42):
+    """在 root 下生成 home 目录和工作目录，返回语料信息
+
+    root/home/.claude/projects/<项目>/<会话>.jsonl，root/work/project-NNN 为对应的工作目录。
+    第一个项目作为"当前项目"。
+    """
+    rng = random.Random(seed)
+    home = os.path.join(root, 'home')
+    projects_dir = os.path.join(home, '.claude', 'projects')
+    os.makedirs(projects_dir, exist_ok=True)
+
+    info = {'home': home, 'projects': [], 'files': 0, 'lines': 0, 'bytes': 0}
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    for p in range(projects):
+        workdir = os.path.join(root, 'work', f'project-{p:03d}')
+        os.makedirs(workdir, exist_ok=True)
+        folder = os.path.join(projects_dir, claude_project_folder_name(workdir))
+        os.makedirs(folder, exist_ok=True)
+        project = {'workdir': workdir, 'folder': folder, 'latest': None}
+
+        for s in range(sessions + agent_files):
+            is_agent = s >= sessions
+            session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            if is_agent:
+                file_name = f"agent-{uuid.UUID(int=rng.getrandbits(128)).hex[:8]}.jsonl"
+            else:
+                file_name = f"{session_id}.jsonl"
+            file_path = os.path.join(folder, file_name)
+
+            ts = start + timedelta(days=30 * s / max(1, sessions + agent_files), seconds=rng.randint(0, 3600))
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'type': 'summary', 'summary': 'Benchmark session', 'leafUuid': str(uuid.UUID(int=rng.getrandbits(128)))}) + '\n')
+                for i in range(lines):
+                    ts += timedelta(seconds=rng.randint(1, 90))
+                    roll = rng.random()
+                    if roll < 0.05:
+                        line = _bookkeeping_line(rng, session_id, workdir, ts)
+                    else:
+                        kind = 'user' if roll < 0.2 else 'tool_result' if roll < 0.4 else 'assistant'
+                        line = _transcript_line(rng, kind, session_id, workdir, ts, tool_result_kb, sidechain=is_agent)
+                    if rng.random() < malformed:
+                        line = _malformed_line(rng, line)
+                    f.write(line + '\n')
+            info['files'] += 1
+            info['lines'] += lines + 1
+            info['bytes'] += os.path.getsize(file_path)
+            if not is_agent:
+                project['latest'] = (file_path, session_id)
+        info['projects'].append(project)
+    return info
+
+def append_to_corpus(info, lines=WARM_APPEND_LINES, seed=7):
+    """向当前项目最新的会话追加若干行（模拟正在进行的会话）"""
+    rng = random.Random(seed)
+    project = info['projects'][0]
+    file_path, session_id = project['latest']
+    ts = datetime.now(timezone.utc)
+    with open(file_path, 'a', encoding='utf-8') as f:
+        for i in range(lines):
+            ts += timedelta(seconds=5)
+            kind = 'user' if i % 3 == 0 else 'assistant'
+            f.write(_transcript_line(rng, kind, session_id, project['workdir'], ts, 1) + '\n')
+
+# ================================
+# 测量（每次测量都在全新进程中执行，与 Claude Code 的调用方式一致）
+# ================================
+
+def claude_payload(project):
+    """模拟 Claude Code 通过 stdin 传入的 JSON"""
+    file_path, session_id = project['latest']
+    return {
+        'session_id': session_id,
+        'transcript_path': file_path,
+        'cwd': project['workdir'],
+        'model': {'id': 'claude-sonnet-4-5-20250929', 'display_name': 'Sonnet 4.5'},
+        'workspace': {'current_dir': project['workdir'], 'project_dir': project['workdir']},
+        'context_window': {'context_window_size': 200000, 'current_usage': {'input_tokens': 10, 'cache_read_input_tokens': 40000, 'cache_creation_input_tokens': 500}}
+    }
+
+def seed_offline_state(home):
+    """写入新鲜的配额缓存，保证测量过程中不访问网络"""
+    claude_dir = os.path.join(home, '.claude')
+    now = time.time()
+    window = {'limit': 100, 'remaining': 60, 'used': 40, 'reset_at': now + 3600}
+    with open(os.path.join(claude_dir, '.cubence_cache.json'), 'w', encoding='utf-8') as f:
+        json.dump({'fetched_at': now + 86400, 'response_ms': 100, 'data': {'five_hour': window, 'weekly': window}}, f)
+
+def clear_caches(home):
+    """删除状态栏的所有缓存（冷启动）"""
+    claude_dir = os.path.join(home, '.claude')
+    for name in os.listdir(claude_dir):
+        if name.startswith(('.status', '.cubence')):
+            path = os.path.join(claude_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+    seed_offline_state(home)
+
+def run_worker(home, project, func_name):
+    """在全新进程中执行一次分段函数，返回测量结果"""
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', func_name],
+        input=json.dumps(claude_payload(project)), cwd=project['workdir'], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', timeout=600
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def worker_main(func_name):
+    """worker 进程：导入状态栏脚本并执行一个分段函数，输出 JSON 结果"""
+    import importlib.util
+    import resource
+
+    stdin_data = sys.stdin.read()
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('status_final', STATUS_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    module.load_claude_input(stdin_data)
+    # 冷启动测量完整的首次导入，而不是 indexing 占位（也避免后台导入进程与清理缓存冲突）
+    module.USAGE_DB_INLINE_MAX_BYTES = float('inf')
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    getattr(module, func_name)()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    cpu_ms = (time.process_time() - cpu_start) * 1000
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    rss_mb = max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+    print(json.dumps({'import_ms': import_ms, 'ms': elapsed_ms, 'cpu_ms': cpu_ms, 'rss_mb': rss_mb}))
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Transcript 统计性能基准（离线运行，HOME 指向临时目录）")
+    parser.add_argument('--projects', type=int, default=3, help="项目数")
+    parser.add_argument('--sessions', type=int, default=10, help="每个项目的会话文件数")
+    parser.add_argument('--lines', type=int, default=200, help="每个会话文件的行数")
+    parser.add_argument('--agent-files', type=int, default=2, help="每个项目的 agent-*.jsonl 文件数")
+    parser.add_argument('--malformed', type=float, default=0.01, help="损坏行的比例")
+    parser.add_argument('--tool-result-kb', type=int, default=20, help="单个工具结果行的大小（KB）")
+    parser.add_argument('--iterations', type=int, default=3, help="每项测量的重复次数（取中位数）")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--keep', action='store_true', help="保留生成的临时目录")
+    parser.add_argument('--json', metavar='PATH', help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    print_header("Transcript 统计性能基准")
+
+    root = tempfile.mkdtemp(prefix='claude-status-bench-')
+    try:
+        print_step("1/3", "生成模拟语料...")
+        start = time.perf_counter()
+        info = generate_corpus(root, args.projects, args.sessions, args.lines, args.agent_files,
+                               args.malformed, args.tool_result_kb, args.seed)
+        print_info("目录", root)
+        print_info("文件", f"{info['files']} 个，共 {info['lines']} 行，{info['bytes'] / 1024 / 1024:.1f}MB")
+        print_info("生成耗时", f"{time.perf_counter() - start:.1f}s")
+        print()
+
+        home = info['home']
+        project = info['projects'][0]
+        project_lines = 0
+        for name in os.listdir(project['folder']):
+            with open(os.path.join(project['folder'], name), 'rb') as f:
+                project_lines += sum(1 for _ in f)
+
+        print_step("2/3", f"测量各分段（每项 {args.iterations} 次，全新进程）...")
+        results = {}
+        for name, func_name in SEGMENTS:
+            cold = []
+            warm = []
+            for _ in range(args.iterations):
+                clear_caches(home)
+                cold.append(run_worker(home, project, func_name))
+            # 热启动：先完整渲染一次建立缓存，再追加少量新行模拟进行中的会话
+            clear_caches(home)
+            run_worker(home, project, 'render_status_line')
+            for i in range(args.iterations):
+                append_to_corpus(info, seed=i)
+                warm.append(run_worker(home, project, func_name))
+            results[name] = {
+                'cold_ms': median([r['ms'] for r in cold]),
+                'warm_ms': median([r['ms'] for r in warm]),
+                'cold_cpu_ms': median([r['cpu_ms'] for r in cold]),
+                'warm_cpu_ms': median([r['cpu_ms'] for r in warm]),
+                'cold_rss_mb': max(r['rss_mb'] for r in cold),
+                'warm_rss_mb': max(r['rss_mb'] for r in warm),
+                'import_ms': median([r['import_ms'] for r in cold + warm]),
+            }
+            cold_ms = results[name]['cold_ms']
+            warm_ms = results[name]['warm_ms']
+            results[name]['cold_lines_per_s'] = project_lines / (cold_ms / 1000) if cold_ms > 0 else 0
+            results[name]['warm_lines_per_s'] = WARM_APPEND_LINES / (warm_ms / 1000) if warm_ms > 0 else 0
+        print()
+
+        print_step("3/3", "结果（中位数）")
+        print(f"  {'分段':<10}{'冷(ms)':>10}{'热(ms)':>10}{'冷CPU':>10}{'热CPU':>10}{'冷RSS(MB)':>12}{'热RSS(MB)':>12}{'冷 行/s':>12}{'热 行/s':>12}")
+        for name, _ in SEGMENTS:
+            r = results[name]
+            print(f"  {name:<10}{r['cold_ms']:>10.1f}{r['warm_ms']:>10.1f}{r['cold_cpu_ms']:>10.1f}{r['warm_cpu_ms']:>10.1f}"
+                  f"{r['cold_rss_mb']:>12.1f}{r['warm_rss_mb']:>12.1f}{r['cold_lines_per_s']:>12.0f}{r['warm_lines_per_s']:>12.0f}")
+        print_info("脚本导入", f"{median([r['import_ms'] for r in results.values()]):.1f}ms")
+        print_info("当前项目行数", project_lines)
+        print_info("热启动前追加", f"每次 {WARM_APPEND_LINES} 行")
+        print()
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'corpus': {k: v for k, v in info.items() if k != 'projects'}, 'args': vars(args), 'results': results}, f, indent=2)
+            print_info("结果已写入", args.json)
+        return 0
+    finally:
+        if args.keep:
+            print_info("临时目录已保留", root)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--worker':
+        worker_main(sys.argv[2])
+        sys.exit(0)
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
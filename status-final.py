@@ -8,28 +8,457 @@ CUBENCE_API_KEY = "your-cubence-api-key-here"
 # XIAOAI_EMAIL = "your-email@example.com"
 # XIAOAI_PASSWORD = "your-password-here"
 
+# 配额缓存配置：新鲜期内直接使用缓存，过期后先显示旧值并在后台刷新（秒）
+CUBENCE_CACHE_TTL = 60
+# 缓存超过该时长则不再使用，改为同步请求（秒）
+CUBENCE_CACHE_MAX_STALE = 1800
+
+# HTTP 传输方式："stdlib" 使用标准库 http.client（启动快，无需第三方依赖），
+# "requests" 使用 requests 库（首次请求时才导入）
+HTTP_TRANSPORT = "stdlib"
+
+# Cubence API 地址（可改为代理或本地测试服务）
+CUBENCE_API_BASE = "https://cubence.com"
+
+# 自定义布局文件：显示哪些分段、顺序、分隔符和颜色阈值（JSON，不存在时使用默认布局）
+STATUS_LAYOUT_FILE = "~/.claude/status-layout.json"
+
+# 大仓库模式：None 按 .git/index 大小自动判断，True/False 强制开启/关闭
+# 开启后使用 git 的 untracked-cache（Windows/macOS 上 Git 2.36+ 另外启用内置 fsmonitor），变更文件数数到上限即停止，
+# git status 超时时只显示分支而不是 no-git
+GIT_LARGE_REPO_MODE = None
+# 自动判断阈值：index 超过该大小（字节）视为大仓库（约 20 万个文件）
+GIT_LARGE_REPO_INDEX_BYTES = 20 * 1024 * 1024
+# 大仓库模式下不统计未跟踪文件
+GIT_LARGE_REPO_SKIP_UNTRACKED = True
+# 大仓库模式下变更文件数的上限，超过显示为 "10+"
+GIT_LARGE_REPO_COUNT_CAP = 10
+
+# 常驻守护进程配置 (可选 - 开启后状态栏通过 Unix socket 交给后台进程渲染)
+# 守护进程常驻内存保存所有缓存和 HTTP 连接，未运行时会自动拉起，本次先在进程内渲染
+STATUS_DAEMON_ENABLED = False
+# 守护进程空闲多久后自动退出（秒）
+STATUS_DAEMON_IDLE_TIMEOUT = 1800
+
+# 用量数据库：把 transcript 增量导入本地 SQLite（~/.claude/.status_usage.db），项目 token/费用/时间
+# 直接查询汇总表；关闭或没有 sqlite3 时使用 JSON 检查点缓存
+USAGE_DB_ENABLED = True
+# 全部项目用量分段 (可选 - 今日/本周/累计的 token 和费用，需要用量数据库)
+GLOBAL_USAGE_ENABLED = False
+# 其他项目的数据由后台扫描更新，两次扫描的最短间隔（秒）
+GLOBAL_USAGE_SWEEP_INTERVAL = 300
+
+import time
+# 脚本开始执行的时刻（性能追踪的时间零点）
+_TRACE_T0 = time.perf_counter()
 import json
 import os
-import time
-import requests
 import sys
-import urllib3
+
+# ================================
+# 守护进程客户端（放在重量级 import 之前，命中守护进程时直接返回）
+# ================================
+DAEMON_SOCKET_PATH = os.path.expanduser('~/.claude/.status-daemon.sock')
+DAEMON_LOCK_PATH = os.path.expanduser('~/.claude/.status-daemon.lock')
+# 客户端等待守护进程回复的超时（秒），超时后回退到进程内渲染
+DAEMON_CLIENT_TIMEOUT = 3
+# 需要转发给守护进程的环境变量
+DAEMON_FORWARD_ENV = ('ANTHROPIC_MODEL', 'CLAUDE_STATUS_TRACE')
+
+def spawn_background(*args, stdin_data=None):
+    """以独立后台进程运行本脚本（不等待结束），stdin_data 会写入子进程的 stdin"""
+    import subprocess
+    kwargs = {}
+    if sys.platform != 'win32':
+        kwargs['start_new_session'] = True
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)] + list(args),
+            stdin=subprocess.DEVNULL if stdin_data is None else subprocess.PIPE,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            close_fds=True, **kwargs
+        )
+        if stdin_data is not None:
+            proc.stdin.write(stdin_data.encode('utf-8'))
+            proc.stdin.close()
+    except:
+        pass
+
+def run_daemon_client(stdin_data):
+    """把 stdin 转发给守护进程并输出回复，成功返回 True"""
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+
+    request = json.dumps({
+        'cwd': os.getcwd(),
+        'env': {name: os.environ[name] for name in DAEMON_FORWARD_ENV if name in os.environ},
+        'stdin': stdin_data
+    }).encode('utf-8')
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(DAEMON_CLIENT_TIMEOUT)
+    try:
+        sock.connect(DAEMON_SOCKET_PATH)
+    except OSError:
+        sock.close()
+        spawn_background('--daemon')
+        return False
+
+    try:
+        sock.sendall(request)
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+    if not chunks:
+        return False
+    sys.stdout.buffer.write(b''.join(chunks))
+    sys.stdout.flush()
+    return True
+
+# 从Claude Code传递的原始stdin（守护进程客户端和进程内渲染共用）
+_client_stdin = None
+# 读取 stdin 的起止时刻（性能追踪用）
+_stdin_read_times = None
+if __name__ == "__main__" and len(sys.argv) == 1:
+    _stdin_read_start = time.perf_counter()
+    try:
+        _client_stdin = sys.stdin.read()
+    except:
+        _client_stdin = ''
+    _stdin_read_times = (_stdin_read_start, time.perf_counter())
+    if STATUS_DAEMON_ENABLED and run_daemon_client(_client_stdin):
+        sys.exit(0)
+
 import subprocess
+import threading
+import zlib
+from bisect import bisect_right
 from functools import wraps
-from datetime import datetime
-
-# 读取从Claude Code传递的JSON数据
-claude_input = None
-try:
-    stdin_data = sys.stdin.read().strip()
-    if stdin_data:
-        claude_input = json.loads(stdin_data)
-        # 调试：打印收到的完整JSON到文件
-        debug_file = os.path.expanduser('~/.claude/statusline_debug.json')
-        with open(debug_file, 'w', encoding='utf-8') as f:
-            json.dump(claude_input, f, indent=2, ensure_ascii=False)
-except:
-    pass
+from datetime import date, datetime
+
+# ================================
+# 性能追踪：设置 CLAUDE_STATUS_TRACE=文件路径 后，把一次渲染写成 Chrome trace-event JSON
+# （用 chrome://tracing 或 ui.perfetto.dev 打开）
+# ================================
+TRACE_ENV = 'CLAUDE_STATUS_TRACE'
+# 当前渲染的追踪输出路径，未开启时为 None
+_trace_path = os.environ.get(TRACE_ENV) or None
+_trace_events = []
+_trace_threads = {}
+
+def trace_complete(name, cat, start, end, args=None):
+    """记录一个完整事件（start/end 为 perf_counter 时刻）"""
+    thread = threading.current_thread()
+    _trace_threads[thread.ident] = thread.name
+    _trace_events.append({
+        'name': name, 'cat': cat, 'ph': 'X',
+        'ts': round((start - _TRACE_T0) * 1e6, 1),
+        'dur': round((end - start) * 1e6, 1),
+        'pid': os.getpid(), 'tid': thread.ident,
+        'args': args or {}
+    })
+
+class TraceSpan:
+    """with 语句包裹的一段耗时，执行中可往 args 补充信息（字节数、状态码等）"""
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        trace_complete(self.name, self.cat, self.start, time.perf_counter(), self.args)
+        return False
+
+class _NullSpan:
+    """未开启追踪时使用的空操作 span"""
+    __slots__ = ()
+
+    @property
+    def args(self):
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def trace_span(name, cat='status', **args):
+    """开启追踪时返回记录耗时的 span，否则返回空操作 span"""
+    if _trace_path is None:
+        return _NULL_SPAN
+    return TraceSpan(name, cat, args)
+
+def begin_trace():
+    """按当前环境变量重新开始追踪（守护进程中每次渲染前调用）"""
+    global _trace_path
+    _trace_path = os.environ.get(TRACE_ENV) or None
+    del _trace_events[:]
+    # 线程名只输出本次渲染用到的线程，避免守护进程中越积越多
+    _trace_threads.clear()
+
+def write_trace():
+    """把记录的事件写入追踪文件"""
+    if _trace_path is None:
+        return
+    events = list(_trace_events)
+    for tid, name in list(_trace_threads.items()):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}})
+    save_json_file(os.path.expanduser(_trace_path), {'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+# 启动阶段（解释器启动之后）的耗时：读取 stdin 和导入模块
+if _trace_path is not None:
+    if _stdin_read_times:
+        trace_complete('stdin read', 'startup', _stdin_read_times[0], _stdin_read_times[1],
+                       {'bytes': len(_client_stdin or '')})
+    trace_complete('imports', 'startup', _TRACE_T0, time.perf_counter())
+
+# ================================
+# 分段健康统计：safe_execute 记录每个函数的调用次数、异常类型和耗时分布，
+# 定期合并进统计文件，用 --stats 查看最慢和最常出错的分段
+# ================================
+STATS_FILE = os.path.expanduser('~/.claude/.status_stats.json')
+# 两次合并之间的渲染只把增量追加到这个文件（每次一行 JSON），不重写统计文件
+STATS_PENDING_FILE = os.path.expanduser('~/.claude/.status_stats.pending')
+# 统计文件的最短合并间隔（秒）；记录到异常时立即合并
+STATS_FLUSH_INTERVAL = 30
+# 耗时直方图各桶的上界（毫秒），超过最后一个上界的计入额外的一桶
+STATS_LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 2000, 5000]
+
+# 本进程尚未写入文件的统计：函数名 -> 统计项
+_stats = {}
+_stats_lock = threading.Lock()
+
+def new_stats_entry():
+    return {
+        'calls': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'hist': [0] * (len(STATS_LATENCY_BUCKETS_MS) + 1),
+        'errors': {},
+        'last_error': None,
+        'last_error_at': None
+    }
+
+def record_call(name, elapsed_ms, error_type=None, error_text=None):
+    """记录一次调用的耗时和异常"""
+    bucket = len(STATS_LATENCY_BUCKETS_MS)
+    for i, bound in enumerate(STATS_LATENCY_BUCKETS_MS):
+        if elapsed_ms <= bound:
+            bucket = i
+            break
+    with _stats_lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = new_stats_entry()
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['hist'][bucket] += 1
+        if error_type:
+            entry['errors'][error_type] = entry['errors'].get(error_type, 0) + 1
+            entry['last_error'] = error_text or error_type
+            entry['last_error_at'] = time.time()
+
+def merge_stats_delta(functions, delta_by_name):
+    """把一批增量累加进统计项"""
+    for name, delta in delta_by_name.items():
+        entry = functions.setdefault(name, new_stats_entry())
+        entry['calls'] += delta['calls']
+        entry['total_ms'] = round(entry['total_ms'] + delta['total_ms'], 3)
+        entry['max_ms'] = round(max(entry['max_ms'], delta['max_ms']), 3)
+        entry['hist'] = [a + b for a, b in zip(entry['hist'], delta['hist'])]
+        for error_type, count in delta['errors'].items():
+            entry['errors'][error_type] = entry['errors'].get(error_type, 0) + count
+        if delta['last_error_at'] and (not entry['last_error_at'] or delta['last_error_at'] >= entry['last_error_at']):
+            entry['last_error'] = delta['last_error']
+            entry['last_error_at'] = delta['last_error_at']
+
+def flush_stats(force=False):
+    """保存本进程的统计
+
+    距上次合并不到 STATS_FLUSH_INTERVAL 秒且没有异常时：守护进程留在内存中，
+    普通渲染进程只把增量追加到待合并文件；否则连同待合并文件一起合并进统计文件。
+    """
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+
+    try:
+        last_merge = os.stat(STATS_FILE).st_mtime
+    except OSError:
+        last_merge = 0
+    has_errors = any(entry['errors'] for entry in pending.values())
+    if not force and not has_errors and time.time() - last_merge < STATS_FLUSH_INTERVAL:
+        if not pending:
+            return
+        if _daemon_mode:
+            with _stats_lock:
+                merge_stats_delta(_stats, pending)
+            return
+        try:
+            with open(STATS_PENDING_FILE, 'a', encoding='utf-8') as f:
+                lock_file_exclusive(f)
+                f.write(json.dumps(pending, separators=(',', ':')) + '\n')
+        except:
+            pass
+        return
+
+    merge_stats_file(pending)
+
+def merge_stats_file(pending=None):
+    """把待合并文件中的增量（以及 pending）合并进统计文件
+
+    读取待合并文件到写回统计文件的整个过程都持有待合并文件的排他锁，
+    并发合并的进程不会读到同一份旧统计后互相覆盖。
+    """
+    try:
+        f = open(STATS_PENDING_FILE, 'a+', encoding='utf-8')
+    except OSError:
+        f = None
+    try:
+        deltas = [pending] if pending else []
+        if f is not None:
+            lock_file_exclusive(f)
+            f.seek(0)
+            for line in f:
+                try:
+                    deltas.append(json.loads(line))
+                except ValueError:
+                    pass
+        if not deltas:
+            return
+
+        stats = load_json_file(STATS_FILE, {})
+        if not isinstance(stats, dict) or stats.get('buckets_ms') != STATS_LATENCY_BUCKETS_MS:
+            stats = {'buckets_ms': STATS_LATENCY_BUCKETS_MS, 'since': time.time(), 'functions': {}}
+        for delta in deltas:
+            try:
+                merge_stats_delta(stats['functions'], delta)
+            except (KeyError, TypeError, AttributeError):
+                # 旧版本格式或损坏的增量：跳过
+                pass
+        stats['updated_at'] = time.time()
+        save_json_file(STATS_FILE, stats)
+        if f is not None:
+            f.truncate(0)
+    finally:
+        if f is not None:
+            f.close()
+
+def _histogram_percentile(entry, buckets, p):
+    """按直方图估算百分位数（返回所在桶的上界）"""
+    target = entry['calls'] * p / 100
+    seen = 0
+    for i, count in enumerate(entry['hist']):
+        seen += count
+        if count and seen >= target:
+            return buckets[i] if i < len(buckets) else entry['max_ms']
+    return entry['max_ms']
+
+def print_stats():
+    """--stats：打印最慢和最常出错的分段"""
+    merge_stats_file()
+    stats = load_json_file(STATS_FILE, {})
+    functions = stats.get('functions') if isinstance(stats, dict) else None
+    if not functions:
+        print("暂无统计数据")
+        return
+    buckets = stats['buckets_ms']
+
+    since = datetime.fromtimestamp(stats.get('since', 0)).strftime('%Y-%m-%d %H:%M')
+    print(colorize(f"分段统计（自 {since} 起）", Colors.CYAN, bold=True))
+    print()
+    print(colorize("最慢的分段", Colors.BRIGHT_WHITE, bold=True))
+    print(f"  {'函数':<36}{'调用':>8}{'平均ms':>10}{'p95ms':>10}{'最大ms':>10}")
+    by_latency = sorted(functions.items(), key=lambda item: -item[1]['total_ms'] / max(item[1]['calls'], 1))
+    for name, entry in by_latency[:10]:
+        average = entry['total_ms'] / max(entry['calls'], 1)
+        p95 = _histogram_percentile(entry, buckets, 95)
+        print(f"  {name:<36}{entry['calls']:>8}{average:>10.1f}{'≤' + str(p95) if p95 in buckets else format(p95, '.0f'):>10}{entry['max_ms']:>10.0f}")
+
+    print()
+    print(colorize("最常出错的分段", Colors.BRIGHT_WHITE, bold=True))
+    failing = [(name, entry, sum(entry['errors'].values())) for name, entry in functions.items() if entry['errors']]
+    if not failing:
+        print(colorize("  没有记录到异常", Colors.GREEN))
+    for name, entry, errors in sorted(failing, key=lambda item: -item[2])[:10]:
+        rate = errors / max(entry['calls'], 1) * 100
+        types = ", ".join(f"{error_type}×{count}" for error_type, count in sorted(entry['errors'].items(), key=lambda item: -item[1]))
+        print(f"  {colorize(name, Colors.RED)}  {errors}/{entry['calls']} ({rate:.0f}%)  {types}")
+        if entry.get('last_error'):
+            last_at = datetime.fromtimestamp(entry['last_error_at']).strftime('%m-%d %H:%M')
+            print(colorize(f"      最近一次 {last_at}: {entry['last_error'][:200]}", Colors.DIM))
+
+# 是否运行在常驻守护进程中
+_daemon_mode = False
+
+class RenderState:
+    """单次渲染的状态：Claude Code 传入的 JSON、工作目录，以及渲染内共享的中间结果
+
+    每次渲染新建一个。分段线程启动时绑定所属渲染的状态，超出时间预算后仍在运行的线程
+    只会写入自己那一次（已经结束的）渲染，结果随之丢弃，不会影响守护进程中的下一次请求。
+    """
+    def __init__(self, input_data=None):
+        self.input = input_data
+        self.cwd = os.getcwd()
+        # 配额请求测得的 API 响应时间（毫秒）
+        self.api_response_time = None
+        # 汇总后的项目用量，以及已检查过的 transcript 文件
+        self.project_usage = None
+        self.scanned = set()
+        # 是否为后台补算（不受渲染的时间预算限制）
+        self.background = False
+
+# 最新一次渲染的状态（每次渲染前由 load_claude_input / reset_render_state 替换）
+_render_state = RenderState()
+# 分段线程绑定的渲染状态
+_render_local = threading.local()
+
+def current_render():
+    """当前线程所属渲染的状态：分段线程用启动时绑定的状态，其他线程用最新一次渲染的状态"""
+    return getattr(_render_local, 'state', None) or _render_state
+
+def render_input():
+    """当前渲染中从Claude Code传递的JSON数据，没有时为 None"""
+    return current_render().input
+
+def load_claude_input(stdin_data):
+    """解析从Claude Code传递的JSON数据，开始新的一次渲染"""
+    global _render_state
+    claude_input = None
+    try:
+        stdin_data = (stdin_data or '').strip()
+        if stdin_data:
+            with trace_span('stdin parse', 'startup', bytes=len(stdin_data)):
+                claude_input = json.loads(stdin_data)
+            # 调试：打印收到的完整JSON到文件
+            debug_file = os.path.expanduser('~/.claude/statusline_debug.json')
+            with open(debug_file, 'w', encoding='utf-8') as f:
+                json.dump(claude_input, f, indent=2, ensure_ascii=False)
+    except:
+        pass
+    _render_state = RenderState(claude_input)
 
 # 设置输出编码
 if sys.platform == 'win32':
@@ -93,26 +522,239 @@ def colorize(text, color=None, bg_color=None, bold=False, dim=False):
         return f"\033[{';'.join(codes)}m{text}{Colors.RESET}"
     return text
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# 当前线程正在计算的分段结果是否为失败值或占位值（这类结果照常显示，但不写入分段缓存）
+_segment_state = threading.local()
+
+def mark_segment_transient():
+    """标记当前线程正在计算的分段结果不可缓存（失败、首次导入中等）"""
+    _segment_state.transient = True
+
+def call_segment(func):
+    """执行分段函数，返回 (结果, 是否可缓存)"""
+    _segment_state.transient = False
+    value = func()
+    return value, not _segment_state.transient
 
 # 统一错误处理装饰器
 def safe_execute(default_return=None):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            try:
-                return func(*args, **kwargs)
-            except Exception:
-                return default_return
+            span = trace_span(func.__name__, 'segment')
+            start = time.perf_counter()
+            error_type = error_text = None
+            with span:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    error_type = type(e).__name__
+                    error_text = f"{error_type}: {e}"
+                    span.args['error'] = error_text
+                    mark_segment_transient()
+                    return default_return
+                finally:
+                    record_call(func.__name__, (time.perf_counter() - start) * 1000, error_type, error_text)
         return wrapper
     return decorator
 
+# ================================
+# HTTP 传输层（重量级依赖只在真正发请求时才导入）
+# ================================
+
+# 复用的 requests 会话（守护进程中可以保持连接，避免每次重新握手）
+_http_session = None
+
+# HTTP 条件请求缓存：GET 响应的 ETag/Last-Modified 和响应体，未变化时服务器返回 304 直接复用
+HTTP_CACHE_FILE = os.path.expanduser('~/.claude/.status_http_cache.json')
+# 最多缓存多少个 URL
+HTTP_CACHE_MAX_ENTRIES = 20
+
+# 标准库传输的空闲连接池：(scheme, host, port) -> [连接]，守护进程中跨渲染复用 TCP/TLS 连接
+_http_pool = {}
+_http_pool_lock = threading.Lock()
+# 条件请求缓存（本进程内只加载一次）
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+class HttpError(Exception):
+    """HTTP 响应状态码不是 2xx"""
+
+class HttpResponse:
+    """HTTP 响应（兼容 requests.Response 的常用接口）"""
+    def __init__(self, status_code, content, headers=None, not_modified=False):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}      # 小写的响应头名 -> 值
+        self.not_modified = not_modified  # 服务器返回 304，content 来自本地缓存
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+    def raise_for_status(self):
+        if not 200 <= self.status_code < 300:
+            raise HttpError(f"HTTP {self.status_code}")
+
+def get_http_session():
+    """获取共享的 requests 会话（首次调用时才导入 requests/urllib3）"""
+    global _http_session
+    if _http_session is None:
+        import requests
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        _http_session = requests.Session()
+    return _http_session
+
+def get_http_cache():
+    """获取条件请求缓存：{缓存键: {'etag', 'last_modified', 'content'}}"""
+    global _http_cache
+    if _http_cache is None:
+        cache = load_json_file(HTTP_CACHE_FILE, {})
+        _http_cache = cache if isinstance(cache, dict) else {}
+    return _http_cache
+
+def http_cache_key(url, headers):
+    """条件请求缓存键：URL 加凭据摘要（同一 URL 换了 API Key 时不会复用旧响应）"""
+    credentials = ''.join(str(value) for name, value in headers.items() if name.lower() in ('authorization', 'cookie'))
+    return f"{url} {zlib.crc32(credentials.encode('utf-8')):08x}"
+
+def store_http_cache(key, response_headers, content):
+    """保存带 ETag/Last-Modified 的 GET 响应，响应体不是 UTF-8 文本时不缓存"""
+    etag = response_headers.get('etag')
+    last_modified = response_headers.get('last-modified')
+    with _http_cache_lock:
+        cache = get_http_cache()
+        if not etag and not last_modified:
+            if cache.pop(key, None) is not None:
+                save_json_file(HTTP_CACHE_FILE, cache)
+            return
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            return
+        cache.pop(key, None)
+        cache[key] = {'etag': etag, 'last_modified': last_modified, 'content': text}
+        while len(cache) > HTTP_CACHE_MAX_ENTRIES:
+            del cache[next(iter(cache))]
+        save_json_file(HTTP_CACHE_FILE, cache)
+
+def http_request(method, url, headers=None, json=None, timeout=5):
+    """发送 HTTP 请求，按 HTTP_TRANSPORT 选择标准库 http.client 或 requests
+
+    两种传输都复用连接并接受 gzip；GET 请求带上次响应的 ETag/Last-Modified，
+    服务器返回 304 时用缓存的响应体构造 200 响应（not_modified=True）。
+    """
+    headers = dict(headers or {})
+    cache_key = cached = None
+    if method == 'GET':
+        cache_key = http_cache_key(url, headers)
+        with _http_cache_lock:
+            cached = get_http_cache().get(cache_key)
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+    if HTTP_TRANSPORT == 'requests':
+        span = trace_span(f"{method} {url.split('?')[0]}", 'http', transport='requests')
+        with span:
+            response = get_http_session().request(method, url, headers=headers, json=json, timeout=timeout)
+            status, content = response.status_code, response.content
+            response_headers = {name.lower(): value for name, value in response.headers.items()}
+            span.args['status'] = status
+            span.args['bytes'] = len(content)
+    else:
+        status, content, response_headers = stdlib_request(method, url, headers, json, timeout)
+
+    if status == 304 and cached:
+        return HttpResponse(200, cached['content'].encode('utf-8'), response_headers, not_modified=True)
+    if cache_key and status == 200:
+        store_http_cache(cache_key, response_headers, content)
+    return HttpResponse(status, content, response_headers)
+
+def take_http_connection(key, timeout):
+    """从连接池取一个空闲连接，没有时新建，返回 (连接, 是否复用)"""
+    import http.client
+    with _http_pool_lock:
+        idle = _http_pool.get(key)
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+    scheme, host, port = key
+    if scheme == 'https':
+        return http.client.HTTPSConnection(host, port, timeout=timeout), False
+    return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+def stdlib_request(method, url, headers, json, timeout):
+    """用 http.client 发送请求（连接池 + gzip），返回 (状态码, 响应体, 小写响应头)
+
+    复用的连接可能已被服务器关闭，此时丢弃它换一个连接重试；只重试 GET/HEAD，
+    POST 等请求无法判断服务器是否已经处理过，直接抛出异常。
+    """
+    from urllib.parse import urlsplit
+    import json as json_module
+
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    body = None
+    if json is not None:
+        body = json_module.dumps(json).encode('utf-8')
+        if not any(name.lower() == 'content-type' for name in headers):
+            headers['Content-Type'] = 'application/json'
+    if not any(name.lower() == 'accept-encoding' for name in headers):
+        headers['Accept-Encoding'] = 'gzip'
+
+    span = trace_span(f"{method} {parts.hostname}{parts.path}", 'http', transport='stdlib')
+    with span:
+        while True:
+            conn, reused = take_http_connection(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+                break
+            except ConnectionError:
+                # 包括 http.client.RemoteDisconnected：空闲连接已被服务器关闭
+                conn.close()
+                if not reused or method not in ('GET', 'HEAD'):
+                    raise
+            except:
+                conn.close()
+                raise
+
+        span.args['status'] = response.status
+        span.args['bytes'] = len(content)
+        span.args['reused'] = reused
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        if response.will_close:
+            conn.close()
+        else:
+            with _http_pool_lock:
+                _http_pool.setdefault(key, []).append(conn)
+
+    if response_headers.get('content-encoding', '').lower() == 'gzip':
+        content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    return response.status, content, response_headers
+
+def http_get(url, headers=None, timeout=5):
+    """发送 GET 请求"""
+    return http_request('GET', url, headers=headers, timeout=timeout)
+
+def http_post(url, headers=None, json=None, timeout=5):
+    """发送 POST 请求"""
+    return http_request('POST', url, headers=headers, json=json, timeout=timeout)
 
 @safe_execute(None)
 def login_xiaoai():
     """登录 XiaoAi 获取 Bearer Token"""
     try:
-        response = requests.post(
+        response = http_post(
             'https://xiaoai.ve-rel.com/api/user/login',
             headers={
                 'accept': 'application/json, text/plain, */*',
@@ -161,8 +803,8 @@ def get_cached_token():
 def get_claude_api_stats():
     """获取Claude API统计信息 - 使用新的Cubence API"""
     try:
-        response = requests.get(
-            'https://cubence.com/api/v1/user/subscription-info',
+        response = http_get(
+            f'{CUBENCE_API_BASE}/api/v1/user/subscription-info',
             headers={
                 'Accept': '*/*',
                 'Authorization': CUBENCE_API_KEY,
@@ -214,6 +856,7 @@ def get_claude_api_stats():
 def format_total_cost_display(api_data):
     """格式化订阅配额显示 - 适配Cubence API"""
     if not api_data:
+        mark_segment_transient()
         return colorize("获取失败", Colors.RED)
 
     five_hour = api_data.get('five_hour', {})
@@ -231,14 +874,8 @@ def format_total_cost_display(api_data):
     week_used = weekly.get('used', 0)
     week_reset = weekly.get('reset_at', 0)
 
-    # 计算重置时间
-    def format_reset_time(reset_timestamp):
-        if reset_timestamp <= 0:
-            return ""
-        now = time.time()
-        diff = reset_timestamp - now
-        if diff <= 0:
-            return "已重置"
+    # 格式化时长：5d12h / 3h45m / 20m
+    def format_duration(diff):
         days = int(diff // 86400)
         hours = int((diff % 86400) // 3600)
         minutes = int((diff % 3600) // 60)
@@ -249,59 +886,61 @@ def format_total_cost_display(api_data):
         else:
             return f"{minutes}m"
 
+    # 计算重置时间
+    def format_reset_time(reset_timestamp):
+        if reset_timestamp <= 0:
+            return ""
+        diff = reset_timestamp - time.time()
+        if diff <= 0:
+            return "已重置"
+        return format_duration(diff)
+
+    # 消耗速度和用完时间（来自本地配额历史）：+12%/h→100% 1h10m
+    # 只有按当前速度会在重置前用完时才显示用完时间
+    burn = api_data.get('burn') or {}
+    def format_burn(window, reset_timestamp, per_day=False):
+        estimate = burn.get(window)
+        if not estimate or estimate[0] <= 0:
+            return ""
+        rate, exhaust_at = estimate
+        rate_str = f"+{rate * 2400:.0f}%/d" if per_day else f"+{rate * 100:.0f}%/h"
+        result = " " + colorize(rate_str, Colors.DIM)
+        if exhaust_at is not None and (reset_timestamp <= 0 or exhaust_at < reset_timestamp):
+            # 用完时间按最新样本估算，显示时换算成距离现在的时长
+            result += colorize(f"→100% {format_duration(max(exhaust_at - time.time(), 0))}", Colors.RED)
+        return result
+
     # 生成进度条函数 - 每格5种状态：全绿→半绿→全黄→半红→全红
-    def make_progress_bar(usage_ratio, bar_length=10):
-        result = []
+    # 所有组合在编译布局时已预先着色，这里只查表
+    def make_progress_bar(usage_ratio):
+        plan = get_render_plan()
+        bars = plan['bars']
+        bar_length = len(bars) - 1
         precise_ratio = usage_ratio * bar_length
-        full_blocks = int(precise_ratio)  # 完全填满的格子数
+        full_blocks = max(int(precise_ratio), 0)  # 完全填满的格子数
         partial = precise_ratio - full_blocks  # 当前格子的填充比例(0-1)
-        
-        # 已填满的格子都是全红（表示该格已完全用完）
-        for i in range(full_blocks):
-            result.append(colorize('█', Colors.RED))
-        
-        # 当前正在填充的格子，5种状态
-        if full_blocks < bar_length and partial > 0:
-            if partial < 0.2:
-                # 0-20%: 全绿
-                result.append(colorize('█', Colors.GREEN))
-            elif partial < 0.4:
-                # 20-40%: 半绿
-                result.append(colorize('▓', Colors.GREEN))
-            elif partial < 0.6:
-                # 40-60%: 全黄
-                result.append(colorize('█', Colors.YELLOW))
-            elif partial < 0.8:
-                # 60-80%: 半红
-                result.append(colorize('▓', Colors.RED))
-            else:
-                # 80-100%: 全红
-                result.append(colorize('█', Colors.RED))
-            empty_start = full_blocks + 1
-        else:
-            empty_start = full_blocks
-        
-        # 未使用的格子是全绿（表示还可用）
-        for i in range(empty_start, bar_length):
-            result.append(colorize('█', Colors.GREEN))
-        
-        return ''.join(result)
+        if full_blocks >= bar_length:
+            # 已用完（超出的部分继续画全红格）
+            return bars[bar_length][0] + plan['bar_cells'][-1] * (full_blocks - bar_length)
+        state = 1 + bisect_right(PROGRESS_BAR_STEPS, partial) if partial > 0 else 0
+        return bars[full_blocks][state]
 
     # === 五小时窗口 ===
     five_usage_ratio = five_used / five_limit if five_limit > 0 else 0
     five_reset_str = format_reset_time(five_reset)
 
-    if five_usage_ratio >= 0.8:
+    quota_warn, quota_danger = layout_thresholds('quota')
+    if five_usage_ratio >= quota_danger:
         five_icon = "🚨"
         five_perc_color = Colors.RED
-    elif five_usage_ratio >= 0.4:
+    elif five_usage_ratio >= quota_warn:
         five_icon = "💸"
         five_perc_color = Colors.YELLOW
     else:
         five_icon = "💰"
         five_perc_color = Colors.WHITE
 
-    five_bar = make_progress_bar(five_usage_ratio, 10)
+    five_bar = make_progress_bar(five_usage_ratio)
     five_percentage = colorize(f"{five_usage_ratio * 100:.1f}%", five_perc_color)
     five_reset_part = colorize("(", Colors.DIM) + colorize(five_reset_str, Colors.YELLOW) + colorize("↻", Colors.BRIGHT_YELLOW) + colorize(")", Colors.DIM) if five_reset_str else ""
 
@@ -310,21 +949,22 @@ def format_total_cost_display(api_data):
         colorize("5h:", Colors.BRIGHT_CYAN) +
         five_bar +
         five_percentage +
-        five_reset_part
+        five_reset_part +
+        format_burn('five_hour', five_reset)
     )
 
     # === 周窗口 ===
     week_usage_ratio = week_used / week_limit if week_limit > 0 else 0
     week_reset_str = format_reset_time(week_reset)
 
-    if week_usage_ratio >= 0.8:
+    if week_usage_ratio >= quota_danger:
         week_perc_color = Colors.RED
-    elif week_usage_ratio >= 0.4:
+    elif week_usage_ratio >= quota_warn:
         week_perc_color = Colors.YELLOW
     else:
         week_perc_color = Colors.WHITE
 
-    week_bar = make_progress_bar(week_usage_ratio, 10)
+    week_bar = make_progress_bar(week_usage_ratio)
     week_percentage = colorize(f"{week_usage_ratio * 100:.1f}%", week_perc_color)
     week_reset_part = colorize("(", Colors.DIM) + colorize(week_reset_str, Colors.YELLOW) + colorize("↻", Colors.BRIGHT_YELLOW) + colorize(")", Colors.DIM) if week_reset_str else ""
 
@@ -332,14 +972,24 @@ def format_total_cost_display(api_data):
         colorize("周:", Colors.BRIGHT_MAGENTA) +
         week_bar +
         week_percentage +
-        week_reset_part
+        week_reset_part +
+        format_burn('weekly', week_reset, per_day=True)
     )
 
-    return five_part + " " + week_part
+    # === 数据新鲜度（来自缓存时显示数据年龄） ===
+    age_part = ""
+    age = api_data.get('age', 0)
+    if age >= 60:
+        minutes = int(age // 60)
+        age_str = f"{minutes // 60}h{minutes % 60}m" if minutes >= 60 else f"{minutes}m"
+        age_part = " " + colorize(f"({age_str}前)", Colors.DIM)
+
+    return five_part + " " + week_part + age_part
 
 @safe_execute('🤖unknown')
 def get_model_info():
     """获取模型信息"""
+    claude_input = render_input()
     model = ''
 
     # 优先使用从Claude Code传递的当前会话模型信息
@@ -369,126 +1019,673 @@ def get_model_info():
     # 显示图标和模型名称
     return colorize(icon, Colors.BLUE) + colorize(model, Colors.BRIGHT_MAGENTA, bold=True)
 
-@safe_execute("📂no-git")
-def get_git_info():
-    """获取Git分支、修改文件数、今日代码行数、落后最新分支"""
+# ================================
+# Git 状态：一次 porcelain v2 调用 + 按 HEAD/index/refs 变化失效的缓存
+# ================================
+
+# 每个仓库最近一次解析出的 git 状态
+GIT_CACHE_FILE = os.path.expanduser('~/.claude/.status_git_cache.json')
+# 可选的兜底 TTL（秒）：缓存只按 HEAD/index/引用失效，只编辑工作区文件不会改变 .git，
+# 设为数字后缓存最多复用这么久再重新执行 git status；None 表示不启用
+GIT_STATUS_CACHE_TTL = None
+# 最多保留多少个仓库的缓存
+GIT_CACHE_MAX_REPOS = 50
+# 渲染中 git status 的超时（秒），git 分段的时间预算在此基础上留出余量；
+# 超时后本次只显示分支，完整状态交给后台补算（后台补算时用更长的超时）
+GIT_STATUS_TIMEOUT = 0.8
+GIT_BACKGROUND_STATUS_TIMEOUT = 30
+# 落后最新分支：git fetch 在后台执行，同一仓库两次 fetch 的最短间隔（秒）
+GIT_FETCH_INTERVAL = 300
+# 后台 fetch 锁（同一时间只 fetch 一个仓库），超过该时长视为残留（秒），也是 fetch 的超时
+GIT_FETCH_LOCK = os.path.expanduser('~/.claude/.status_git_fetch.lock')
+GIT_FETCH_TIMEOUT = 60
+
+def _git_span_name(args):
+    """追踪事件名：git 子命令（跳过 -c 配置参数）"""
+    i = 0
+    while i < len(args) and args[i] == '-c':
+        i += 2
+    return 'git ' + (args[i] if i < len(args) else '')
+
+def run_git(args, cwd, timeout=2):
+    """在指定目录执行 git 命令并返回输出"""
+    with trace_span(_git_span_name(args), 'subprocess', argv=args):
+        return subprocess.check_output(
+            ['git'] + args,
+            cwd=cwd, stderr=subprocess.DEVNULL, timeout=timeout, encoding='utf-8'
+        )
+
+def run_git_capped(args, cwd, cap, timeout=2):
+    """流式执行 git status，数到 cap 个条目后提前结束进程
+
+    返回 (输出, 是否达到上限)；超时抛出 subprocess.TimeoutExpired。
+    """
+    with trace_span(_git_span_name(args), 'subprocess', argv=args, cap=cap) as span:
+        output, capped = _run_git_capped(args, cwd, cap, timeout)
+        span.args['capped'] = capped
+        return output, capped
+
+def _run_git_capped(args, cwd, cap, timeout):
+    proc = subprocess.Popen(
+        ['git'] + args,
+        cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding='utf-8'
+    )
+    timed_out = []
+
+    def kill_on_timeout():
+        timed_out.append(True)
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    lines = []
+    entries = 0
+    capped = False
     try:
-        branch = subprocess.check_output(
-            ['git', 'branch', '--show-current'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        status_output = subprocess.check_output(
-            ['git', 'status', '--porcelain'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        modified_count = len([line for line in status_output.split('\n') if line.strip()])
-
-        # === 基础部分：分支 + 修改文件数 ===
-        if modified_count > 0:
-            if modified_count > 10:
-                count_color = Colors.RED
-            elif modified_count > 5:
-                count_color = Colors.YELLOW
-            else:
-                count_color = Colors.BRIGHT_YELLOW
+        for line in proc.stdout:
+            lines.append(line)
+            if not line.startswith('#'):
+                entries += 1
+                if entries > cap:
+                    capped = True
+                    break
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+    if timed_out:
+        raise subprocess.TimeoutExpired(args, timeout)
+    if not capped and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    return ''.join(lines), capped
+
+def is_large_repo(repo):
+    """是否按大仓库模式处理：显式配置优先，否则按 index 大小判断"""
+    if GIT_LARGE_REPO_MODE is not None:
+        return bool(GIT_LARGE_REPO_MODE)
+    try:
+        return os.path.getsize(os.path.join(repo[1], 'index')) >= GIT_LARGE_REPO_INDEX_BYTES
+    except OSError:
+        return False
+
+def git_supports_fsmonitor(root, previous):
+    """内置 fsmonitor 守护进程只支持 Windows/macOS 且需要 Git 2.36+，版本检查结果随仓库状态缓存"""
+    if sys.platform not in ('win32', 'darwin'):
+        return False
+    if 'fsmonitor_ok' in previous:
+        return previous['fsmonitor_ok']
+    try:
+        version = run_git(['--version'], root).split()[2]
+        major, minor = (int(part) for part in version.split('.')[:2])
+        return (major, minor) >= (2, 36)
+    except Exception:
+        return False
+
+def locate_git_dir(start=None):
+    """从当前目录向上查找仓库，返回 (工作区根目录, .git 目录, 公共 .git 目录)，不在仓库中返回 None
+
+    链接的工作区（git worktree）的 .git 目录位于主仓库的 .git/worktrees/<名称>，
+    其中的 commondir 文件指向存放引用和对象的公共目录。
+    """
+    path = os.path.abspath(start or current_render().cwd)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        git_dir = None
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+        elif os.path.isfile(dot_git):
+            # 链接的工作区或子模块：.git 是一个写着 "gitdir: <路径>" 的文件
+            try:
+                content = read_git_file(dot_git)
+                if content.startswith('gitdir:'):
+                    git_dir = os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+            except OSError:
+                pass
+        if git_dir:
+            common_dir = git_dir
+            try:
+                common_dir = os.path.normpath(os.path.join(git_dir, read_git_file(os.path.join(git_dir, 'commondir'))))
+            except OSError:
+                pass
+            return path, git_dir, common_dir
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
 
-            base_part = (
-                colorize("🌿", Colors.GREEN) +
-                colorize(branch, Colors.BRIGHT_GREEN, bold=True) +
-                colorize(f"({modified_count})", count_color, bold=True)
-            )
-        else:
-            base_part = colorize("🌿", Colors.GREEN) + colorize(branch, Colors.BRIGHT_GREEN, bold=True)
+# ================================
+# 纯 Python 的 .git 读取（分支、HEAD、引用），避免为简单查询启动 git 进程
+# ================================
 
-        # === 今日代码行数 ===
-        code_part = ""
+# 进程内缓存的 packed-refs：路径 -> (mtime, {引用名: SHA})
+_packed_refs_cache = {}
+
+def read_git_file(file_path):
+    """读取 .git 下的小文本文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def _is_sha(value):
+    return len(value) in (40, 64) and all(c in '0123456789abcdef' for c in value)
+
+def uses_reftable(repo):
+    """仓库是否使用 reftable 引用格式（无法直接读取，需要回退到 git 命令）"""
+    return os.path.isdir(os.path.join(repo[2], 'reftable'))
+
+def read_packed_refs(common_dir):
+    """读取 packed-refs，返回 {引用名: SHA}"""
+    file_path = os.path.join(common_dir, 'packed-refs')
+    mtime = _mtime(file_path)
+    if not mtime:
+        return {}
+    cached = _packed_refs_cache.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    refs = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            # 跳过头部注释和附注标签的 peeled 行
+            if not line or line[0] in '#^':
+                continue
+            sha, _, name = line.partition(' ')
+            refs[name] = sha
+    _packed_refs_cache[file_path] = (mtime, refs)
+    return refs
+
+def _is_per_worktree_ref(name):
+    return name == 'HEAD' or name.startswith(('refs/bisect/', 'refs/worktree/', 'refs/rewritten/'))
+
+def read_ref(repo, name, depth=0):
+    """把引用解析为 SHA（支持符号引用），找不到时返回 None"""
+    _, git_dir, common_dir = repo
+    if depth > 5:
+        return None
+    base = git_dir if _is_per_worktree_ref(name) else common_dir
+    try:
+        content = read_git_file(os.path.join(base, *name.split('/')))
+    except OSError:
+        return read_packed_refs(common_dir).get(name)
+    if content.startswith('ref:'):
+        return read_ref(repo, content[len('ref:'):].strip(), depth + 1)
+    return content if _is_sha(content) else None
+
+def read_head(repo):
+    """读取 HEAD，返回 (分支名, 提交 SHA)；分离头指针时分支名为空，空仓库时 SHA 为 None"""
+    if uses_reftable(repo):
+        root = repo[0]
+        branch = run_git(['branch', '--show-current'], root).strip()
         try:
-            # 今日的 git log 统计
-            today_stats = subprocess.check_output(
-                ['git', 'log', '--since=00:00', '--pretty=format:', '--numstat'],
-                stderr=subprocess.DEVNULL, timeout=5, encoding='utf-8'
-            ).strip()
-
-            # 当前未提交的变更
-            unstaged_stats = subprocess.check_output(
-                ['git', 'diff', '--numstat'],
-                stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-            ).strip()
-
-            staged_stats = subprocess.check_output(
-                ['git', 'diff', '--cached', '--numstat'],
-                stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-            ).strip()
-
-            added = 0
-            deleted = 0
-
-            for stats in [today_stats, unstaged_stats, staged_stats]:
-                if not stats:
-                    continue
-                for line in stats.split('\n'):
-                    if not line.strip():
-                        continue
-                    parts = line.split('\t')
-                    if len(parts) >= 2:
-                        try:
-                            a = int(parts[0]) if parts[0] != '-' else 0
-                            d = int(parts[1]) if parts[1] != '-' else 0
-                            added += a
-                            deleted += d
-                        except:
-                            continue
-
-            if added > 0 or deleted > 0:
-                code_part = (
-                    " " +
-                    colorize(f"+{added}", Colors.GREEN, bold=True) +
-                    colorize(f"-{deleted}", Colors.RED, bold=True)
-                )
-        except:
-            pass
+            sha = run_git(['rev-parse', '--verify', '-q', 'HEAD'], root).strip() or None
+        except subprocess.CalledProcessError:
+            sha = None
+        return branch, sha
+
+    content = read_git_file(os.path.join(repo[1], 'HEAD'))
+    if content.startswith('ref:'):
+        ref = content[len('ref:'):].strip()
+        branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+        return branch, read_ref(repo, ref)
+    return '', content if _is_sha(content) else None
+
+def list_refs(repo, prefix):
+    """列出某个前缀下的引用 {引用名: SHA}，松散引用覆盖 packed-refs，跳过符号引用（如 origin/HEAD）"""
+    root, _, common_dir = repo
+    if uses_reftable(repo):
+        refs = {}
+        output = run_git(['for-each-ref', '--format=%(refname) %(objectname) %(symref)', prefix], root)
+        for line in output.split('\n'):
+            parts = line.split()
+            if len(parts) == 2:
+                refs[parts[0]] = parts[1]
+        return refs
+
+    refs = {name: sha for name, sha in read_packed_refs(common_dir).items() if name.startswith(prefix)}
+    base = os.path.join(common_dir, *prefix.rstrip('/').split('/'))
+    for dir_path, _, file_names in os.walk(base):
+        for file_name in file_names:
+            if file_name.endswith('.lock'):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            name = os.path.relpath(file_path, common_dir).replace(os.sep, '/')
+            try:
+                content = read_git_file(file_path)
+            except OSError:
+                continue
+            if content.startswith('ref:'):
+                refs.pop(name, None)
+            elif _is_sha(content):
+                refs[name] = content
+    return refs
+
+def read_loose_commit_time(common_dir, sha):
+    """从松散对象中读取提交时间，对象不存在（已打包）时返回 None"""
+    try:
+        with open(os.path.join(common_dir, 'objects', sha[:2], sha[2:]), 'rb') as f:
+            data = zlib.decompress(f.read())
+    except (OSError, zlib.error):
+        return None
+    header, _, body = data.partition(b'\0')
+    if not header.startswith(b'commit '):
+        return None
+    for line in body.split(b'\n'):
+        if not line:
+            break
+        if line.startswith(b'committer '):
+            return int(line.rsplit(b' ', 2)[1])
+    return None
 
-        # === 落后最新分支 ===
-        behind_part = ""
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+# 守护进程中已算出的仓库指纹：.git 目录 -> (监听版本, 指纹)
+_watched_git_keys = {}
+
+def git_watch_versions(repo):
+    """.git、公共 .git 目录和 refs（含子目录）的监听版本，无法监听时返回 None"""
+    _, git_dir, common_dir = repo
+    versions = [watch_version(git_dir), watch_version(os.path.join(common_dir, 'refs'), recursive=True)]
+    if common_dir != git_dir:
+        versions.append(watch_version(common_dir))
+    reftable = os.path.join(common_dir, 'reftable')
+    if os.path.isdir(reftable):
+        versions.append(watch_version(reftable))
+    return None if None in versions else versions
+
+def git_cache_key(repo):
+    """仓库状态指纹：HEAD、index、packed-refs 以及 refs 下各目录的修改时间
+
+    git 更新引用时先写 .lock 再 rename，因此引用所在目录的 mtime 一定会变化。
+    守护进程中 .git 没有任何变化时直接沿用上次的指纹，不再遍历 refs。
+    """
+    _, git_dir, common_dir = repo
+    versions = git_watch_versions(repo)
+    watched = _watched_git_keys.get(git_dir)
+    if versions is not None and watched and watched[0] == versions:
+        return watched[1][:-1] + [datetime.now().strftime('%Y-%m-%d')]
+
+    refs_mtimes = []
+    for dir_path, _, _ in os.walk(os.path.join(common_dir, 'refs')):
+        refs_mtimes.append(_mtime(dir_path))
+    refs_mtimes.append(_mtime(os.path.join(common_dir, 'reftable')))
+    key = [
+        _mtime(os.path.join(git_dir, 'HEAD')),
+        _mtime(os.path.join(git_dir, 'index')),
+        _mtime(os.path.join(common_dir, 'packed-refs')),
+        max(refs_mtimes) if refs_mtimes else 0,
+        len(refs_mtimes),
+        datetime.now().strftime('%Y-%m-%d')  # 今日代码行数按天统计
+    ]
+    if versions is not None:
+        _watched_git_keys[git_dir] = (versions, key)
+    return key
+
+def parse_porcelain_v2(output):
+    """解析 git status --porcelain=v2 --branch 的输出
+
+    dirty_paths 为有变更的已跟踪文件（不含未跟踪文件），用于判断工作区 numstat 是否需要重算。
+    """
+    state = {'branch': '', 'oid': '', 'upstream': '', 'ahead': 0, 'behind': 0, 'modified_count': 0,
+             'dirty_paths': []}
+    for line in output.split('\n'):
+        if line.startswith('# branch.oid '):
+            state['oid'] = line[len('# branch.oid '):].strip()
+        elif line.startswith('# branch.head '):
+            head = line[len('# branch.head '):].strip()
+            # 与 git branch --show-current 一致：分离头指针时分支名为空
+            state['branch'] = '' if head == '(detached)' else head
+        elif line.startswith('# branch.upstream '):
+            state['upstream'] = line[len('# branch.upstream '):].strip()
+        elif line.startswith('# branch.ab '):
+            ahead, behind = line[len('# branch.ab '):].split()
+            state['ahead'] = int(ahead)
+            state['behind'] = -int(behind)
+        elif line[:2] in ('1 ', '2 ', 'u ', '? '):
+            # 普通变更、重命名、冲突、未跟踪文件各算一个
+            state['modified_count'] += 1
+            if line[0] == '1':
+                state['dirty_paths'].append(line.split(' ', 8)[-1])
+            elif line[0] == '2':
+                state['dirty_paths'].append(line.split(' ', 9)[-1].split('\t')[0])
+            elif line[0] == 'u':
+                state['dirty_paths'].append(line.split(' ', 10)[-1])
+    return state
+
+def parse_numstat(outputs):
+    """累加若干段 --numstat 输出的新增/删除行数"""
+    added = 0
+    deleted = 0
+    for stats in outputs:
+        if not stats:
+            continue
+        for line in stats.split('\n'):
+            if not line.strip():
+                continue
+            parts = line.split('\t')
+            if len(parts) >= 2:
+                try:
+                    a = int(parts[0]) if parts[0] != '-' else 0
+                    d = int(parts[1]) if parts[1] != '-' else 0
+                    added += a
+                    deleted += d
+                except:
+                    continue
+    return added, deleted
+
+# 批量读取提交 numstat 时每次最多传入的 SHA 数
+GIT_NUMSTAT_BATCH = 200
+
+def compute_today_numstat(repo, head_sha, previous=None):
+    """统计今日提交的新增/删除行数
+
+    今日提交列表按 (日期, HEAD) 缓存；每个提交的 numstat 按 SHA 缓存（提交内容不会变），
+    只有新出现的提交才需要 git 重新计算差异。返回要合并进状态的字段。
+    """
+    previous = previous or {}
+    root = repo[0]
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    today_commits = previous.get('today_commits') or {}
+    if today_commits.get('day') == today and today_commits.get('head') == head_sha:
+        shas = today_commits['shas']
+    elif head_sha:
+        shas = run_git(['log', '--since=00:00', '--format=%H'], root, timeout=5).split()
+    else:
+        shas = []
+
+    known = previous.get('commit_numstat') or {}
+    commit_numstat = {sha: known[sha] for sha in shas if sha in known}
+    missing = [sha for sha in shas if sha not in commit_numstat]
+    for start in range(0, len(missing), GIT_NUMSTAT_BATCH):
+        batch = missing[start:start + GIT_NUMSTAT_BATCH]
+        # 与 git log --numstat 一致：合并提交默认不输出差异
+        output = run_git(['log', '--no-walk=unsorted', '--numstat', '--format=%x00%H'] + batch, root, timeout=5)
+        for block in output.split('\0')[1:]:
+            sha, _, stats = block.partition('\n')
+            commit_numstat[sha.strip()] = list(parse_numstat([stats]))
+        for sha in batch:
+            commit_numstat.setdefault(sha, [0, 0])
+
+    return {
+        'today_commits': {'day': today, 'head': head_sha, 'shas': shas},
+        'commit_numstat': commit_numstat
+    }
+
+def worktree_fingerprint(repo, dirty_paths):
+    """工作区指纹：index 的修改时间 + 各个有变更的已跟踪文件的修改时间和大小
+
+    编辑一个原本干净的文件会让它出现在 dirty_paths 里，再次编辑已变更的文件会改变其 mtime，
+    两种情况指纹都会变化。
+    """
+    root, git_dir, _ = repo
+    entries = [_mtime(os.path.join(git_dir, 'index'))]
+    for path in dirty_paths:
         try:
-            # 获取所有远程分支，按最新提交时间排序
-            result = subprocess.check_output(
-                ['git', 'for-each-ref', '--sort=-committerdate', 'refs/remotes/origin/', '--format=%(refname:short)'],
-                stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-            ).strip()
-
-            if result:
-                branches = result.split('\n')
-                if branches:
-                    latest_branch = branches[0]
-                    # 如果最新分支不是当前分支的远程
-                    if latest_branch != f"origin/{branch}":
-                        behind_count = subprocess.check_output(
-                            ['git', 'rev-list', '--count', f'HEAD..{latest_branch}'],
-                            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-                        ).strip()
-                        behind = int(behind_count)
-                        if behind > 0:
-                            if behind >= 10:
-                                behind_color = Colors.RED
-                            elif behind >= 5:
-                                behind_color = Colors.YELLOW
-                            else:
-                                behind_color = Colors.BRIGHT_CYAN
-                            behind_part = " " + colorize("↓", behind_color) + colorize(str(behind), behind_color, bold=True)
-        except:
-            pass
+            st = os.stat(os.path.join(root, path))
+            entries.append([path, st.st_mtime, st.st_size])
+        except OSError:
+            entries.append([path, 0, 0])
+    return zlib.crc32(json.dumps(entries).encode('utf-8'))
+
+def compute_behind_latest(repo, branch, head_sha, previous=None):
+    """计算当前分支落后最新远程分支多少个提交
+
+    远程分支和 HEAD 直接从 .git 读取；提交时间按 SHA 缓存（同一提交的时间不会变），
+    只有遇到新的 SHA 才启动 git 读取对象；落后数按 "HEAD..最新分支" 的 SHA 对缓存。
+    previous: 上次的状态，提供 commit_times / behind_counts 缓存。
+    返回要合并进状态的字段。
+    """
+    previous = previous or {}
+    result = {
+        'latest_branch': '',
+        'behind_latest': 0,
+        'commit_times': {},
+        'behind_counts': previous.get('behind_counts', {})
+    }
+
+    remote_refs = list_refs(repo, 'refs/remotes/origin/')
+    if not remote_refs or not head_sha:
+        return result
+
+    # 提交时间：先查缓存，再读松散对象，剩下的（已打包）一次性交给 git
+    known_times = previous.get('commit_times', {})
+    commit_times = {}
+    missing = []
+    for sha in set(remote_refs.values()):
+        if sha in known_times:
+            commit_times[sha] = known_times[sha]
+        else:
+            commit_time = read_loose_commit_time(repo[2], sha)
+            if commit_time is None:
+                missing.append(sha)
+            else:
+                commit_times[sha] = commit_time
+    if missing:
+        output = run_git(['log', '--no-walk=unsorted', '--format=%H %ct'] + missing, repo[0])
+        for line in output.split('\n'):
+            parts = line.split()
+            if len(parts) == 2:
+                commit_times[parts[0]] = int(parts[1])
+    result['commit_times'] = commit_times
+
+    # 与 for-each-ref --sort=-committerdate 一致：时间相同时按引用名排序
+    latest_ref = min(remote_refs, key=lambda name: (-commit_times.get(remote_refs[name], 0), name))
+    latest_branch = latest_ref[len('refs/remotes/'):]
+    result['latest_branch'] = latest_branch
+
+    # 如果最新分支就是当前分支的远程，不计算
+    if latest_branch == f"origin/{branch}":
+        return result
+
+    # 计算落后数需要遍历提交图，只能交给 git，但同一对 SHA 的结果不会变
+    pair = f"{head_sha}..{remote_refs[latest_ref]}"
+    behind_counts = result['behind_counts']
+    if pair not in behind_counts:
+        behind_counts = {pair: int(run_git(['rev-list', '--count', pair], repo[0]).strip())}
+        result['behind_counts'] = behind_counts
+    result['behind_latest'] = behind_counts[pair]
+    return result
+
+def get_git_state(repo=None):
+    """获取仓库状态（分支、上游领先/落后、变更文件数、今日代码行数、落后最新分支）
+
+    仓库指纹未变化时不启动任何 git 进程（设置了 GIT_STATUS_CACHE_TTL 时还要求缓存未超过该时长）。
+    """
+    repo = repo or locate_git_dir()
+    if not repo:
+        return None
+    root = repo[0]
+
+    cache = load_json_file(GIT_CACHE_FILE, {})
+    if not isinstance(cache, dict):
+        cache = {}
+    entry = cache.get(root)
+    key = git_cache_key(repo)
+    now = time.time()
+    if (entry and entry.get('key') == key
+            and (GIT_STATUS_CACHE_TTL is None or now - entry.get('checked_at', 0) < GIT_STATUS_CACHE_TTL)):
+        return entry
+
+    previous = entry or {}
+    # 分支名和 HEAD 直接从 .git 读取，git status 超时时仍能显示分支
+    try:
+        branch, head_sha = read_head(repo)
+    except Exception:
+        branch, head_sha = None, None
+    background = current_render().background
+    status_timeout = GIT_BACKGROUND_STATUS_TIMEOUT if background else GIT_STATUS_TIMEOUT
+
+    # 大仓库：启用 fsmonitor/untracked-cache，变更文件数到上限即停止
+    large = is_large_repo(repo)
+    config_args = []
+    status_args = ['status', '--porcelain=v2', '--branch']
+    if large:
+        config_args = ['-c', 'core.untrackedCache=true']
+        fsmonitor_ok = git_supports_fsmonitor(root, previous)
+        if fsmonitor_ok:
+            config_args += ['-c', 'core.fsmonitor=true']
+        if GIT_LARGE_REPO_SKIP_UNTRACKED:
+            status_args.append('--untracked-files=no')
+
+    # 分支、上游领先/落后、变更文件数来自同一次调用
+    try:
+        if large:
+            output, capped = run_git_capped(config_args + status_args, root, GIT_LARGE_REPO_COUNT_CAP,
+                                            timeout=status_timeout)
+        else:
+            output, capped = run_git(status_args, root, timeout=status_timeout), False
+        state = parse_porcelain_v2(output)
+        state['count_capped'] = capped
+        if capped:
+            state['modified_count'] = GIT_LARGE_REPO_COUNT_CAP
+    except (subprocess.SubprocessError, OSError):
+        # git status 超时或失败：降级为只显示分支
+        state = parse_porcelain_v2('')
+        state['degraded'] = True
+    if large:
+        state['large_repo'] = True
+        state['fsmonitor_ok'] = fsmonitor_ok
+    if branch is not None:
+        state['branch'], state['head_sha'] = branch, head_sha
+    else:
+        state['head_sha'] = state['oid'] if _is_sha(state['oid']) else None
 
-        return base_part + code_part + behind_part
+    # === 今日代码行数 ===
+    state['added'], state['deleted'] = 0, 0
+    try:
+        # 今日提交：只对新提交计算 numstat
+        state.update(compute_today_numstat(repo, state['head_sha'], previous))
+        state['added'] = sum(stat[0] for stat in state['commit_numstat'].values())
+        state['deleted'] = sum(stat[1] for stat in state['commit_numstat'].values())
+    except Exception:
+        pass
 
-    except:
+    # 当前未提交的变更：index 和变更文件都没变时沿用上次的结果；git status 已降级时跳过
+    if not state.get('degraded'):
+        try:
+            state['worktree_key'] = worktree_fingerprint(repo, state['dirty_paths'])
+            if previous.get('worktree_key') == state['worktree_key'] and 'worktree_numstat' in previous:
+                state['worktree_numstat'] = previous['worktree_numstat']
+            else:
+                state['worktree_numstat'] = list(parse_numstat([
+                    run_git(config_args + ['diff', '--numstat'], root),
+                    run_git(config_args + ['diff', '--cached', '--numstat'], root)
+                ]))
+            state['added'] += state['worktree_numstat'][0]
+            state['deleted'] += state['worktree_numstat'][1]
+        except Exception:
+            state.pop('worktree_key', None)
+            state.pop('worktree_numstat', None)
+    # 变更文件列表只用于计算指纹，不写入缓存
+    del state['dirty_paths']
+
+    # git status 可能会刷新 index，重新取一次指纹
+    new_key = git_cache_key(repo)
+
+    # === 落后最新分支 ===
+    try:
+        state.update(compute_behind_latest(repo, state['branch'], state['head_sha'], entry))
+    except Exception:
+        state['latest_branch'], state['behind_latest'] = '', 0
+
+    if state.get('degraded'):
+        # 只有分支的结果不写入缓存（也不进分段缓存），完整状态交给后台补算
+        mark_segment_transient()
+        if not background:
+            trigger_segment_finish(['git'])
+        return state
+
+    state['key'] = new_key
+    state['checked_at'] = now
+    if 'fetched_at' in previous:
+        state['fetched_at'] = previous['fetched_at']
+    # 重新插入使当前仓库排在最后，超出上限时淘汰最早的仓库
+    cache.pop(root, None)
+    cache[root] = state
+    while len(cache) > GIT_CACHE_MAX_REPOS:
+        del cache[next(iter(cache))]
+    save_json_file(GIT_CACHE_FILE, cache)
+    return state
+
+def git_placeholder():
+    """git 分段超时时的占位：直接从 .git 读出分支名，不启动 git 进程（reftable 仓库只显示省略号）"""
+    try:
+        repo = locate_git_dir()
+        if repo and not uses_reftable(repo):
+            branch = read_head(repo)[0]
+            if branch:
+                return colorize("🌿", Colors.GREEN) + colorize(branch, Colors.BRIGHT_GREEN, bold=True) + colorize("…", Colors.DIM)
+    except Exception:
+        pass
+    return colorize("🌿", Colors.DIM) + colorize("…", Colors.DIM)
+
+@safe_execute(colorize("📂", Colors.DIM) + colorize("no-git", Colors.DIM))
+def get_git_info():
+    """获取Git分支、修改文件数、今日代码行数、落后最新分支"""
+    state = get_git_state()
+    if not state:
         return colorize("📂", Colors.DIM) + colorize("no-git", Colors.DIM)
 
+    branch = state['branch']
+    modified_count = state['modified_count']
+
+    # === 基础部分：分支 + 修改文件数 ===
+    # git status 超时（大仓库）时只显示分支
+    if modified_count > 0 and not state.get('degraded'):
+        files_warn, files_danger = layout_thresholds('git_files')
+        if modified_count > files_danger or state.get('count_capped'):
+            count_color = Colors.RED
+        elif modified_count > files_warn:
+            count_color = Colors.YELLOW
+        else:
+            count_color = Colors.BRIGHT_YELLOW
+
+        # 大仓库模式下数到上限即停止
+        count_text = f"{modified_count}+" if state.get('count_capped') else str(modified_count)
+        base_part = (
+            colorize("🌿", Colors.GREEN) +
+            colorize(branch, Colors.BRIGHT_GREEN, bold=True) +
+            colorize(f"({count_text})", count_color, bold=True)
+        )
+    else:
+        base_part = colorize("🌿", Colors.GREEN) + colorize(branch, Colors.BRIGHT_GREEN, bold=True)
+
+    # === 今日代码行数 ===
+    code_part = ""
+    added = state['added']
+    deleted = state['deleted']
+    if added > 0 or deleted > 0:
+        code_part = (
+            " " +
+            colorize(f"+{added}", Colors.GREEN, bold=True) +
+            colorize(f"-{deleted}", Colors.RED, bold=True)
+        )
+
+    # === 落后最新分支 ===
+    behind_part = ""
+    behind = state['behind_latest']
+    if behind > 0:
+        if behind >= 10:
+            behind_color = Colors.RED
+        elif behind >= 5:
+            behind_color = Colors.YELLOW
+        else:
+            behind_color = Colors.BRIGHT_CYAN
+        behind_part = " " + colorize("↓", behind_color) + colorize(str(behind), behind_color, bold=True)
+
+    return base_part + code_part + behind_part
+
 @safe_execute("unknown")
 def get_project_info():
     """获取项目信息"""
+    claude_input = render_input()
     # 优先使用从Claude Code传递的工作空间信息
     if claude_input and claude_input.get('workspace'):
         workspace = claude_input['workspace']
@@ -497,7 +1694,7 @@ def get_project_info():
             return os.path.basename(project_dir) or 'unknown'
     
     # 回退到当前目录
-    return os.path.basename(os.getcwd()) or 'unknown'
+    return os.path.basename(current_render().cwd) or 'unknown'
 
 @safe_execute("🧠0k/200k(0%)")
 def get_context_display():
@@ -510,17 +1707,18 @@ def get_context_display():
 
         # 改进1：根据百分比而非绝对值设置颜色，更直观
         # 改进2：降低警告阈值，提前提醒主人
-        if percentage >= 70:  # 70%以上（140k+）- 红色警告
+        context_normal, context_warn, context_danger = layout_thresholds('context')
+        if percentage >= context_danger:  # 默认 70%以上（140k+）- 红色警告
             icon = "🔥"  # 火焰：危险状态，建议清理上下文
             icon_color = Colors.RED
             used_color = Colors.RED
             perc_color = Colors.RED
-        elif percentage >= 50:  # 50%-70%（100k-140k）- 黄色警告
+        elif percentage >= context_warn:  # 默认 50%-70%（100k-140k）- 黄色警告
             icon = "⚠️ "  # 警告：中等负载，需要注意
             icon_color = Colors.YELLOW
             used_color = Colors.YELLOW
             perc_color = Colors.YELLOW
-        elif percentage >= 30:  # 30%-50%（60k-100k）- 蓝色正常
+        elif percentage >= context_normal:  # 默认 30%-50%（60k-100k）- 蓝色正常
             icon = "🧠"  # 大脑：正常工作状态
             icon_color = Colors.BRIGHT_BLUE
             used_color = Colors.BRIGHT_CYAN
@@ -547,6 +1745,7 @@ def get_context_display():
 @safe_execute(None)
 def get_context_usage():
     """获取当前会话的上下文使用量 - 使用 context_window.current_usage（最精确）"""
+    claude_input = render_input()
     if claude_input and claude_input.get('context_window'):
         ctx = claude_input['context_window']
         context_limit = ctx.get('context_window_size', 200000)
@@ -572,271 +1771,1004 @@ def format_tokens(tokens):
     """格式化token显示"""
     return f"{round(tokens/1000)}k" if tokens >= 1000 else str(tokens)
 
-@safe_execute("0k")
-def get_project_token_info():
-    """获取项目token信息 - 基于本地项目文件计算"""
-    current_dir_path = os.getcwd()
-    current_dir_name = os.path.basename(current_dir_path) or 'unknown'
-    
-    # Windows路径转换 - 修复Claude项目文件夹命名规则
-    if current_dir_path.startswith('/c/'):
-        # bash格式路径 /c/Users/Administrator -> C:\Users\Administrator
-        windows_path = 'C:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('/d/'):
-        # bash格式路径 /d/IP_tracker -> D:\IP_tracker
-        windows_path = 'D:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('C:') or current_dir_path.startswith('D:'):
-        # 已经是Windows格式
-        windows_path = current_dir_path
-    else:
-        windows_path = current_dir_path
-    
-    # Claude项目文件夹命名规则: C:\Users\Administrator -> C--Users-Administrator
-    claude_folder_name = windows_path.replace(':', '--').replace('\\', '-')
-    
-    # 修复下划线和短横线的匹配问题
-    claude_folder_name_alt = claude_folder_name.replace('_', '-')
-    
-    project_dir_patterns = [
-        claude_folder_name,
-        claude_folder_name_alt,
-        current_dir_name,
-        current_dir_name.replace('_', '-'),  # IP_tracker -> IP-tracker
-        current_dir_name.replace('-', '_')   # IP-tracker -> IP_tracker  
-    ]
-    
+# ================================
+# 增量扫描：transcript 检查点缓存
+# ================================
+
+# 每个 jsonl 文件的检查点（inode、大小、已解析偏移、部分聚合结果）持久化在这里，
+# 每次渲染只解析上次之后追加的字节
+TRANSCRIPT_CACHE_FILE = os.path.expanduser('~/.claude/.status_transcript_cache.json')
+TRANSCRIPT_CACHE_VERSION = 3
+# 扫描中途至少每隔多少秒保存一次检查点（首次扫描被超时、kill 打断时不会丢掉已完成的文件）
+TRANSCRIPT_CHECKPOINT_INTERVAL = 0.5
+# 文件头校验长度：用于识别被替换/重写但 inode 未变的文件
+TRANSCRIPT_HEAD_BYTES = 1024
+# 单次读取块大小，避免首次扫描大文件时一次性读入内存
+TRANSCRIPT_READ_CHUNK = 1024 * 1024
+
+# 本进程内只加载一次检查点缓存
+_transcript_cache = None
+# 守护进程中按项目文件夹保存的用量：folders -> (监听版本, 用量)，文件夹没有变化时直接复用
+_watched_project_usage = {}
+# 分段并行执行时保护检查点缓存
+_transcript_lock = threading.RLock()
+
+def load_json_file(file_path, default):
+    """读取 JSON 缓存文件，失败时返回默认值"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return default
+
+def save_json_file(file_path, data):
+    """原子写入 JSON 缓存文件（先写临时文件再替换，避免并发渲染读到半个文件）"""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, file_path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except:
+            pass
+
+def acquire_lock_file(lock_path, stale_after):
+    """创建锁文件（O_EXCL），已被持有时返回 False；超过 stale_after 秒未更新的锁视为残留"""
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) < stale_after:
+                return False
+            os.remove(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+    except OSError:
+        return False
+    os.close(fd)
+    return True
+
+def release_lock_file(lock_path):
+    """删除锁文件"""
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+def get_transcript_cache():
+    """获取 transcript 检查点缓存"""
+    global _transcript_cache
+    if _transcript_cache is None:
+        cache = load_json_file(TRANSCRIPT_CACHE_FILE, {})
+        if not isinstance(cache, dict) or cache.get('version') != TRANSCRIPT_CACHE_VERSION:
+            cache = {'version': TRANSCRIPT_CACHE_VERSION}
+        _transcript_cache = cache
+    return _transcript_cache
+
+# Claude Code 项目文件夹名的最大长度，更长的路径截断后会追加哈希后缀
+CLAUDE_PROJECT_NAME_MAX = 200
+
+# 进程内缓存的"路径 -> 项目文件夹"映射，~/.claude/projects 的 mtime 变化（增删文件夹）时失效
+_project_folders_cache = {'mtime': None, 'folders': {}}
+
+def encode_project_path(path):
+    """按 Claude Code 的规则把路径编码为项目文件夹名
+
+    所有非字母数字字符替换为 '-'（Claude Code 按 UTF-16 码元替换，BMP 以外的字符占两个）：
+    C:\\Users\\Administrator -> C--Users-Administrator，/home/me/app -> -home-me-app
+    """
+    # Git Bash / MSYS 下的 /c/Users/... 对应 Claude Code 看到的 C:\\Users\\...
+    if (sys.platform in ('win32', 'cygwin', 'msys') and len(path) >= 3
+            and path[0] == '/' and path[1].isalpha() and path[2] == '/'):
+        path = path[1].upper() + ':\\' + path[3:].replace('/', '\\')
+
+    encoded = []
+    for c in path:
+        if 'a' <= c <= 'z' or 'A' <= c <= 'Z' or '0' <= c <= '9':
+            encoded.append(c)
+        elif ord(c) > 0xFFFF:
+            encoded.append('--')
+        else:
+            encoded.append('-')
+    return ''.join(encoded)
+
+def get_project_root():
+    """当前项目的根目录：Claude Code 传入的 workspace.project_dir，没有时用当前目录"""
+    claude_input = render_input()
+    if isinstance(claude_input, dict) and isinstance(claude_input.get('workspace'), dict):
+        project_dir = claude_input['workspace'].get('project_dir')
+        if project_dir:
+            return project_dir
+    return current_render().cwd
+
+def find_project_folders():
+    """查找当前项目对应的 Claude 项目文件夹（按编码规则精确匹配，不做子串匹配）"""
     projects_dir = os.path.expanduser('~/.claude/projects')
-    if not os.path.exists(projects_dir):
-        return "0k"
-    
-    project_tokens = 0
-    
-    # 在projects目录中查找匹配当前目录的文件夹
-    for folder_name in os.listdir(projects_dir):
-        folder_path = os.path.join(projects_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue
-            
-        # 检查文件夹名是否包含当前目录的路径信息
-        is_current_project = False
-        for pattern in project_dir_patterns:
-            if pattern in folder_name:
-                is_current_project = True
-                break
-        
-        if is_current_project:
-            # 统计该项目文件夹中所有jsonl文件的tokens
+    try:
+        mtime = os.stat(projects_dir).st_mtime
+    except OSError:
+        return []
+
+    project_root = get_project_root()
+    cache = _project_folders_cache
+    if cache['mtime'] != mtime:
+        cache['mtime'] = mtime
+        cache['folders'] = {}
+    if project_root in cache['folders']:
+        return cache['folders'][project_root]
+
+    folder_name = encode_project_path(project_root)
+    folders = []
+    if os.path.isdir(os.path.join(projects_dir, folder_name)):
+        folders.append(os.path.join(projects_dir, folder_name))
+    elif len(folder_name) > CLAUDE_PROJECT_NAME_MAX:
+        # 超长路径：文件夹名是截断后的编码加哈希后缀，按前缀匹配
+        prefix = folder_name[:CLAUDE_PROJECT_NAME_MAX] + '-'
+        try:
+            for name in sorted(os.listdir(projects_dir)):
+                if name.startswith(prefix) and os.path.isdir(os.path.join(projects_dir, name)):
+                    folders.append(os.path.join(projects_dir, name))
+        except OSError:
+            pass
+
+    cache['folders'][project_root] = folders
+    return folders
+
+def list_transcript_files(folders):
+    """列出项目文件夹中的所有 jsonl 文件"""
+    files = []
+    for folder_path in folders:
+        try:
             for file_name in os.listdir(folder_path):
                 if file_name.endswith('.jsonl'):
-                    file_path = os.path.join(folder_path, file_name)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            lines = f.readlines()
-                        
-                        for line in lines:
-                            data = json.loads(line.strip())
-                            if data.get('type') == 'assistant' and data.get('message', {}).get('usage'):
-                                usage = data['message']['usage']
-                                input_tokens = usage.get('input_tokens', 0)
-                                output_tokens = usage.get('output_tokens', 0)
-                                cache_read_tokens = usage.get('cache_read_input_tokens', 0)
-                                cache_create_tokens = usage.get('cache_create_input_tokens', 0)
-                                # 统计所有4种tokens
-                                project_tokens += input_tokens + output_tokens + cache_read_tokens + cache_create_tokens
-                    except:
-                        continue
-    
-    # 格式化显示
-    if project_tokens >= 1000000:
-        return f"{project_tokens/1000000:.1f}M"
-    elif project_tokens >= 1000:
-        return f"{project_tokens/1000:.1f}k"
+                    files.append(os.path.join(folder_path, file_name))
+        except OSError:
+            continue
+    return files
+
+def new_transcript_agg():
+    """单个 transcript 文件的部分聚合结果"""
+    return {
+        'tokens': 0,          # 4种token合计
+        'cost': 0.0,          # 按统一单价估算的费用
+        'sessions': {},       # sessionId -> [最早时间戳, 最晚时间戳]
+        'user_messages': 0    # user 消息条数
+    }
+
+def usage_token_counts(usage):
+    """assistant 消息 usage 中的4种 token：(input, output, cache_read, cache_create)
+
+    transcript 中缓存写入的字段名是 cache_creation_input_tokens；旧版本脚本读的是
+    cache_create_input_tokens，没有新字段时仍按旧字段名读取。
+    """
+    cache_create = usage.get('cache_creation_input_tokens')
+    if cache_create is None:
+        cache_create = usage.get('cache_create_input_tokens', 0)
+    return (
+        usage.get('input_tokens', 0),
+        usage.get('output_tokens', 0),
+        usage.get('cache_read_input_tokens', 0),
+        cache_create
+    )
+
+def token_cost(input_tokens, output_tokens, cache_read_tokens, cache_create_tokens):
+    """按统一单价估算费用（包含所有4种tokens）"""
+    # input: $3/M, output: $15/M, cache_read: $0.3/M, cache_create: $3.75/M
+    return (
+        input_tokens * 3.0 / 1000000 +
+        output_tokens * 15.0 / 1000000 +
+        cache_read_tokens * 0.3 / 1000000 +
+        cache_create_tokens * 3.75 / 1000000
+    )
+
+def parse_transcript_timestamp(timestamp_str):
+    """解析ISO 8601格式的时间字符串，返回 Unix 时间戳，无法解析时返回 None"""
+    if not timestamp_str:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).timestamp()
+    except Exception:
+        return None
+
+def feed_transcript_line(agg, data):
+    """把一行 transcript 记录累加进聚合结果（一次解析同时产出 token/费用/会话时间/消息数）"""
+    msg_type = data.get('type')
+    if msg_type == 'user':
+        agg['user_messages'] += 1
+    elif msg_type == 'assistant' and data.get('message', {}).get('usage'):
+        counts = usage_token_counts(data['message']['usage'])
+        # 统计所有4种tokens
+        agg['tokens'] += sum(counts)
+        agg['cost'] += token_cost(*counts)
+
+    # 每个会话只需保留最早和最晚的时间戳
+    session_id = data.get('sessionId')
+    if session_id:
+        timestamp = parse_transcript_timestamp(data.get('timestamp'))
+        if timestamp is None:
+            return
+        span = agg['sessions'].get(session_id)
+        if span is None:
+            agg['sessions'][session_id] = [timestamp, timestamp]
+        else:
+            span[0] = min(span[0], timestamp)
+            span[1] = max(span[1], timestamp)
+
+def scan_transcript_file(file_path, entry, new_agg=new_transcript_agg, feed=feed_transcript_line):
+    """增量解析单个 transcript 文件，返回更新后的检查点
+
+    只解析 entry['offset'] 之后追加的完整行；文件被截断、替换（inode 变化）
+    或文件头被改写时丢弃旧聚合从头扫描（返回新的检查点对象）。末尾未写完的半行留到下次再解析。
+    new_agg/feed: 聚合的创建和累加函数（用量数据库用它们收集本次新增的部分）。
+    """
+    st = os.stat(file_path)
+    if (entry and entry.get('inode') == st.st_ino and entry.get('size') == st.st_size
+            and entry.get('mtime') == st.st_mtime):
+        return entry
+
+    span = trace_span('read ' + os.path.basename(file_path), 'transcript', path=file_path)
+    with span, open(file_path, 'rb') as f:
+        if entry and entry.get('inode') == st.st_ino and st.st_size >= entry.get('offset', 0):
+            f.seek(0)
+            if zlib.crc32(f.read(entry.get('head_len', 0))) != entry.get('head_crc'):
+                entry = None
+        else:
+            entry = None
+
+        if entry is None:
+            f.seek(0)
+            head_len = min(st.st_size, TRANSCRIPT_HEAD_BYTES)
+            entry = {
+                'inode': st.st_ino,
+                'head_len': head_len,
+                'head_crc': zlib.crc32(f.read(head_len)),
+                'offset': 0,
+                'agg': new_agg()
+            }
+
+        offset = entry['offset']
+        start_offset = offset
+        lines = 0
+        agg = entry['agg']
+        f.seek(offset)
+        pending = b''
+        while True:
+            chunk = f.read(TRANSCRIPT_READ_CHUNK)
+            if not chunk:
+                break
+            buf = pending + chunk
+            last_nl = buf.rfind(b'\n')
+            if last_nl < 0:
+                pending = buf
+                continue
+            for line in buf[:last_nl].split(b'\n'):
+                if not line.strip():
+                    continue
+                lines += 1
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(data, dict):
+                    feed(agg, data)
+            offset += last_nl + 1
+            pending = buf[last_nl + 1:]
+        span.args['bytes'] = offset - start_offset
+        span.args['lines'] = lines
+
+    # 头部长度不足时（新文件）随文件增长补齐校验范围
+    if entry['head_len'] < TRANSCRIPT_HEAD_BYTES and st.st_size > entry['head_len']:
+        with open(file_path, 'rb') as f:
+            head_len = min(st.st_size, TRANSCRIPT_HEAD_BYTES)
+            entry['head_len'] = head_len
+            entry['head_crc'] = zlib.crc32(f.read(head_len))
+
+    entry['offset'] = offset
+    entry['size'] = st.st_size
+    entry['mtime'] = st.st_mtime
+    return entry
+
+def scan_transcripts(folders):
+    """统一聚合引擎：按检查点增量扫描文件夹中的 transcript，返回 {文件路径: 部分聚合}
+
+    同一次渲染内每个文件只会被检查一次，各个分段共享同一份结果。
+    """
+    with _transcript_lock:
+        return _scan_transcripts_locked(folders)
+
+def _scan_transcripts_locked(folders):
+    cache = get_transcript_cache()
+    entries = cache.setdefault('files', {})
+    file_paths = list_transcript_files(folders)
+    result, dirty = _scan_files_locked(cache, file_paths)
+
+    # 清理已删除文件的检查点
+    seen = set(file_paths)
+    folder_prefixes = tuple(os.path.join(folder, '') for folder in folders)
+    for file_path in list(entries):
+        if file_path not in seen and file_path.startswith(folder_prefixes):
+            del entries[file_path]
+            dirty = True
+
+    if dirty:
+        save_json_file(TRANSCRIPT_CACHE_FILE, cache)
+    return result
+
+def scan_transcript_paths(file_paths):
+    """按检查点增量扫描指定的 transcript 文件，返回 {文件路径: 部分聚合}"""
+    with _transcript_lock:
+        cache = get_transcript_cache()
+        result, dirty = _scan_files_locked(cache, file_paths)
+        if dirty:
+            save_json_file(TRANSCRIPT_CACHE_FILE, cache)
+        return result
+
+def _scan_files_locked(cache, file_paths):
+    """逐个文件更新检查点，返回 ({文件路径: 部分聚合}, 检查点是否有尚未保存的变化)
+
+    扫描耗时较长时每隔 TRANSCRIPT_CHECKPOINT_INTERVAL 秒把已完成文件的检查点写入磁盘。
+    """
+    entries = cache.setdefault('files', {})
+    result = {}
+    dirty = False
+    saved_at = time.perf_counter()
+    # 本次渲染已检查过的文件
+    scanned = current_render().scanned
+    for file_path in file_paths:
+        if file_path in scanned:
+            result[file_path] = entries[file_path]['agg']
+            continue
+        old_entry = entries.get(file_path)
+        old_state = (old_entry.get('inode'), old_entry.get('size'), old_entry.get('mtime')) if old_entry else None
+        try:
+            entry = scan_transcript_file(file_path, old_entry)
+        except Exception:
+            entries.pop(file_path, None)
+            dirty = True
+            continue
+        if (entry.get('inode'), entry.get('size'), entry.get('mtime')) != old_state:
+            dirty = True
+        entries[file_path] = entry
+        scanned.add(file_path)
+        result[file_path] = entry['agg']
+        if dirty and time.perf_counter() - saved_at >= TRANSCRIPT_CHECKPOINT_INTERVAL:
+            save_json_file(TRANSCRIPT_CACHE_FILE, cache)
+            dirty = False
+            saved_at = time.perf_counter()
+    return result, dirty
+
+def iter_lines_reversed(file_path):
+    """用 mmap 从文件末尾向前逐行读取，只返回以换行结尾的完整行（与增量扫描一致）"""
+    import mmap
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.rfind(b'\n')
+            while end >= 0:
+                start = mm.rfind(b'\n', 0, end) + 1
+                yield mm[start:end]
+                end = start - 1
+
+def transcript_has_user_message(file_path):
+    """文件中是否有 user 消息：从末尾向前找，对话文件通常在最后几行内就能确定"""
+    for line in iter_lines_reversed(file_path):
+        if b'"user"' not in line and b'\\u' not in line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get('type') == 'user':
+            return True
+    return False
+
+# ================================
+# 用量数据库（SQLite WAL）：按 项目文件夹/会话/日期/模型 汇总 4 种 token 和会话起止时间，
+# 每个文件记录导入检查点，渲染时只导入新增的行，项目统计直接查询汇总表
+# ================================
+USAGE_DB_FILE = os.path.expanduser('~/.claude/.status_usage.db')
+USAGE_DB_VERSION = 3
+# 等待写锁的最长时间（秒）：后台正在导入时渲染进程不排队，先用库中已有的数据
+USAGE_DB_BUSY_TIMEOUT = 0.1
+# 渲染时最多同步导入的字节数，超过则交给后台进程导入，首次导入期间显示 indexing
+USAGE_DB_INLINE_MAX_BYTES = 8 * 1024 * 1024
+# 后台导入锁（每导入一个文件刷新一次），超过该时长未刷新视为残留（秒）
+USAGE_INDEX_LOCK = os.path.expanduser('~/.claude/.status_usage_index.lock')
+USAGE_INDEX_LOCK_TIMEOUT = 60
+
+USAGE_DB_TABLES = ('files', 'usage', 'sessions', 'projects', 'meta')
+USAGE_DB_SCHEMA = (
+    """CREATE TABLE files (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        project TEXT NOT NULL,
+        inode INTEGER,
+        size INTEGER,
+        mtime REAL,
+        read_offset INTEGER,
+        head_len INTEGER,
+        head_crc INTEGER,
+        user_messages INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX files_project ON files (project)",
+    """CREATE TABLE usage (
+        file_id INTEGER NOT NULL,
+        session_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        model TEXT NOT NULL,
+        input_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        cache_read_tokens INTEGER NOT NULL,
+        cache_create_tokens INTEGER NOT NULL,
+        PRIMARY KEY (file_id, session_id, day, model)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE sessions (
+        file_id INTEGER NOT NULL,
+        session_id TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        ended_at REAL NOT NULL,
+        PRIMARY KEY (file_id, session_id)
+    ) WITHOUT ROWID""",
+    # 完整导入过的项目文件夹，首次导入完成前项目分段显示 indexing
+    "CREATE TABLE projects (path TEXT PRIMARY KEY, indexed_at REAL NOT NULL)",
+    # 杂项状态，例如上次扫描全部项目的时间 swept_at
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value)",
+)
+
+# sqlite3 不可用时置为 False，之后直接使用 JSON 检查点缓存
+_usage_db_available = None
+
+def open_usage_db():
+    """打开用量数据库（每次调用新建连接，可在分段线程中使用），不可用时返回 None"""
+    global _usage_db_available
+    if not USAGE_DB_ENABLED or _usage_db_available is False:
+        return None
+    try:
+        import sqlite3
+    except ImportError:
+        _usage_db_available = False
+        return None
+
+    conn = None
+    try:
+        with trace_span('open usage db', 'sqlite'):
+            conn = sqlite3.connect(USAGE_DB_FILE, timeout=USAGE_DB_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA synchronous = NORMAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != USAGE_DB_VERSION:
+                init_usage_db(conn)
+        return conn
+    except sqlite3.Error:
+        # 数据库被锁（另一个进程正在建表）或损坏：本次改用 JSON 检查点缓存
+        if conn is not None:
+            conn.close()
+        return None
+
+def init_usage_db(conn):
+    """开启 WAL 并建表；版本不一致时重建（汇总数据可以随时从 transcript 重新导入）"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] != USAGE_DB_VERSION:
+            for table in USAGE_DB_TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            for statement in USAGE_DB_SCHEMA:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {USAGE_DB_VERSION}')
+        conn.execute('COMMIT')
+    except:
+        conn.execute('ROLLBACK')
+        raise
+
+def new_rollup_agg():
+    """单个 transcript 文件本次新增部分的汇总（写入数据库前的暂存）"""
+    return {
+        'usage': {},          # (sessionId, 日期, 模型) -> [input, output, cache_read, cache_create]
+        'sessions': {},       # sessionId -> [最早时间戳, 最晚时间戳]
+        'user_messages': 0    # user 消息条数
+    }
+
+def feed_rollup_line(agg, data):
+    """把一行 transcript 记录累加进数据库汇总（统计口径与 feed_transcript_line 相同）"""
+    session_id = data.get('sessionId')
+    timestamp = parse_transcript_timestamp(data.get('timestamp'))
+    msg_type = data.get('type')
+    if msg_type == 'user':
+        agg['user_messages'] += 1
+    elif msg_type == 'assistant' and data.get('message', {}).get('usage'):
+        message = data['message']
+        # 按本地日期归档，没有时间戳的记录日期为空
+        day = time.strftime('%Y-%m-%d', time.localtime(timestamp)) if timestamp is not None else ''
+        key = (session_id or '', day, message.get('model') or '')
+        counts = agg['usage'].get(key)
+        if counts is None:
+            counts = agg['usage'][key] = [0, 0, 0, 0]
+        for i, count in enumerate(usage_token_counts(message['usage'])):
+            counts[i] += count
+
+    if session_id and timestamp is not None:
+        span = agg['sessions'].get(session_id)
+        if span is None:
+            agg['sessions'][session_id] = [timestamp, timestamp]
+        else:
+            span[0] = min(span[0], timestamp)
+            span[1] = max(span[1], timestamp)
+
+def ingest_file(conn, file_path, project):
+    """在一个写事务内把 transcript 新增的部分导入数据库
+
+    检查点在事务内重新读取，多个进程同时导入同一个文件时不会重复累加；
+    文件被截断、替换或重写时先删除它原有的汇总再从头导入。
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            'SELECT id, inode, size, mtime, read_offset, head_len, head_crc FROM files WHERE path = ?',
+            (file_path,)
+        ).fetchone()
+        entry = None
+        if row:
+            entry = {
+                'inode': row[1], 'size': row[2], 'mtime': row[3], 'offset': row[4],
+                'head_len': row[5], 'head_crc': row[6], 'agg': new_rollup_agg()
+            }
+        new_entry = scan_transcript_file(file_path, entry, new_rollup_agg, feed_rollup_line)
+
+        if row is None:
+            file_id = conn.execute('INSERT INTO files (path, project) VALUES (?, ?)', (file_path, project)).lastrowid
+        else:
+            file_id = row[0]
+            if new_entry is not entry:
+                delete_file_rollups(conn, file_id)
+        agg = new_entry['agg']
+        conn.execute(
+            'UPDATE files SET project = ?, inode = ?, size = ?, mtime = ?, read_offset = ?, head_len = ?, '
+            'head_crc = ?, user_messages = user_messages + ? WHERE id = ?',
+            (project, new_entry['inode'], new_entry['size'], new_entry['mtime'], new_entry['offset'],
+             new_entry['head_len'], new_entry['head_crc'], agg['user_messages'], file_id)
+        )
+        # 先 UPDATE 再 INSERT（不依赖 SQLite 3.24 的 UPSERT 语法）
+        for (session_id, day, model), counts in agg['usage'].items():
+            key = (file_id, session_id, day, model)
+            if conn.execute(
+                'UPDATE usage SET input_tokens = input_tokens + ?, output_tokens = output_tokens + ?, '
+                'cache_read_tokens = cache_read_tokens + ?, cache_create_tokens = cache_create_tokens + ? '
+                'WHERE file_id = ? AND session_id = ? AND day = ? AND model = ?',
+                tuple(counts) + key
+            ).rowcount == 0:
+                conn.execute('INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)', key + tuple(counts))
+        for session_id, (first, last) in agg['sessions'].items():
+            if conn.execute(
+                'UPDATE sessions SET started_at = MIN(started_at, ?), ended_at = MAX(ended_at, ?) '
+                'WHERE file_id = ? AND session_id = ?',
+                (first, last, file_id, session_id)
+            ).rowcount == 0:
+                conn.execute('INSERT INTO sessions VALUES (?, ?, ?, ?)', (file_id, session_id, first, last))
+        conn.execute('COMMIT')
+    except:
+        conn.execute('ROLLBACK')
+        raise
+
+def delete_file_rollups(conn, file_id):
+    """删除一个文件的全部汇总（保留 files 行，由调用方更新或删除）"""
+    conn.execute('DELETE FROM usage WHERE file_id = ?', (file_id,))
+    conn.execute('DELETE FROM sessions WHERE file_id = ?', (file_id,))
+    conn.execute('UPDATE files SET user_messages = 0 WHERE id = ?', (file_id,))
+
+def remove_ingested_files(conn, file_ids):
+    """删除已不存在（或无法解析）的文件及其汇总"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for file_id in file_ids:
+            delete_file_rollups(conn, file_id)
+            conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        conn.execute('COMMIT')
+    except:
+        conn.execute('ROLLBACK')
+        raise
+
+def ingest_folder(conn, folder, max_pending_bytes=None, on_file=None):
+    """把项目文件夹中有变化的 transcript 导入数据库
+
+    待导入字节数超过 max_pending_bytes 时不做任何导入，返回 False（交给后台导入）；
+    全部导入完成后把文件夹记为已导入并返回 True。on_file 在每个文件导入后调用。
+    """
+    import sqlite3
+    rows = {
+        row[0]: row[1:] for row in conn.execute(
+            'SELECT path, id, inode, size, mtime, read_offset FROM files WHERE project = ?', (folder,)
+        )
+    }
+    changed = []
+    pending = 0
+    file_paths = list_transcript_files([folder])
+    for file_path in file_paths:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        row = rows.get(file_path)
+        if row and (row[1], row[2], row[3]) == (st.st_ino, st.st_size, st.st_mtime):
+            continue
+        changed.append(file_path)
+        if row and row[1] == st.st_ino and st.st_size >= (row[4] or 0):
+            pending += st.st_size - (row[4] or 0)
+        else:
+            pending += st.st_size
+    if max_pending_bytes is not None and pending > max_pending_bytes:
+        return False
+
+    for file_path in changed:
+        try:
+            ingest_file(conn, file_path, folder)
+        except sqlite3.Error:
+            raise
+        except Exception:
+            # 文件在导入时被删除或无法读取：与 JSON 检查点一样丢弃它的数据，下次重新导入
+            file_id = conn.execute('SELECT id FROM files WHERE path = ?', (file_path,)).fetchone()
+            if file_id:
+                remove_ingested_files(conn, [file_id[0]])
+        if on_file:
+            on_file()
+
+    seen = set(file_paths)
+    gone = [row[0] for path, row in rows.items() if path not in seen]
+    if gone:
+        remove_ingested_files(conn, gone)
+    if conn.execute('SELECT 1 FROM projects WHERE path = ?', (folder,)).fetchone() is None:
+        conn.execute('INSERT OR REPLACE INTO projects VALUES (?, ?)', (folder, time.time()))
+    return True
+
+def query_project_usage(conn, folders):
+    """从汇总表查询项目文件夹的 token 和费用
+
+    会话时间跨度只有布局中包含工作时间分段时才需要，由 query_project_sessions 按需查询。
+    """
+    usage = {'tokens': 0, 'cost': 0.0, 'sessions': None}
+    if not folders:
+        usage['sessions'] = {}
+        return usage
+    marks = ', '.join('?' * len(folders))
+    with trace_span('query project usage', 'sqlite'):
+        counts = conn.execute(
+            'SELECT COALESCE(SUM(u.input_tokens), 0), COALESCE(SUM(u.output_tokens), 0), '
+            'COALESCE(SUM(u.cache_read_tokens), 0), COALESCE(SUM(u.cache_create_tokens), 0) '
+            f'FROM usage u JOIN files f ON f.id = u.file_id WHERE f.project IN ({marks})',
+            folders
+        ).fetchone()
+        usage['tokens'] = sum(counts)
+        usage['cost'] = token_cost(*counts)
+    return usage
+
+def query_project_sessions(conn, folders):
+    """从汇总表查询项目文件夹中各会话的时间跨度 {session_id: [开始, 结束]}"""
+    sessions = {}
+    if not folders:
+        return sessions
+    marks = ', '.join('?' * len(folders))
+    with trace_span('query project sessions', 'sqlite'):
+        for session_id, first, last in conn.execute(
+            'SELECT s.session_id, MIN(s.started_at), MAX(s.ended_at) '
+            f'FROM sessions s JOIN files f ON f.id = s.file_id WHERE f.project IN ({marks}) '
+            'GROUP BY s.session_id',
+            folders
+        ):
+            sessions[session_id] = [first, last]
+    return sessions
+
+def get_project_usage_from_db(folders):
+    """先同步导入少量新增数据再查询汇总表；数据库不可用时返回 None
+
+    新增数据太多（首次导入）时交给后台导入，尚未完整导入过的项目返回 indexing 标记。
+    """
+    conn = open_usage_db()
+    if conn is None:
+        return None
+    import sqlite3
+    try:
+        complete = True
+        for folder in folders:
+            try:
+                if not ingest_folder(conn, folder, USAGE_DB_INLINE_MAX_BYTES):
+                    complete = False
+            except sqlite3.OperationalError:
+                # 后台导入正持有写锁：先用库中已有的数据
+                complete = False
+        if not complete:
+            trigger_usage_index(folders)
+            marks = ', '.join('?' * len(folders))
+            indexed = conn.execute(f'SELECT COUNT(*) FROM projects WHERE path IN ({marks})', folders).fetchone()[0]
+            if indexed < len(folders):
+                return {'tokens': 0, 'cost': 0.0, 'sessions': {}, 'indexing': True}
+            # 新增部分还在后台导入，库中的结果不完整
+            usage = query_project_usage(conn, folders)
+            usage['pending'] = True
+            return usage
+        return query_project_usage(conn, folders)
+    finally:
+        conn.close()
+
+def trigger_usage_index(folders=None):
+    """在后台导入项目文件夹（None 表示扫描全部项目），同一时间只允许一个导入任务"""
+    if not acquire_lock_file(USAGE_INDEX_LOCK, USAGE_INDEX_LOCK_TIMEOUT):
+        return
+    # 守护进程常驻，用线程导入；普通渲染进程马上退出，交给独立子进程导入
+    if _daemon_mode:
+        threading.Thread(target=run_usage_indexer, args=(folders,), daemon=True).start()
+    else:
+        with trace_span('spawn --index-usage', 'subprocess'):
+            spawn_background('--index-usage', *(folders or []))
+
+def touch_usage_index_lock():
+    """刷新后台导入锁的修改时间，避免导入大量文件时被当作残留锁"""
+    try:
+        os.utime(USAGE_INDEX_LOCK)
+    except OSError:
+        pass
+
+@safe_execute(None)
+def run_usage_indexer(folders=None):
+    """后台导入项目文件夹中的 transcript（持有导入锁期间执行），folders 为空时扫描全部项目"""
+    try:
+        conn = open_usage_db()
+        if conn is None:
+            return
+        try:
+            # 后台导入可以等待渲染进程释放写锁
+            conn.execute('PRAGMA busy_timeout = 5000')
+            if folders:
+                for folder in folders:
+                    ingest_folder(conn, folder, on_file=touch_usage_index_lock)
+            else:
+                sweep_all_projects(conn)
+        finally:
+            conn.close()
+    finally:
+        release_lock_file(USAGE_INDEX_LOCK)
+
+def list_all_project_folders():
+    """~/.claude/projects 下的所有项目文件夹"""
+    projects_dir = os.path.expanduser('~/.claude/projects')
+    try:
+        names = os.listdir(projects_dir)
+    except OSError:
+        return []
+    return [os.path.join(projects_dir, name) for name in sorted(names)
+            if os.path.isdir(os.path.join(projects_dir, name))]
+
+def sweep_all_projects(conn):
+    """导入全部项目文件夹中变化的部分，清理已删除的项目，并记录扫描时间"""
+    folders = list_all_project_folders()
+    for folder in folders:
+        ingest_folder(conn, folder, on_file=touch_usage_index_lock)
+
+    # 项目文件夹被删除：ingest_folder 会删除它下面所有文件的汇总
+    existing = set(folders)
+    stale = [row[0] for row in conn.execute('SELECT DISTINCT project FROM files') if row[0] not in existing]
+    for folder in stale:
+        ingest_folder(conn, folder)
+    stale += [row[0] for row in conn.execute('SELECT path FROM projects') if row[0] not in existing]
+    for folder in set(stale):
+        conn.execute('DELETE FROM projects WHERE path = ?', (folder,))
+
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('swept_at', ?)", (time.time(),))
+
+def get_transcript_user_messages(file_path):
+    """单个 transcript 的 user 消息数（先增量导入/扫描该文件）
+
+    新增部分超过 USAGE_DB_INLINE_MAX_BYTES 时交给后台导入；没能导入到最新时
+    返回库中已有的数（没有则为 0），并标记为不可缓存，下次渲染重新读取。
+    """
+    conn = open_usage_db()
+    if conn is None:
+        agg = scan_transcript_paths([file_path]).get(file_path)
+        return agg['user_messages'] if agg else 0
+    import sqlite3
+    try:
+        select = 'SELECT inode, size, mtime, read_offset, user_messages FROM files WHERE path = ?'
+        row = conn.execute(select, (file_path,)).fetchone()
+        st = os.stat(file_path)
+        if row is None or tuple(row[:3]) != (st.st_ino, st.st_size, st.st_mtime):
+            folder = os.path.dirname(file_path)
+            if row and row[0] == st.st_ino and st.st_size >= (row[3] or 0):
+                pending = st.st_size - (row[3] or 0)
+            else:
+                pending = st.st_size
+            if pending > USAGE_DB_INLINE_MAX_BYTES:
+                trigger_usage_index([folder])
+                mark_segment_transient()
+            else:
+                try:
+                    ingest_file(conn, file_path, folder)
+                    row = conn.execute(select, (file_path,)).fetchone()
+                except sqlite3.OperationalError:
+                    # 后台导入正持有写锁：先用库中已有的数据
+                    mark_segment_transient()
+        if row is None:
+            mark_segment_transient()
+            return 0
+        return row[4]
+    finally:
+        conn.close()
+
+def load_transcript_checkpoints(folders):
+    """读取项目文件夹中各文件的检查点：{路径: (inode, 大小, mtime, user消息数)}"""
+    conn = open_usage_db()
+    if conn is None:
+        with _transcript_lock:
+            entries = dict(get_transcript_cache().get('files', {}))
+        return {
+            path: (entry.get('inode'), entry.get('size'), entry.get('mtime'), entry['agg']['user_messages'])
+            for path, entry in entries.items()
+        }
+    if not folders:
+        conn.close()
+        return {}
+    try:
+        marks = ', '.join('?' * len(folders))
+        return {
+            row[0]: tuple(row[1:]) for row in conn.execute(
+                f'SELECT path, inode, size, mtime, user_messages FROM files WHERE project IN ({marks})', folders
+            )
+        }
+    finally:
+        conn.close()
+
+def week_start_day(now=None):
+    """本周一的本地日期（%Y-%m-%d），与汇总表中的 day 列可直接比较"""
+    today = datetime.fromtimestamp(now if now is not None else time.time()).date()
+    return date.fromordinal(today.toordinal() - today.weekday()).strftime('%Y-%m-%d')
+
+def get_global_usage():
+    """全部项目今日/本周/累计的 token 和费用，数据库不可用时返回 None
+
+    只查询按天汇总的数据，不在渲染时遍历项目文件夹；当前项目由项目分段同步导入，
+    其他项目由后台扫描（最多每 GLOBAL_USAGE_SWEEP_INTERVAL 秒一次）追加新增的部分。
+    """
+    conn = open_usage_db()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'swept_at'").fetchone()
+        if row is None or time.time() - row[0] >= GLOBAL_USAGE_SWEEP_INTERVAL:
+            trigger_usage_index()
+            if row is None:
+                # 还没有完整扫描过，累计值不完整
+                return {'indexing': True}
+
+        today = time.strftime('%Y-%m-%d')
+        week_start = week_start_day()
+        totals = {name: [0, 0, 0, 0] for name in ('today', 'week', 'total')}
+        with trace_span('query global usage', 'sqlite'):
+            for day, *counts in conn.execute(
+                'SELECT day, SUM(input_tokens), SUM(output_tokens), SUM(cache_read_tokens), '
+                'SUM(cache_create_tokens) FROM usage GROUP BY day'
+            ):
+                names = ['total']
+                if day >= week_start:
+                    names.append('week')
+                if day == today:
+                    names.append('today')
+                for name in names:
+                    for i, count in enumerate(counts):
+                        totals[name][i] += count
+        return {name: {'tokens': sum(counts), 'cost': token_cost(*counts)} for name, counts in totals.items()}
+    finally:
+        conn.close()
+
+def get_project_usage():
+    """汇总当前项目的 token、费用和会话时间跨度（本次渲染内只计算一次）"""
+    with _transcript_lock:
+        return _get_project_usage_locked()
+
+def get_project_sessions():
+    """当前项目各会话的时间跨度（数据库模式下首次访问时才查询）"""
+    with _transcript_lock:
+        usage = _get_project_usage_locked()
+        if usage['sessions'] is None:
+            sessions = {}
+            conn = open_usage_db()
+            if conn is not None:
+                try:
+                    sessions = query_project_sessions(conn, find_project_folders())
+                finally:
+                    conn.close()
+            usage['sessions'] = sessions
+        return usage['sessions']
+
+def project_watch_key(folders):
+    """项目文件夹的监听版本，加上当前 transcript 的修改时间（其事件可能还没读到）
+
+    不在守护进程中或无法监听时返回 None。
+    """
+    versions = [watch_version(folder) for folder in folders]
+    if not folders or None in versions:
+        return None
+    return versions + [stat_key(stdin_fields('transcript_path')[0])]
+
+def _get_project_usage_locked():
+    state = current_render()
+    if state.project_usage is not None:
+        return state.project_usage
+
+    folders = find_project_folders()
+    # 守护进程中：文件夹没有任何变化时不再逐个 stat transcript
+    watch_key = project_watch_key(folders)
+    watched = _watched_project_usage.get(tuple(folders))
+    if watch_key is not None and watched and watched[0] == watch_key:
+        state.project_usage = watched[1]
+        return state.project_usage
+
+    usage = get_project_usage_from_db(folders)
+    if usage is None:
+        usage = scan_project_usage(folders)
+    state.project_usage = usage
+    if watch_key is not None and not usage.get('indexing') and not usage.get('pending'):
+        _watched_project_usage[tuple(folders)] = (watch_key, usage)
+    return usage
+
+def scan_project_usage(folders):
+    """用 JSON 检查点缓存汇总项目文件夹的用量"""
+    usage = {'tokens': 0, 'cost': 0.0, 'sessions': {}}
+    for agg in scan_transcripts(folders).values():
+        usage['tokens'] += agg['tokens']
+        usage['cost'] += agg['cost']
+        # 合并各文件中同一会话的时间跨度
+        for session_id, (first, last) in agg['sessions'].items():
+            span = usage['sessions'].get(session_id)
+            if span is None:
+                usage['sessions'][session_id] = [first, last]
+            else:
+                span[0] = min(span[0], first)
+                span[1] = max(span[1], last)
+    return usage
+
+def format_token_total(tokens):
+    """格式化累计token显示：1.2M / 3.4k"""
+    if tokens >= 1000000:
+        return f"{tokens/1000000:.1f}M"
+    elif tokens >= 1000:
+        return f"{tokens/1000:.1f}k"
     else:
-        return str(project_tokens)
+        return str(tokens)
+
+@safe_execute("0k")
+def get_project_token_info():
+    """获取项目token信息 - 基于本地项目文件增量计算"""
+    return format_token_total(get_project_usage()['tokens'])
 
 @safe_execute("$0.00")
 def get_project_cost():
-    """获取本目录消耗的费用 - 基于本地项目文件计算"""
-    current_dir_path = os.getcwd()
-    current_dir_name = os.path.basename(current_dir_path) or 'unknown'
-    
-    # Windows路径转换 - 修复Claude项目文件夹命名规则
-    if current_dir_path.startswith('/c/'):
-        # bash格式路径 /c/Users/Administrator -> C:\Users\Administrator
-        windows_path = 'C:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('/d/'):
-        # bash格式路径 /d/IP_tracker -> D:\IP_tracker
-        windows_path = 'D:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('C:') or current_dir_path.startswith('D:'):
-        # 已经是Windows格式
-        windows_path = current_dir_path
-    else:
-        windows_path = current_dir_path
-    
-    # Claude项目文件夹命名规则: C:\Users\Administrator -> C--Users-Administrator
-    claude_folder_name = windows_path.replace(':', '--').replace('\\', '-')
-    
-    # 修复下划线和短横线的匹配问题
-    claude_folder_name_alt = claude_folder_name.replace('_', '-')
-    
-    project_dir_patterns = [
-        claude_folder_name,
-        claude_folder_name_alt,
-        current_dir_name,
-        current_dir_name.replace('_', '-'),  # IP_tracker -> IP-tracker
-        current_dir_name.replace('-', '_')   # IP-tracker -> IP_tracker  
-    ]
-    
-    projects_dir = os.path.expanduser('~/.claude/projects')
-    if not os.path.exists(projects_dir):
-        return "$0.00"
-    
-    project_cost = 0
-    
-    # 在projects目录中查找匹配当前目录的文件夹
-    for folder_name in os.listdir(projects_dir):
-        folder_path = os.path.join(projects_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue
-            
-        # 检查文件夹名是否包含当前目录的路径信息
-        is_current_project = False
-        for pattern in project_dir_patterns:
-            if pattern in folder_name:
-                is_current_project = True
-                break
-        
-        if is_current_project:
-            # 统计该项目文件夹中所有jsonl文件的费用
-            for file_name in os.listdir(folder_path):
-                if file_name.endswith('.jsonl'):
-                    file_path = os.path.join(folder_path, file_name)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            lines = f.readlines()
-                        
-                        for line in lines:
-                            data = json.loads(line.strip())
-                            if data.get('type') == 'assistant' and data.get('message', {}).get('usage'):
-                                usage = data['message']['usage']
-                                input_tokens = usage.get('input_tokens', 0)
-                                output_tokens = usage.get('output_tokens', 0)
-                                cache_read_tokens = usage.get('cache_read_input_tokens', 0)
-                                cache_create_tokens = usage.get('cache_create_input_tokens', 0)
-                                
-                                # 费用计算（包含所有4种tokens）
-                                # input: $3/M, output: $15/M, cache_read: $0.3/M, cache_create: $3.75/M
-                                cost = (
-                                    input_tokens * 3.0 / 1000000 +
-                                    output_tokens * 15.0 / 1000000 +
-                                    cache_read_tokens * 0.3 / 1000000 +
-                                    cache_create_tokens * 3.75 / 1000000
-                                )
-                                project_cost += cost
-                    except:
-                        continue
-    
+    """获取本目录消耗的费用 - 基于本地项目文件增量计算"""
+    project_cost = get_project_usage()['cost']
     return f"${project_cost:.2f}"
 
 @safe_execute("0h")
 def get_project_time():
     """获取本目录实际工作时间 - 基于会话计算"""
-    current_dir_path = os.getcwd()
-    current_dir_name = os.path.basename(current_dir_path) or 'unknown'
-    
-    # Windows路径转换 - 修复Claude项目文件夹命名规则
-    if current_dir_path.startswith('/c/'):
-        # bash格式路径 /c/Users/Administrator -> C:\Users\Administrator
-        windows_path = 'C:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('/d/'):
-        # bash格式路径 /d/IP_tracker -> D:\IP_tracker
-        windows_path = 'D:' + current_dir_path[2:].replace('/', '\\')
-    elif current_dir_path.startswith('C:') or current_dir_path.startswith('D:'):
-        # 已经是Windows格式
-        windows_path = current_dir_path
-    else:
-        windows_path = current_dir_path
-    
-    # Claude项目文件夹命名规则: C:\Users\Administrator -> C--Users-Administrator
-    claude_folder_name = windows_path.replace(':', '--').replace('\\', '-')
-    
-    # 修复下划线和短横线的匹配问题
-    claude_folder_name_alt = claude_folder_name.replace('_', '-')
-    
-    project_dir_patterns = [
-        claude_folder_name,
-        claude_folder_name_alt,
-        current_dir_name,
-        current_dir_name.replace('_', '-'),  # IP_tracker -> IP-tracker
-        current_dir_name.replace('-', '_')   # IP-tracker -> IP_tracker  
-    ]
-    
-    projects_dir = os.path.expanduser('~/.claude/projects')
-    if not os.path.exists(projects_dir):
-        return "0h"
-    
-    all_sessions = {}  # sessionId -> [timestamps]
-    
-    # 在projects目录中查找匹配当前目录的文件夹
-    for folder_name in os.listdir(projects_dir):
-        folder_path = os.path.join(projects_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue
-            
-        # 检查文件夹名是否包含当前目录的路径信息
-        is_current_project = False
-        for pattern in project_dir_patterns:
-            if pattern in folder_name:
-                is_current_project = True
-                break
-        
-        if is_current_project:
-            # 遍历该项目文件夹中所有jsonl文件，按会话收集时间戳
-            for file_name in os.listdir(folder_path):
-                if file_name.endswith('.jsonl'):
-                    file_path = os.path.join(folder_path, file_name)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            lines = f.readlines()
-                        
-                        for line in lines:
-                            data = json.loads(line.strip())
-                            session_id = data.get('sessionId')
-                            timestamp_str = data.get('timestamp')
-                            if session_id and timestamp_str:
-                                try:
-                                    # 解析ISO 8601格式的时间字符串
-                                    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).timestamp()
-                                    if session_id not in all_sessions:
-                                        all_sessions[session_id] = []
-                                    all_sessions[session_id].append(timestamp)
-                                except:
-                                    continue
-                    except:
-                        continue
-    
     total_work_time = 0
-    
+
     # 计算每个会话的工作时间
-    for session_id, timestamps in all_sessions.items():
-        if len(timestamps) >= 2:
-            timestamps.sort()
-            # 每个会话的工作时间 = 最后一条记录 - 第一条记录
-            session_time = timestamps[-1] - timestamps[0]
-            # 限制单个会话最长8小时（防止长时间未关闭的会话影响统计）
-            session_time = min(session_time, 8 * 3600)
-            total_work_time += session_time
-    
+    for session_id, (first, last) in get_project_sessions().items():
+        # 每个会话的工作时间 = 最后一条记录 - 第一条记录
+        session_time = last - first
+        # 限制单个会话最长8小时（防止长时间未关闭的会话影响统计）
+        session_time = min(session_time, 8 * 3600)
+        total_work_time += session_time
+
     if total_work_time > 0:
         hours = total_work_time / 3600  # 转换为小时
-        
+
         # 格式化显示
         if hours >= 1:
             return f"{hours:.1f}h"
         else:
             minutes = hours * 60
             return f"{minutes:.0f}m"
-    
+
     return "0h"
 
 @safe_execute(None)
@@ -852,7 +2784,7 @@ def get_account_pool_summary():
             if not bearer_token:
                 return None
 
-        response = requests.get(
+        response = http_get(
             'https://super-yi.com/user-api/account-pool/summary?model=claude-sonnet-4-5-20250929',
             headers={
                 'accept': 'application/json, text/plain, */*',
@@ -886,7 +2818,7 @@ def get_account_pool_summary():
             # 重新登录再试一次
             bearer_token = login_super_yi()
             if bearer_token:
-                response = requests.get(
+                response = http_get(
                     'https://super-yi.com/user-api/account-pool/summary?model=claude-sonnet-4-5-20250929',
                     headers={
                         'accept': 'application/json, text/plain, */*',
@@ -996,273 +2928,378 @@ def get_current_time():
 # 新功能：5点功能增强
 # ================================
 
+def find_active_transcript():
+    """定位当前会话的 transcript 文件
+
+    优先使用 Claude Code 传入的 transcript_path；没有时取项目文件夹中最新的、含 user 消息的
+    对话文件（排除 agent- 开头的文件和只有 summary 的文件）。按修改时间从新到旧检查，
+    检查点未变化时直接用缓存的消息数，否则从文件末尾向前找 user 消息，通常只需读几行。
+    """
+    claude_input = render_input()
+    transcript_path = claude_input.get('transcript_path') if isinstance(claude_input, dict) else None
+    if transcript_path and os.path.isfile(transcript_path):
+        return transcript_path
+
+    folders = find_project_folders()
+    candidates = []
+    for file_path in list_transcript_files(folders):
+        if os.path.basename(file_path).startswith('agent-'):
+            continue
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        candidates.append((st.st_mtime, file_path, (st.st_ino, st.st_size, st.st_mtime)))
+    candidates.sort(reverse=True)
+
+    checkpoints = load_transcript_checkpoints(folders) if candidates else {}
+    for _, file_path, file_state in candidates:
+        checkpoint = checkpoints.get(file_path)
+        if checkpoint and checkpoint[:3] == file_state:
+            if checkpoint[3] > 0:
+                return file_path
+            continue
+        try:
+            if transcript_has_user_message(file_path):
+                return file_path
+        except (OSError, ValueError):
+            continue
+    return None
+
 @safe_execute("💬0")
 def get_session_message_count():
-    """获取本次会话消息轮数"""
-    # 定位当前项目的文件夹
-    current_dir_path = os.getcwd()
-
-    # 统一转换为 Claude 项目文件夹命名格式
-    # C:\Users\Administrator -> C--Users-Administrator
-    # /c/Users/Administrator -> C--Users-Administrator
-    if current_dir_path.startswith('/c/'):
-        # bash格式: /c/Users/Administrator
-        claude_folder_name = 'C--' + current_dir_path[3:].replace('/', '-')
-    elif current_dir_path.startswith('/d/'):
-        claude_folder_name = 'D--' + current_dir_path[3:].replace('/', '-')
-    elif len(current_dir_path) > 2 and current_dir_path[1] == ':':
-        # Windows格式: C:\Users\Administrator
-        drive = current_dir_path[0].upper()
-        path_part = current_dir_path[3:].replace('\\', '-').replace('/', '-')
-        claude_folder_name = f'{drive}--{path_part}'
-    else:
-        claude_folder_name = current_dir_path.replace('/', '-').replace('\\', '-')
-
-    projects_dir = os.path.expanduser('~/.claude/projects')
-    if not os.path.exists(projects_dir):
-        return colorize("💬", Colors.BRIGHT_CYAN) + colorize("0", Colors.WHITE)
-
-    # 找到当前项目对应的文件夹
-    target_folder = None
-    for folder_name in os.listdir(projects_dir):
-        if claude_folder_name in folder_name or folder_name in claude_folder_name:
-            target_folder = os.path.join(projects_dir, folder_name)
-            break
-
-    if not target_folder or not os.path.isdir(target_folder):
+    """获取本次会话消息轮数（只增量读取当前会话的 transcript）"""
+    file_path = find_active_transcript()
+    message_count = get_transcript_user_messages(file_path) if file_path else 0
+    if message_count <= 0:
         return colorize("💬", Colors.BRIGHT_CYAN) + colorize("0", Colors.WHITE)
 
-    # 在项目文件夹中找最新的对话文件
-    # 排除: agent- 开头的文件、只有 summary 的文件
-    candidate_files = []
-
-    for file_name in os.listdir(target_folder):
-        if file_name.endswith('.jsonl') and not file_name.startswith('agent-'):
-            file_path = os.path.join(target_folder, file_name)
-            mtime = os.path.getmtime(file_path)
-            # 检查文件是否包含 user 消息（快速检查前几行）
-            has_user = False
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for i, line in enumerate(f):
-                        if i > 20:  # 只检查前20行
-                            break
-                        if '"type":"user"' in line or '"type": "user"' in line:
-                            has_user = True
-                            break
-            except:
-                pass
-            if has_user:
-                candidate_files.append((mtime, file_path))
-
-    if not candidate_files:
-        return colorize("💬", Colors.BRIGHT_CYAN) + colorize("0", Colors.WHITE)
-
-    # 选择最新的对话文件
-    candidate_files.sort(reverse=True)
-    latest_file = candidate_files[0][1]
-
-    # 统计该文件中所有 user 消息数量
-    message_count = 0
-    try:
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    if data.get('type') == 'user':
-                        message_count += 1
-                except:
-                    continue
-    except:
-        pass
-
     # 颜色根据轮数变化
-    if message_count >= 50:
+    messages_warn, messages_danger = layout_thresholds('messages')
+    if message_count >= messages_danger:
         count_color = Colors.RED
-    elif message_count >= 20:
+    elif message_count >= messages_warn:
         count_color = Colors.YELLOW
     else:
         count_color = Colors.WHITE
 
     return colorize("💬", Colors.BRIGHT_CYAN) + colorize(str(message_count), count_color, bold=True)
 
-# 全局变量存储API响应时间
-_api_response_time = None
+# 配额缓存文件（所有渲染进程共享），以及后台刷新锁
+CUBENCE_CACHE_FILE = os.path.expanduser('~/.claude/.cubence_cache.json')
+CUBENCE_REFRESH_LOCK = os.path.expanduser('~/.claude/.cubence_refresh.lock')
+# 刷新锁超过该时长视为残留（秒），允许重新刷新
+CUBENCE_REFRESH_LOCK_TIMEOUT = 30
+
+# 配额历史：每次请求到的样本追加进固定大小的二进制环形缓冲区，用于估算消耗速度和用完时间
+QUOTA_RING_FILE = os.path.expanduser('~/.claude/.cubence_quota.ring')
+QUOTA_RING_MAGIC = b'CQR1'
+# 最多保留的样本数（按 60 秒刷新一次约 17 小时，文件固定约 56KB）
+QUOTA_RING_CAPACITY = 1024
+# 文件头：魔数、容量、累计写入条数
+QUOTA_RING_HEADER = '<4sII'
+# 每条样本：请求时间，5小时窗口 used/limit/reset_at，周窗口 used/limit/reset_at
+QUOTA_RING_RECORD = '<7d'
+# 估算消耗速度时回看的时长（秒），以及样本至少要跨越的时长（秒）
+QUOTA_BURN_LOOKBACK = {'five_hour': 3600, 'weekly': 86400}
+QUOTA_BURN_MIN_SPAN = 300
 
 @safe_execute(None)
-def get_claude_api_stats_with_timing():
-    """获取Claude API统计信息并记录响应时间"""
-    global _api_response_time
-    try:
-        start_time = time.time()
-        response = requests.get(
-            'https://cubence.com/api/v1/user/subscription-info',
-            headers={
-                'Accept': '*/*',
-                'Authorization': CUBENCE_API_KEY,
-                'Content-Type': 'application/json'
+def fetch_cubence_subscription():
+    """请求 Cubence 订阅配额，成功时写入缓存并返回缓存条目"""
+    start_time = time.time()
+    response = http_get(
+        f'{CUBENCE_API_BASE}/api/v1/user/subscription-info',
+        headers={
+            'Accept': '*/*',
+            'Authorization': CUBENCE_API_KEY,
+            'Content-Type': 'application/json'
+        },
+        timeout=5
+    )
+    end_time = time.time()
+
+    # 非 2xx 作为异常交给 safe_execute 统计，避免长期"获取失败"却看不出原因
+    response.raise_for_status()
+    result = response.json()
+    subscription = result.get('subscription_window', {})
+    five_hour = subscription.get('five_hour', {})
+    weekly = subscription.get('weekly', {})
+
+    entry = {
+        'fetched_at': end_time,
+        'response_ms': int((end_time - start_time) * 1000),  # 转换为毫秒
+        'data': {
+            'five_hour': {
+                'limit': five_hour.get('limit', 0),
+                'remaining': five_hour.get('remaining', 0),
+                'used': five_hour.get('used', 0),
+                'reset_at': five_hour.get('reset_at', 0)
             },
-            timeout=5
-        )
-        end_time = time.time()
-        _api_response_time = int((end_time - start_time) * 1000)  # 转换为毫秒
+            'weekly': {
+                'limit': weekly.get('limit', 0),
+                'remaining': weekly.get('remaining', 0),
+                'used': weekly.get('used', 0),
+                'reset_at': weekly.get('reset_at', 0)
+            }
+        }
+    }
+    save_json_file(CUBENCE_CACHE_FILE, entry)
+    append_quota_sample(entry)
+    return entry
+
+def lock_file_exclusive(f):
+    """对已打开的文件加排他锁（进程退出或文件关闭时释放），没有 fcntl 的平台跳过"""
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
 
-        if response.status_code == 200:
-            result = response.json()
-            subscription = result.get('subscription_window', {})
-            five_hour = subscription.get('five_hour', {})
-            weekly = subscription.get('weekly', {})
+def lock_file_shared(f):
+    """对已打开的文件加共享锁（读取期间不会被写入，文件关闭时释放），没有 fcntl 的平台跳过"""
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
 
-            return {
-                'five_hour': {
-                    'limit': five_hour.get('limit', 0),
-                    'remaining': five_hour.get('remaining', 0),
-                    'used': five_hour.get('used', 0),
-                    'reset_at': five_hour.get('reset_at', 0)
-                },
-                'weekly': {
-                    'limit': weekly.get('limit', 0),
-                    'remaining': weekly.get('remaining', 0),
-                    'used': weekly.get('used', 0),
-                    'reset_at': weekly.get('reset_at', 0)
-                }
-            }
-    except:
-        _api_response_time = None
-    return None
+@safe_execute(None)
+def append_quota_sample(entry):
+    """把一次配额样本写入环形缓冲区（覆盖最旧的一条，文件大小固定）"""
+    import struct
+    header_size = struct.calcsize(QUOTA_RING_HEADER)
+    record_size = struct.calcsize(QUOTA_RING_RECORD)
+    five_hour = entry['data']['five_hour']
+    weekly = entry['data']['weekly']
+    record = struct.pack(
+        QUOTA_RING_RECORD, entry['fetched_at'],
+        five_hour['used'], five_hour['limit'], five_hour['reset_at'],
+        weekly['used'], weekly['limit'], weekly['reset_at']
+    )
+
+    fd = os.open(QUOTA_RING_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, 'r+b') as f:
+        lock_file_exclusive(f)
+        head = f.read(header_size)
+        count = 0
+        if len(head) == header_size:
+            magic, capacity, count = struct.unpack(QUOTA_RING_HEADER, head)
+            if magic != QUOTA_RING_MAGIC or capacity != QUOTA_RING_CAPACITY:
+                # 格式或容量变化：清空重建
+                count = 0
+                f.truncate(0)
+        f.seek(header_size + (count % QUOTA_RING_CAPACITY) * record_size)
+        f.write(record)
+        f.seek(0)
+        f.write(struct.pack(QUOTA_RING_HEADER, QUOTA_RING_MAGIC, QUOTA_RING_CAPACITY, count + 1))
+
+def read_quota_samples():
+    """读取环形缓冲区中的全部样本，按时间从旧到新排列"""
+    import struct
+    header_size = struct.calcsize(QUOTA_RING_HEADER)
+    record_size = struct.calcsize(QUOTA_RING_RECORD)
+    try:
+        with open(QUOTA_RING_FILE, 'rb') as f:
+            # 写入时先写样本再写文件头，加共享锁避免读到只写了一半的状态
+            lock_file_shared(f)
+            data = f.read(header_size + QUOTA_RING_CAPACITY * record_size)
+    except OSError:
+        return []
+    if len(data) < header_size:
+        return []
+    magic, capacity, count = struct.unpack_from(QUOTA_RING_HEADER, data)
+    if magic != QUOTA_RING_MAGIC or capacity != QUOTA_RING_CAPACITY:
+        return []
+
+    stored = min(count, capacity, (len(data) - header_size) // record_size)
+    samples = [struct.unpack_from(QUOTA_RING_RECORD, data, header_size + i * record_size) for i in range(stored)]
+    if count > capacity:
+        # 已经绕回：下一条写入位置上是最旧的样本
+        start = count % capacity
+        samples = samples[start:] + samples[:start]
+    return samples
+
+def quota_burn_rate(samples, window):
+    """按本地配额历史估算窗口的消耗速度
+
+    从最新样本往回取回看时长内、额度不变且用量没有回落（窗口未重置）的样本，
+    返回 (每小时消耗额度的比例, 预计用完的时间戳或 None)；样本跨度不足时返回 None。
+    """
+    offset = 1 if window == 'five_hour' else 4
+    newest = samples[-1]
+    newest_time, newest_used, limit = newest[0], newest[offset], newest[offset + 1]
+    if limit <= 0:
+        return None
+
+    oldest = newest
+    for sample in reversed(samples[:-1]):
+        if (newest_time - sample[0] > QUOTA_BURN_LOOKBACK[window] or sample[offset + 1] != limit
+                or sample[offset] > oldest[offset]):
+            break
+        oldest = sample
+
+    span = newest_time - oldest[0]
+    if span < QUOTA_BURN_MIN_SPAN:
+        return None
+    rate = (newest_used - oldest[offset]) / span
+    if rate <= 0:
+        return (0.0, None)
+    return (rate * 3600 / limit, newest_time + max(limit - newest_used, 0) / rate)
+
+@safe_execute(None)
+def get_quota_burn():
+    """5小时窗口和周窗口的消耗速度与用完时间（只读本地配额历史，不额外请求）"""
+    samples = read_quota_samples()
+    if len(samples) < 2:
+        return None
+    return {window: quota_burn_rate(samples, window) for window in ('five_hour', 'weekly')}
+
+def refresh_quota_cache():
+    """后台刷新配额缓存（持有刷新锁期间执行）"""
+    try:
+        fetch_cubence_subscription()
+    finally:
+        release_lock_file(CUBENCE_REFRESH_LOCK)
+
+def trigger_quota_refresh():
+    """缓存过期时在后台刷新，同一时间只允许一个刷新任务"""
+    if not acquire_lock_file(CUBENCE_REFRESH_LOCK, CUBENCE_REFRESH_LOCK_TIMEOUT):
+        return
+
+    # 守护进程常驻，用线程刷新；普通渲染进程马上退出，交给独立子进程刷新
+    if _daemon_mode:
+        threading.Thread(target=refresh_quota_cache, daemon=True).start()
+    else:
+        with trace_span('spawn --refresh-quota', 'subprocess'):
+            spawn_background('--refresh-quota')
+
+@safe_execute(None)
+def get_claude_api_stats_with_timing():
+    """获取Claude API统计信息并记录响应时间（stale-while-revalidate 磁盘缓存）"""
+    state = current_render()
+    entry = load_json_file(CUBENCE_CACHE_FILE, None)
+    age = time.time() - entry['fetched_at'] if isinstance(entry, dict) and entry.get('data') else None
+
+    if age is None or age >= CUBENCE_CACHE_MAX_STALE:
+        # 没有可用缓存：同步请求
+        entry = fetch_cubence_subscription()
+        if not entry:
+            state.api_response_time = None
+            return None
+        age = 0
+    elif age >= CUBENCE_CACHE_TTL:
+        # 缓存已过期但仍可用：先返回旧值，后台刷新
+        trigger_quota_refresh()
+
+    state.api_response_time = entry.get('response_ms')
+    data = dict(entry['data'])
+    data['age'] = max(age, 0)
+    data['burn'] = get_quota_burn()
+    return data
 
 @safe_execute("⚡--")
 def get_api_response_time():
     """获取API响应速度"""
-    global _api_response_time
-    if _api_response_time is None:
+    ms = current_render().api_response_time
+    if ms is None:
         return colorize("⚡", Colors.YELLOW) + colorize("--", Colors.DIM)
 
-    ms = _api_response_time
     # 根据响应时间设置颜色
-    if ms < 200:
+    response_warn, response_danger = layout_thresholds('response_ms')
+    if ms < response_warn:
         time_color = Colors.GREEN
-    elif ms < 500:
+    elif ms < response_danger:
         time_color = Colors.YELLOW
     else:
         time_color = Colors.RED
 
     return colorize("⚡", Colors.BRIGHT_YELLOW) + colorize(f"{ms}ms", time_color)
 
-@safe_execute("")
-def get_git_behind_info():
-    """获取当前分支落后最新分支的commit数"""
-    try:
-        # 先 fetch 更新远程信息（静默）
-        subprocess.run(
-            ['git', 'fetch', '--all', '--quiet'],
-            stderr=subprocess.DEVNULL, timeout=5
-        )
-
-        # 获取当前分支
-        current_branch = subprocess.check_output(
-            ['git', 'branch', '--show-current'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        # 获取所有远程分支，按最新提交时间排序
-        result = subprocess.check_output(
-            ['git', 'for-each-ref', '--sort=-committerdate', 'refs/remotes/origin/', '--format=%(refname:short)'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        if not result:
-            return ""
-
-        branches = result.split('\n')
-        if not branches:
-            return ""
-
-        # 最新的远程分支
-        latest_branch = branches[0]
-
-        # 如果最新分支就是当前分支的远程，不显示
-        if latest_branch == f"origin/{current_branch}":
-            return ""
-
-        # 计算当前分支落后最新分支多少commit
-        behind_count = subprocess.check_output(
-            ['git', 'rev-list', '--count', f'HEAD..{latest_branch}'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
+def update_behind_cache(repo, fetch=False):
+    """计算落后最新分支的提交数并写回 git 状态缓存，返回缓存条目
+
+    提交时间按 SHA、落后数按 "HEAD..最新分支" 的 SHA 对缓存，引用不变时不启动 git 进程。
+    fetch 为 True 且距上次 fetch 超过 GIT_FETCH_INTERVAL 时在后台 fetch。
+    """
+    branch, head_sha = read_head(repo)
+    cache = load_json_file(GIT_CACHE_FILE, {})
+    if not isinstance(cache, dict):
+        cache = {}
+    entry = dict(cache.get(repo[0]) or {})
+    entry.update(compute_behind_latest(repo, branch, head_sha, entry))
+    start_fetch = (fetch and time.time() - entry.get('fetched_at', 0) >= GIT_FETCH_INTERVAL
+                   and acquire_lock_file(GIT_FETCH_LOCK, GIT_FETCH_TIMEOUT))
+    if start_fetch:
+        entry['fetched_at'] = time.time()
+
+    if entry != cache.get(repo[0]):
+        cache[repo[0]] = entry
+        while len(cache) > GIT_CACHE_MAX_REPOS:
+            del cache[next(iter(cache))]
+        save_json_file(GIT_CACHE_FILE, cache)
+
+    if start_fetch:
+        # 守护进程常驻，用线程 fetch；普通渲染进程马上退出，交给独立子进程 fetch
+        if _daemon_mode:
+            threading.Thread(target=run_git_fetch, args=(repo[0],), daemon=True).start()
+        else:
+            with trace_span('spawn --git-fetch', 'subprocess'):
+                spawn_background('--git-fetch', repo[0])
+    return entry
 
-        behind = int(behind_count)
-        if behind == 0:
-            return ""
+@safe_execute(None)
+def run_git_fetch(root):
+    """后台 fetch 远程分支并更新落后数缓存（持有 fetch 锁期间执行）"""
+    try:
+        with trace_span('git fetch', 'subprocess', argv=['fetch', '--all', '--quiet']):
+            subprocess.run(
+                ['git', 'fetch', '--all', '--quiet'],
+                cwd=root, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, timeout=GIT_FETCH_TIMEOUT
+            )
+        repo = locate_git_dir(root)
+        if repo:
+            update_behind_cache(repo)
+    finally:
+        release_lock_file(GIT_FETCH_LOCK)
 
-        # 提取分支名（去掉 origin/ 前缀）
-        branch_name = latest_branch.replace('origin/', '')
+@safe_execute("")
+def get_git_behind_info():
+    """获取当前分支落后最新分支的commit数（远程信息由后台定期 fetch 更新）"""
+    repo = locate_git_dir()
+    if not repo:
+        return ""
 
-        # 颜色根据落后数量
-        if behind >= 10:
-            behind_color = Colors.RED
-        elif behind >= 5:
-            behind_color = Colors.YELLOW
-        else:
-            behind_color = Colors.BRIGHT_CYAN
+    behind = update_behind_cache(repo, fetch=True)['behind_latest']
+    if behind == 0:
+        return ""
 
-        return colorize("↓", behind_color) + colorize(str(behind), behind_color, bold=True)
+    # 颜色根据落后数量
+    if behind >= 10:
+        behind_color = Colors.RED
+    elif behind >= 5:
+        behind_color = Colors.YELLOW
+    else:
+        behind_color = Colors.BRIGHT_CYAN
 
-    except:
-        return ""
+    return colorize("↓", behind_color) + colorize(str(behind), behind_color, bold=True)
 
-@safe_execute("📝+0-0")
+@safe_execute(colorize("📝", Colors.DIM) + colorize("+0-0", Colors.DIM))
 def get_today_code_lines():
     """获取今日代码变更行数"""
-    try:
-        # 今日的 git log 统计
-        today_stats = subprocess.check_output(
-            ['git', 'log', '--since=00:00', '--pretty=format:', '--numstat'],
-            stderr=subprocess.DEVNULL, timeout=5, encoding='utf-8'
-        ).strip()
-
-        # 当前未提交的变更
-        unstaged_stats = subprocess.check_output(
-            ['git', 'diff', '--numstat'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        staged_stats = subprocess.check_output(
-            ['git', 'diff', '--cached', '--numstat'],
-            stderr=subprocess.DEVNULL, timeout=2, encoding='utf-8'
-        ).strip()
-
-        added = 0
-        deleted = 0
-
-        # 解析统计结果
-        for stats in [today_stats, unstaged_stats, staged_stats]:
-            if not stats:
-                continue
-            for line in stats.split('\n'):
-                if not line.strip():
-                    continue
-                parts = line.split('\t')
-                if len(parts) >= 2:
-                    try:
-                        a = int(parts[0]) if parts[0] != '-' else 0
-                        d = int(parts[1]) if parts[1] != '-' else 0
-                        added += a
-                        deleted += d
-                    except:
-                        continue
-
-        # 格式化显示
-        if added == 0 and deleted == 0:
-            return colorize("📝", Colors.DIM) + colorize("+0-0", Colors.DIM)
+    state = get_git_state()
+    added = state['added'] if state else 0
+    deleted = state['deleted'] if state else 0
 
-        add_part = colorize(f"+{added}", Colors.GREEN, bold=True)
-        del_part = colorize(f"-{deleted}", Colors.RED, bold=True)
+    # 格式化显示
+    if added == 0 and deleted == 0:
+        return colorize("📝", Colors.DIM) + colorize("+0-0", Colors.DIM)
 
-        return colorize("📝", Colors.BRIGHT_GREEN) + add_part + del_part
+    add_part = colorize(f"+{added}", Colors.GREEN, bold=True)
+    del_part = colorize(f"-{deleted}", Colors.RED, bold=True)
 
-    except:
-        return colorize("📝", Colors.DIM) + colorize("+0-0", Colors.DIM)
+    return colorize("📝", Colors.BRIGHT_GREEN) + add_part + del_part
 
 @safe_execute("")
 def get_shell_and_mcp_status():
@@ -1271,6 +3308,7 @@ def get_shell_and_mcp_status():
 
     # === 后台 Shell 数量 ===
     # 尝试从 Claude Code 的数据中获取
+    claude_input = render_input()
     shell_count = 0
     if claude_input and claude_input.get('background_shells'):
         shell_count = len(claude_input['background_shells'])
@@ -1320,53 +3358,528 @@ def get_shell_and_mcp_status():
 
     return " ".join(result_parts) if result_parts else ""
 
-def main():
-    """主函数"""
+# ================================
+# 分段并行渲染
+# ================================
+
+# 各分段的时间预算（秒）：超时的分段不再等待，显示上次的值或占位符
+SEGMENT_DEADLINES = {
+    'quota': 1.5,
+    # 比 git status 的超时多留出读取 HEAD、计算代码行数和写缓存的时间，超时降级能在预算内完成
+    'git': GIT_STATUS_TIMEOUT + 0.4,
+    'project': 1.0,
+    'project_time': 1.0,
+    'session': 0.5,
+    'shell_mcp': 0.3,
+    'global': 0.3,
+}
+DEFAULT_SEGMENT_DEADLINE = 0.5
+
+# 分段缓存（按工作目录保存）：各分段最近一次算出的结果、时间和失效输入，
+# 未过期的分段直接使用，超时的分段也用它顶替
+SEGMENT_CACHE_FILE = os.path.expanduser('~/.claude/.status_segment_cache.json')
+# 最多保留多少个工作目录的结果
+SEGMENT_CACHE_MAX_DIRS = 50
+# 普通渲染进程输出后马上退出，超时的分段线程随之结束；这些分段交给独立后台进程算完，
+# 结果写入分段缓存（同一时间只允许一个补算任务，锁超过该时长视为残留，秒）
+SEGMENT_FINISH_LOCK = os.path.expanduser('~/.claude/.status_segment_finish.lock')
+SEGMENT_FINISH_LOCK_TIMEOUT = 300
+
+def reset_render_state():
+    """沿用传入的 JSON 开始新的一次渲染，清空单次渲染内的缓存
+
+    换成新的状态对象而不是原地清空，仍在运行的上一次渲染的分段线程不会写入本次渲染。
+    """
+    global _render_state
+    _render_state = RenderState(_render_state.input)
+
+def run_segments(segments, last_values):
+    """在后台线程中并行执行各分段，按各自的时间预算收集结果
+
+    segments: [(名称, 函数, 占位符, 超时回调)]
+    last_values: {名称: 上次的结果}
+    超时的分段显示上次的结果，没有则显示占位符；线程继续在后台运行，
+    但不再阻塞本次渲染（线程为 daemon，进程退出时直接结束）。
+    返回 ({名称: 显示的值}, {名称: 本次算出的可缓存的值}, [超时的分段])
+    """
+    start = time.time()
+    state = current_render()
+    results = {}
+    cacheable = {}
+    finished_at = {}
+    events = {}
+    for name, func, _, _ in segments:
+        event = threading.Event()
+
+        def target(name=name, func=func, event=event):
+            # 绑定本次渲染的状态：超时后线程继续运行，也只会写入本次渲染
+            _render_local.state = state
+            try:
+                with trace_span(name, 'render'):
+                    results[name], cacheable[name] = call_segment(func)
+            finally:
+                finished_at[name] = time.time()
+                event.set()
+
+        threading.Thread(target=target, name=f"segment-{name}", daemon=True).start()
+        events[name] = event
+
+    values = {}
+    fresh = {}
+    late = []
+    for name, _, placeholder, on_timeout in segments:
+        deadline = SEGMENT_DEADLINES.get(name, DEFAULT_SEGMENT_DEADLINE)
+        remaining = start + deadline - time.time()
+        finished = events[name].wait(max(remaining, 0))
+        # 超出时间预算的分段计为 SegmentTimeout，在 --stats 中可见
+        if finished:
+            record_call(f"segment:{name}", (finished_at[name] - start) * 1000)
+        else:
+            record_call(f"segment:{name}", deadline * 1000, 'SegmentTimeout', f"超过 {deadline}s 时间预算")
+        if finished and results.get(name) is not None:
+            values[name] = results[name]
+            if cacheable[name]:
+                fresh[name] = results[name]
+        else:
+            values[name] = last_values.get(name, placeholder)
+            if not finished:
+                late.append(name)
+            if on_timeout:
+                on_timeout()
+
+    return values, fresh, late
+
+def stat_key(path):
+    """文件的失效输入：[修改时间(ns), 大小]，不存在时为 None"""
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except (OSError, TypeError):
+        return None
+
+def stdin_fields(*names):
+    """从Claude Code传入的 JSON 中取出若干字段（作为分段的失效输入）"""
+    claude_input = render_input()
+    data = claude_input if isinstance(claude_input, dict) else {}
+    return [data.get(name) for name in names]
+
+def transcript_inputs():
+    """当前会话的失效输入：session_id、transcript 路径及其修改时间和大小
+
+    没有传入 transcript_path 时返回 None（每次都重新计算）。
+    """
+    session_id, transcript_path = stdin_fields('session_id', 'transcript_path')
+    if not transcript_path:
+        return None
+    return [session_id, transcript_path, stat_key(transcript_path)]
+
+def project_inputs():
+    """项目用量的失效输入：当前会话 transcript，以及项目文件夹（新增会话文件时变化）"""
+    return (transcript_inputs() or []) + [stat_key(folder) for folder in find_project_folders()]
+
+def git_inputs():
+    """git 分段的失效输入：仓库根目录和仓库指纹（HEAD、index、引用）"""
+    repo = locate_git_dir()
+    return [repo[0], git_cache_key(repo)] if repo else None
+
+def segment_inputs(get_inputs, signature):
+    """计算分段的失效输入并序列化为字符串（带上布局签名）；没有输入或出错时返回 None（视为已失效）"""
+    try:
+        inputs = get_inputs() if get_inputs else []
+        if inputs is None:
+            return None
+        return json.dumps([signature, inputs], sort_keys=True, ensure_ascii=False)
+    except Exception:
+        return None
+
+def render_segments(plan):
+    """按各分段的 TTL 和失效输入调度，只重新计算过期的分段
+
+    未超过 TTL 且失效输入与上次相同的分段直接使用分段缓存，不执行分段函数；
+    派生分段（SEGMENT_FOLLOWS）随所依赖的分段一起重新计算或使用缓存。
+    失败值和占位值（获取失败、indexing… 等）只显示不缓存，下次重新计算。
+    """
+    names = plan['order']
+    ttls = plan['ttls']
+    cwd = current_render().cwd
+    all_cache, cache = load_segment_cache(cwd)
+    now = time.time()
+
+    values = {}
+    inputs = {}
+    for name in names:
+        if name in SEGMENT_FOLLOWS:
+            continue
+        inputs[name] = segment_inputs(SEGMENT_CACHE_POLICIES.get(name, (0, None))[1], plan['signature'])
+        entry = cache.get(name)
+        if (entry and inputs[name] is not None and entry.get('inputs') == inputs[name]
+                and 0 <= now - entry.get('at', 0) < ttls.get(name, 0)):
+            values[name] = entry['value']
+    for name in names:
+        leader = SEGMENT_FOLLOWS.get(name)
+        if leader in values:
+            if name in cache:
+                values[name] = cache[name]['value']
+            else:
+                # 派生分段没有缓存（如刚加入布局）时，所依赖的分段也重新计算，否则派生值无从得出
+                del values[leader]
+    for name in values:
+        record_call(f"segment-cache:{name}", 0)
+
+    stale = [name for name in names if name not in values]
+    shown, fresh, late = run_segments([
+        (name, SEGMENTS[name][0], SEGMENTS[name][2](), SEGMENTS[name][3])
+        for name in stale if SEGMENTS[name][1]
+    ], {name: entry['value'] for name, entry in cache.items()})
+    values.update(shown)
+    for name in stale:
+        if name not in values:
+            values[name], cacheable = call_segment(SEGMENTS[name][0])
+            # 派生分段的值来自所依赖的分段，后者不可缓存时派生值也不缓存
+            leader = SEGMENT_FOLLOWS.get(name)
+            if cacheable and (leader is None or leader not in stale or leader in fresh):
+                fresh[name] = values[name]
+
+    changed = False
+    for name in stale:
+        if fresh.get(name) is not None:
+            if ttls.get(name, 0) > 0 or SEGMENTS[name][1] or name in SEGMENT_FOLLOWS:
+                cache[name] = {'value': fresh[name], 'at': now, 'inputs': inputs.get(name)}
+                changed = True
+        elif name in cache and cache[name].get('at'):
+            # 超时的分段保留旧值用于顶替，但标记为已过期，下次重新计算
+            cache[name]['at'] = 0
+            changed = True
+
+    if changed:
+        save_segment_cache(all_cache, cwd, cache)
+
+    # 配额等有超时回调的分段自己负责后台刷新
+    late = [name for name in late if not SEGMENTS[name][3]]
+    if late and not _daemon_mode:
+        trigger_segment_finish(late)
+
+    return values
+
+def load_segment_cache(cwd):
+    """读取分段缓存，返回 (全部目录的缓存, 当前目录的 {名称: 条目})"""
+    all_cache = load_json_file(SEGMENT_CACHE_FILE, {})
+    if not isinstance(all_cache, dict):
+        all_cache = {}
+    cache = all_cache.get(cwd)
+    if not isinstance(cache, dict):
+        cache = {}
+    cache = {name: entry for name, entry in cache.items() if isinstance(entry, dict) and 'value' in entry}
+    return all_cache, cache
+
+def save_segment_cache(all_cache, cwd, cache):
+    """保存当前目录的分段缓存：重新插入使当前目录排在最后，超出上限时淘汰最早的目录"""
+    all_cache.pop(cwd, None)
+    all_cache[cwd] = cache
+    while len(all_cache) > SEGMENT_CACHE_MAX_DIRS:
+        del all_cache[next(iter(all_cache))]
+    save_json_file(SEGMENT_CACHE_FILE, all_cache)
+
+def trigger_segment_finish(names):
+    """把超时的分段交给后台算完，同一时间只允许一个补算任务"""
+    if not acquire_lock_file(SEGMENT_FINISH_LOCK, SEGMENT_FINISH_LOCK_TIMEOUT):
+        return
+    claude_input = render_input()
+    # 守护进程常驻，用线程补算（绑定本次请求的输入和工作目录）；普通渲染进程交给独立子进程
+    if _daemon_mode:
+        state = RenderState(claude_input)
+
+        def target():
+            _render_local.state = state
+            finish_segments(names)
+
+        threading.Thread(target=target, daemon=True).start()
+        return
+    with trace_span('spawn --finish-segments', 'subprocess'):
+        spawn_background('--finish-segments', *names,
+                         stdin_data=json.dumps(claude_input) if claude_input is not None else '')
+
+def finish_segments(names):
+    """后台补算分段（持有补算锁期间执行）：不设时间预算，可缓存的结果写入分段缓存
+
+    补算过程中更新的 transcript 检查点、git 缓存等也会保存下来，下次渲染即可命中。
+    """
     try:
-        # 获取API统计数据（带计时）
-        api_data = get_claude_api_stats_with_timing()
+        current_render().background = True
+        plan = get_render_plan()
+        entries = {}
+        for name in names:
+            if name not in SEGMENTS or name not in plan['order']:
+                continue
+            inputs = segment_inputs(SEGMENT_CACHE_POLICIES.get(name, (0, None))[1], plan['signature'])
+            at = time.time()
+            value, cacheable = call_segment(SEGMENTS[name][0])
+            if value is not None and cacheable:
+                entries[name] = {'value': value, 'at': at, 'inputs': inputs}
+        if entries:
+            # 补算可能耗时较长，在最新的缓存上合并，不覆盖期间其他渲染写入的分段
+            cwd = current_render().cwd
+            all_cache, cache = load_segment_cache(cwd)
+            cache.update(entries)
+            save_segment_cache(all_cache, cwd, cache)
+    finally:
+        release_lock_file(SEGMENT_FINISH_LOCK)
+
+def render_quota_segment():
+    """配额分段：获取API统计数据（带计时）并格式化"""
+    return format_total_cost_display(get_claude_api_stats_with_timing())
+
+@safe_execute(False)
+def is_project_indexing():
+    """项目用量是否还在首次导入中"""
+    return bool(get_project_usage().get('indexing'))
 
-        # 美化的分隔符 - 使用原始的"┃"符号并添加亮色
-        separator = " " + colorize("┃", Colors.BRIGHT_CYAN) + " "
+@safe_execute(None)
+def mark_partial_project_usage():
+    """项目用量还不完整（首次导入或补全未完成）时，项目相关分段的结果不写入分段缓存"""
+    usage = get_project_usage()
+    if usage.get('indexing') or usage.get('pending'):
+        mark_segment_transient()
+
+def render_project_segment():
+    """项目分段：目录名:总token(费用)"""
+    mark_partial_project_usage()
+    if is_project_indexing():
+        # 首次导入在后台进行，先显示占位而不是 0
+        return (
+            colorize("📁", Colors.YELLOW) +
+            colorize(get_project_info(), Colors.BRIGHT_WHITE, bold=True) +
+            colorize(":", Colors.BRIGHT_CYAN) +
+            colorize("indexing…", Colors.DIM)
+        )
+    # 格式：Administrator:2.9M($42.63)
+    return (
+        colorize("📁", Colors.YELLOW) +
+        colorize(get_project_info(), Colors.BRIGHT_WHITE, bold=True) +
+        colorize(":", Colors.BRIGHT_CYAN) +
+        colorize(get_project_token_info(), Colors.GREEN, bold=True) +
+        colorize("(", Colors.BRIGHT_WHITE) +
+        colorize(get_project_cost(), Colors.GREEN) +
+        colorize(")", Colors.BRIGHT_WHITE)
+    )
 
-        # 项目信息组合 - 简化显示
-        project_name = get_project_info()
-        project_tokens = get_project_token_info()
-        project_cost = get_project_cost()
-        project_time = get_project_time()
-
-        # 账户余额显示
-        account_info = format_total_cost_display(api_data)
-
-        # 当前时间
-        current_time = get_current_time()
-
-        # Git信息（已整合：分支+修改数+今日代码行数+落后最新分支）
-        git_info = get_git_info()
-
-        # 新功能：会话消息轮数 + API响应时间 + Shell/MCP状态（合并为一个部分，不用竖线分隔）
-        session_parts = [get_session_message_count(), get_api_response_time()]
-        shell_mcp = get_shell_and_mcp_status()
-        if shell_mcp:
-            session_parts.append(shell_mcp)
-        session_info = " ".join(session_parts)
-
-        # 格式：Administrator:2.9M($42.63) ⏱️ 2.5h 🕐20:49
-        project_info = colorize("📁", Colors.YELLOW) + colorize(project_name, Colors.BRIGHT_WHITE, bold=True) + colorize(":", Colors.BRIGHT_CYAN) + colorize(project_tokens, Colors.GREEN, bold=True) + colorize("(", Colors.BRIGHT_WHITE) + colorize(project_cost, Colors.GREEN) + colorize(") ", Colors.BRIGHT_WHITE) + colorize("⏱️ ", Colors.CYAN) + colorize(project_time, Colors.BRIGHT_CYAN, bold=True) + " " + colorize("🕐", Colors.BRIGHT_CYAN) + colorize(current_time, Colors.BRIGHT_WHITE, bold=True)
-
-        # 按新格式组织信息
-        parts = [
-            account_info,                           # 账户配额（5h + 周）
-            get_model_info(),                       # 模型
-            git_info,                               # git信息（分支+修改数+代码行数+落后分支）
-            get_context_display(),                  # 上下文
-            session_info,                           # 会话轮数 + API响应 + Shell/MCP（无竖线）
-        ]
+def render_project_time_segment():
+    """项目工作时间分段：⏱️ 2.5h（首次导入期间不显示）"""
+    mark_partial_project_usage()
+    if is_project_indexing():
+        return ""
+    return colorize("⏱️ ", Colors.CYAN) + colorize(get_project_time(), Colors.BRIGHT_CYAN, bold=True)
+
+def render_clock_segment():
+    """当前时间分段：🕐 14:05"""
+    return colorize("🕐", Colors.BRIGHT_CYAN) + colorize(get_current_time(), Colors.BRIGHT_WHITE, bold=True)
 
-        parts.append(project_info)                  # 目录信息:目录总token(项目费用) + 时间
+@safe_execute(None)
+def render_global_segment():
+    """全部项目分段：🌐今日:1.2M($3.40) 周:8.5M($22.10) 总:120.3M($310.25)"""
+    usage = get_global_usage()
+    if usage is None:
+        return ""
+    if usage.get('indexing'):
+        mark_segment_transient()
+        return colorize("🌐", Colors.BRIGHT_BLUE) + colorize("indexing…", Colors.DIM)
+
+    parts = []
+    for name, label in (('today', "今日:"), ('week', "周:"), ('total', "总:")):
+        parts.append(
+            colorize(label, Colors.BRIGHT_CYAN) +
+            colorize(format_token_total(usage[name]['tokens']), Colors.GREEN, bold=True) +
+            colorize(f"(${usage[name]['cost']:.2f})", Colors.GREEN)
+        )
+    return colorize("🌐", Colors.BRIGHT_BLUE) + " ".join(parts)
+
+# ================================
+# 状态栏布局
+# ================================
+
+# 默认布局：segments 按顺序列出分段，写成列表的一组分段之间用空格连接、不加分隔符
+DEFAULT_STATUS_LAYOUT = {
+    'segments': [
+        'quota',                                # 账户配额（5h + 周）
+        'model',                                # 模型
+        'git',                                  # git信息（分支+修改数+代码行数+落后分支）
+        'context',                              # 上下文
+        ['session', 'api_time', 'shell_mcp'],   # 会话轮数 + API响应 + Shell/MCP（无竖线）
+        ['project', 'project_time', 'clock'],   # 目录总token(项目费用) + 工作时间 + 当前时间
+    ],
+    'separator': '┃',
+    'separator_color': 'BRIGHT_CYAN',
+    # 颜色阈值（从低到高）
+    'thresholds': {
+        'quota': [0.4, 0.8],          # 配额使用比例：绿 / 黄 / 红
+        'context': [30, 50, 70],      # 上下文百分比：绿 / 蓝 / 黄 / 红
+        'messages': [20, 50],         # 会话消息数：绿 / 黄 / 红
+        'response_ms': [200, 500],    # API 响应毫秒：绿 / 黄 / 红
+        'git_files': [5, 10],         # 变更文件数（超过即变色）：绿 / 黄 / 红
+    },
+}
+
+# 进度条长度，以及当前格子按填充比例分成的 5 种状态（全绿→半绿→全黄→半红→全红）
+PROGRESS_BAR_LENGTH = 10
+PROGRESS_BAR_STEPS = (0.2, 0.4, 0.6, 0.8)
+
+# 分段注册表：名称 -> (函数, 是否并行执行, 超时占位符, 超时回调)
+# 耗时的分段（网络、git 子进程、transcript 扫描、配置读取）并行执行；
+# 配额超时时交给后台进程刷新缓存，下次渲染即可命中
+SEGMENTS = {
+    'quota': (render_quota_segment, True,
+              lambda: colorize("💰", Colors.DIM) + colorize("5h:", Colors.BRIGHT_CYAN) + colorize("…", Colors.DIM),
+              trigger_quota_refresh),
+    'model': (get_model_info, False, None, None),
+    'git': (get_git_info, True, git_placeholder, None),
+    'context': (get_context_display, False, None, None),
+    'session': (get_session_message_count, True, lambda: colorize("💬", Colors.BRIGHT_CYAN) + colorize("…", Colors.DIM), None),
+    # API 响应时间由配额分段测得，放在并行分段之后计算
+    'api_time': (get_api_response_time, False, None, None),
+    'shell_mcp': (get_shell_and_mcp_status, True, lambda: "", None),
+    'project': (render_project_segment, True,
+                lambda: colorize("📁", Colors.YELLOW) + colorize(get_project_info(), Colors.BRIGHT_WHITE, bold=True) + colorize(":…", Colors.DIM),
+                None),
+    'project_time': (render_project_time_segment, True, lambda: "", None),
+    'clock': (render_clock_segment, False, None, None),
+    'global': (render_global_segment, True, lambda: "", None),
+}
+
+# 分段缓存策略：名称 -> (TTL 秒, 失效输入函数)
+# 缓存未超过 TTL 且失效输入（文件修改时间、stdin 字段等）与上次相同时不执行分段；
+# TTL 为 0 的分段每次都重新计算。TTL 可在布局文件的 ttl 中覆盖
+SEGMENT_CACHE_POLICIES = {
+    # 配额随缓存文件刷新而变化，重置倒计时和数据年龄按分钟显示
+    'quota': (20, lambda: [stat_key(CUBENCE_CACHE_FILE), stat_key(QUOTA_RING_FILE)]),
+    'model': (3600, lambda: stdin_fields('model') + [os.environ.get('ANTHROPIC_MODEL')]),
+    # 按仓库指纹失效；设置了 GIT_STATUS_CACHE_TTL 时以它为 TTL
+    'git': (GIT_STATUS_CACHE_TTL or 3600, git_inputs),
+    'context': (3600, lambda: stdin_fields('context_window')),
+    'session': (3600, transcript_inputs),
+    'shell_mcp': (3600, lambda: stdin_fields('background_shells', 'shells') + [stat_key(os.path.expanduser('~/.claude.json'))]),
+    # 同一项目的其他会话写入 transcript 时项目文件夹不变，靠 TTL 兜底
+    'project': (60, project_inputs),
+    'project_time': (300, project_inputs),
+    'clock': (60, lambda: [time.strftime('%H:%M')]),
+    'global': (60, lambda: [time.strftime('%Y-%m-%d')]),
+}
+# 派生分段：API 响应时间由配额分段测得，随配额分段一起重新计算或使用缓存
+SEGMENT_FOLLOWS = {'api_time': 'quota'}
+
+_render_plan = None
+_render_plan_key = None
+_render_plan_lock = threading.Lock()
+
+def load_status_layout():
+    """读取用户布局文件并与默认布局合并，缺少或无效的键使用默认值"""
+    layout = dict(DEFAULT_STATUS_LAYOUT)
+    layout['thresholds'] = dict(DEFAULT_STATUS_LAYOUT['thresholds'])
+    if GLOBAL_USAGE_ENABLED:
+        layout['segments'] = layout['segments'] + ['global']
+
+    user_layout = load_json_file(os.path.expanduser(STATUS_LAYOUT_FILE), {})
+    if not isinstance(user_layout, dict):
+        return layout
+    if isinstance(user_layout.get('segments'), list):
+        layout['segments'] = user_layout['segments']
+    for key in ('separator', 'separator_color'):
+        if key in user_layout:
+            layout[key] = user_layout[key]
+    ttls = user_layout.get('ttl')
+    if isinstance(ttls, dict):
+        layout['ttl'] = {name: ttl for name, ttl in ttls.items() if isinstance(ttl, (int, float)) and ttl >= 0}
+    thresholds = user_layout.get('thresholds')
+    if isinstance(thresholds, dict):
+        for name, values in thresholds.items():
+            default = layout['thresholds'].get(name)
+            if (default is not None and isinstance(values, list) and len(values) == len(default)
+                    and all(isinstance(v, (int, float)) for v in values)):
+                layout['thresholds'][name] = sorted(values)
+    return layout
+
+def compile_render_plan(layout):
+    """把布局编译为渲染计划：分段分组、分隔符和进度条都预先着色好"""
+    groups = []
+    for item in layout['segments']:
+        names = [item] if isinstance(item, str) else item
+        if not isinstance(names, list):
+            continue
+        # 未知的分段名直接忽略
+        group = tuple(name for name in names if isinstance(name, str) and name in SEGMENTS)
+        if group:
+            groups.append(group)
+
+    separator_color = getattr(Colors, str(layout.get('separator_color') or '').upper(), None)
+    separator = " " + colorize(str(layout.get('separator') or ''), separator_color) + " "
+
+    # 进度条：已用完的格子全红、未使用的全绿，当前格子 5 种状态
+    # bars[已填满格数][状态]，状态 0 表示没有正在填充的格子
+    cells = (
+        colorize('█', Colors.GREEN),
+        colorize('▓', Colors.GREEN),
+        colorize('█', Colors.YELLOW),
+        colorize('▓', Colors.RED),
+        colorize('█', Colors.RED),
+    )
+    bars = []
+    for full_blocks in range(PROGRESS_BAR_LENGTH + 1):
+        used = cells[4] * full_blocks
+        states = [used + cells[0] * (PROGRESS_BAR_LENGTH - full_blocks)]
+        if full_blocks < PROGRESS_BAR_LENGTH:
+            for cell in cells:
+                states.append(used + cell + cells[0] * (PROGRESS_BAR_LENGTH - full_blocks - 1))
+        bars.append(tuple(states))
+
+    # 布局签名：阈值或脚本本身变化后，分段缓存中的旧结果全部失效
+    try:
+        script_mtime = os.stat(os.path.abspath(__file__)).st_mtime_ns
+    except OSError:
+        script_mtime = None
+    signature = [script_mtime, layout['thresholds']]
+
+    return {
+        'groups': tuple(groups),
+        'order': tuple(name for group in groups for name in group),
+        'separator': separator,
+        'thresholds': layout['thresholds'],
+        'signature': signature,
+        'ttls': dict({name: policy[0] for name, policy in SEGMENT_CACHE_POLICIES.items()}, **layout.get('ttl', {})),
+        'bars': tuple(bars),
+        'bar_cells': cells,
+    }
+
+def get_render_plan():
+    """返回编译好的渲染计划（进程内缓存，布局文件修改后重新编译）"""
+    global _render_plan, _render_plan_key
+    try:
+        key = os.stat(os.path.expanduser(STATUS_LAYOUT_FILE)).st_mtime_ns
+    except OSError:
+        key = None
+    with _render_plan_lock:
+        if _render_plan is None or key != _render_plan_key:
+            _render_plan = compile_render_plan(load_status_layout())
+            _render_plan_key = key
+        return _render_plan
+
+def layout_thresholds(name):
+    """布局中某项颜色阈值（从低到高的列表）"""
+    return get_render_plan()['thresholds'][name]
+
+def render_status_line():
+    """渲染整条状态栏，返回字符串（只执行布局中列出的分段）"""
+    try:
+        plan = get_render_plan()
+
+        values = render_segments(plan)
+
+        # 组内用空格连接，组与组之间用分隔符；空的分段和空组不显示
+        parts = []
+        for group in plan['groups']:
+            text = " ".join(values[name] for name in group if values[name])
+            if text:
+                parts.append(text)
+        return plan['separator'].join(parts)
 
-        print(separator.join(parts))
-        
     except Exception:
         # 美化的错误回退显示
         fallback_parts = [
@@ -1377,7 +3890,332 @@ def main():
             colorize("📁", Colors.YELLOW) + colorize("unknown", Colors.BRIGHT_WHITE, bold=True) + colorize(":", Colors.BRIGHT_CYAN) + colorize("0k", Colors.GREEN, bold=True) + colorize("(", Colors.BRIGHT_WHITE) + colorize("$0.00", Colors.GREEN) + colorize(") ", Colors.BRIGHT_WHITE) + colorize("⏱️ ", Colors.CYAN) + colorize("0h", Colors.BRIGHT_CYAN, bold=True) + " " + colorize("🕐", Colors.BRIGHT_CYAN) + colorize("00:00", Colors.BRIGHT_WHITE, bold=True)
         ]
         separator = " " + colorize("┃", Colors.BRIGHT_CYAN) + " "
-        print(separator.join(fallback_parts))
+        return separator.join(fallback_parts)
+
+def main():
+    """主函数"""
+    load_claude_input(_client_stdin)
+    with trace_span('render_status_line', 'render'):
+        output = render_status_line()
+    print(output)
+    sys.stdout.flush()
+    write_trace()
+    flush_stats()
+
+# ================================
+# 目录变更监听（守护进程）
+# ================================
+
+# 守护进程中监听项目文件夹和 .git：目录内有变化时对应的版本号加一，版本号没变就沿用上次的
+# 结果，不必每次渲染都 stat 所有文件。Linux 上用 inotify（ctypes 调用 libc），
+# 不可用或超出监听数上限（fs.inotify.max_user_watches）时回退到后台 mtime 轮询
+# 回退轮询的间隔（秒）
+WATCH_POLL_INTERVAL = 1.0
+# 最多监听多少组目录（每个项目文件夹、每个仓库的 .git 和 refs 各算一组）
+WATCH_MAX_GROUPS = 64
+
+# inotify 事件（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_EVENT_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+# struct inotify_event 的固定部分：wd, mask, cookie, len
+INOTIFY_EVENT_HEADER = 'iIII'
+
+_watch_lock = threading.Lock()
+# 监听组：路径 -> {'version': 版本号, 'recursive': 是否包含子目录, 'signature': 轮询签名（inotify 时为 None）}
+_watch_groups = {}
+# inotify 监听描述符 -> (组路径, 目录)
+_watch_descriptors = {}
+# (libc, fd)；None 表示尚未初始化，False 表示不可用
+_inotify = None
+_watch_poller = None
+
+def init_inotify():
+    """创建非阻塞的 inotify 实例，不支持时返回 False"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return False
+    if fd < 0:
+        return False
+    return libc, fd
+
+def inotify_add_tree(group, path, recursive):
+    """为目录（recursive 时连同子目录）添加 inotify 监听，超出上限等失败时返回 False"""
+    libc, fd = _inotify
+    for dir_path in [path] + (list_subdirs(path) if recursive else []):
+        wd = libc.inotify_add_watch(fd, os.fsencode(dir_path), WATCH_EVENT_MASK)
+        if wd < 0:
+            return False
+        _watch_descriptors[wd] = (group, dir_path)
+    return True
+
+def list_subdirs(path):
+    """目录下的所有子目录（递归）"""
+    return [os.path.join(root, name) for root, dirs, _ in os.walk(path) for name in dirs]
+
+def remove_watch_group(group):
+    """移除一组监听（目录被删除或改用轮询时）"""
+    if _inotify:
+        libc, fd = _inotify
+        for wd, (owner, _) in list(_watch_descriptors.items()):
+            if owner == group:
+                del _watch_descriptors[wd]
+                libc.inotify_rm_watch(fd, wd)
+
+def drain_inotify():
+    """读出所有已到达的 inotify 事件，给对应的监听组加版本号"""
+    import struct
+    _, fd = _inotify
+    header_size = struct.calcsize(INOTIFY_EVENT_HEADER)
+    while True:
+        try:
+            buf = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            return
+        offset = 0
+        while offset + header_size <= len(buf):
+            wd, mask, _, name_len = struct.unpack_from(INOTIFY_EVENT_HEADER, buf, offset)
+            name = buf[offset + header_size:offset + header_size + name_len].rstrip(b'\0')
+            offset += header_size + name_len
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出：所有结果都不再可信
+                for group in _watch_groups.values():
+                    group['version'] += 1
+                continue
+            owner = _watch_descriptors.get(wd)
+            if owner is None:
+                continue
+            group_path, dir_path = owner
+            group = _watch_groups.get(group_path)
+            if group is None:
+                continue
+            group['version'] += 1
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                # 被监听的目录已删除或移走：下次访问时重新注册
+                _watch_descriptors.pop(wd, None)
+                if dir_path == group_path:
+                    remove_watch_group(group_path)
+                    group['version'] += 1
+                    group['stale'] = True
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and group['recursive']:
+                # 新建的子目录（例如 refs/heads/feature/）也要监听
+                if not inotify_add_tree(group_path, os.path.join(dir_path, os.fsdecode(name)), True):
+                    switch_to_polling(group_path)
+
+def poll_signature(path, recursive):
+    """目录（recursive 时连同子目录）中各项的修改时间和大小，用于回退轮询"""
+    signature = []
+    for dir_path in [path] + (list_subdirs(path) if recursive else []):
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    st = entry.stat(follow_symlinks=False)
+                    signature.append((entry.path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append((dir_path, None, None))
+    signature.sort()
+    return signature
+
+def switch_to_polling(group_path):
+    """把一组监听改为 mtime 轮询（inotify 不可用或超出监听数上限）"""
+    global _watch_poller
+    remove_watch_group(group_path)
+    group = _watch_groups[group_path]
+    group['signature'] = poll_signature(group_path, group['recursive'])
+    group['version'] += 1
+    if _watch_poller is None:
+        _watch_poller = threading.Thread(target=poll_watched_dirs, name='watch-poller', daemon=True)
+        _watch_poller.start()
+
+def poll_watched_dirs():
+    """后台线程：定期比较轮询组的签名，有变化时加版本号"""
+    while True:
+        time.sleep(WATCH_POLL_INTERVAL)
+        with _watch_lock:
+            polled = [(path, group['recursive']) for path, group in _watch_groups.items()
+                      if group['signature'] is not None]
+        for path, recursive in polled:
+            exists = os.path.isdir(path)
+            signature = poll_signature(path, recursive) if exists else None
+            with _watch_lock:
+                group = _watch_groups.get(path)
+                if group is None or group['signature'] is None:
+                    continue
+                if not exists:
+                    # 目录已删除：下次访问时重新注册
+                    group['version'] += 1
+                    group['stale'] = True
+                elif group['signature'] != signature:
+                    group['signature'] = signature
+                    group['version'] += 1
+
+def watch_version(path, recursive=False):
+    """目录的变更版本号（首次调用时开始监听）；不在守护进程中或超出监听组上限时返回 None
+
+    调用方先取版本号再计算结果，版本号不变时结果仍然有效。
+    """
+    global _inotify
+    if not _daemon_mode:
+        return None
+    with _watch_lock:
+        if _inotify is None:
+            _inotify = init_inotify()
+        if _inotify:
+            drain_inotify()
+
+        group = _watch_groups.get(path)
+        if group is not None and not group.get('stale'):
+            return group['version']
+        if group is None and len(_watch_groups) >= WATCH_MAX_GROUPS:
+            return None
+        if not os.path.isdir(path):
+            return None
+
+        version = group['version'] + 1 if group else 0
+        _watch_groups[path] = {'version': version, 'recursive': recursive, 'signature': None}
+        if not _inotify or not inotify_add_tree(path, path, recursive):
+            switch_to_polling(path)
+        return _watch_groups[path]['version']
+
+# ================================
+# 常驻守护进程
+# ================================
+
+def handle_daemon_request(request):
+    """在守护进程中按客户端的工作目录和环境渲染一次状态栏"""
+    saved_cwd = os.getcwd()
+    saved_env = {name: os.environ.get(name) for name in DAEMON_FORWARD_ENV}
+    try:
+        os.chdir(request.get('cwd') or saved_cwd)
+        request_env = request.get('env') or {}
+        for name in DAEMON_FORWARD_ENV:
+            if name in request_env:
+                os.environ[name] = request_env[name]
+            else:
+                os.environ.pop(name, None)
+        begin_trace()
+        # 每个请求使用新的渲染状态
+        load_claude_input(request.get('stdin'))
+        with trace_span('render_status_line', 'render'):
+            return render_status_line()
+    finally:
+        os.chdir(saved_cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_daemon():
+    """守护进程主循环：串行处理客户端请求，空闲超时或脚本更新后退出"""
+    global _daemon_mode
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return
+    import fcntl
+
+    # 同一时间只允许一个守护进程
+    lock_file = open(DAEMON_LOCK_PATH, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return
+
+    try:
+        os.unlink(DAEMON_SOCKET_PATH)
+    except OSError:
+        pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # 绑定时就只允许当前用户访问，避免 bind 和 chmod 之间其他用户连上来
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(DAEMON_SOCKET_PATH)
+    finally:
+        os.umask(old_umask)
+    os.chmod(DAEMON_SOCKET_PATH, 0o600)
+    server.listen(16)
+    server.settimeout(STATUS_DAEMON_IDLE_TIMEOUT)
+    _daemon_mode = True
+
+    script_path = os.path.abspath(__file__)
+    script_mtime = os.path.getmtime(script_path)
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+
+            try:
+                conn.settimeout(DAEMON_CLIENT_TIMEOUT)
+                chunks = []
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                request = json.loads(b''.join(chunks).decode('utf-8'))
+                output = handle_daemon_request(request)
+                conn.sendall((output + '\n').encode('utf-8'))
+                write_trace()
+                flush_stats()
+            except Exception:
+                pass
+            finally:
+                conn.close()
+
+            # 脚本被更新后退出，下次由客户端拉起新版本
+            try:
+                if os.path.getmtime(script_path) != script_mtime:
+                    break
+            except OSError:
+                break
+    finally:
+        server.close()
+        try:
+            os.unlink(DAEMON_SOCKET_PATH)
+        except OSError:
+            pass
+        # 内存中尚未合并的统计
+        flush_stats(force=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--daemon' in sys.argv:
+        run_daemon()
+    elif '--refresh-quota' in sys.argv:
+        refresh_quota_cache()
+        flush_stats()
+    elif '--index-usage' in sys.argv:
+        run_usage_indexer(sys.argv[sys.argv.index('--index-usage') + 1:])
+        flush_stats()
+    elif '--git-fetch' in sys.argv:
+        run_git_fetch(sys.argv[sys.argv.index('--git-fetch') + 1])
+        flush_stats()
+    elif '--finish-segments' in sys.argv:
+        load_claude_input(sys.stdin.read())
+        finish_segments(sys.argv[sys.argv.index('--finish-segments') + 1:])
+        flush_stats()
+    elif '--stats' in sys.argv:
+        print_stats()
+    else:
+        main()
\ No newline at end of file
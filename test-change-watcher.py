@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录变更监听测试工具
+在临时目录中模拟守护进程，检查 inotify 监听和回退的 mtime 轮询能否及时发现
+transcript 和 .git 的变化，以及项目用量、仓库指纹在没有变化时是否直接复用
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import importlib.util
+import subprocess
+import time
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 回退轮询的间隔（秒），测试中调小以缩短等待
+POLL_INTERVAL = 0.1
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def print_warning(text):
+    """打印警告信息"""
+    print(f"{Colors.YELLOW}⚠ {text}{Colors.RESET}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+def load_status_script(home, name):
+    """在临时 HOME 下导入状态栏脚本，并标记为守护进程模式"""
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    os.makedirs(os.path.join(home, '.claude'), exist_ok=True)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_DIR, 'status-final.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module._daemon_mode = True
+    module.WATCH_POLL_INTERVAL = POLL_INTERVAL
+    return module
+
+def assistant_line(tokens):
+    return json.dumps({
+        'type': 'assistant', 'sessionId': 's1', 'timestamp': '2026-01-01T00:00:00.000Z',
+        'message': {'model': 'claude-sonnet-4-5', 'usage': {'input_tokens': tokens, 'output_tokens': 0}}
+    }) + '\n'
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                   cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_for_change(status, path, before, recursive=False):
+    """等待版本号变化（轮询模式下最多等几个轮询周期）"""
+    deadline = time.time() + POLL_INTERVAL * 20
+    while True:
+        version = status.watch_version(path, recursive)
+        if version != before or time.time() > deadline:
+            return version
+        time.sleep(POLL_INTERVAL / 2)
+
+def check_watcher(status, root, mode, check):
+    """目录内文件的追加、新建、改名，refs 下新建的子目录，以及目录被删除后重新监听"""
+    folder = os.path.join(root, f'{mode}-folder')
+    os.makedirs(folder)
+    transcript = os.path.join(folder, 'a.jsonl')
+    append(transcript, assistant_line(1))
+
+    version = status.watch_version(folder)
+    check("开始监听后返回版本号", version is not None)
+    time.sleep(POLL_INTERVAL * 2)
+    check("没有变化时版本号不变", status.watch_version(folder) == version)
+
+    for name, action in (
+        ("追加写入", lambda: append(transcript, assistant_line(2))),
+        ("新建文件", lambda: append(os.path.join(folder, 'b.jsonl'), assistant_line(3))),
+        ("改名", lambda: os.replace(os.path.join(folder, 'b.jsonl'), os.path.join(folder, 'c.jsonl'))),
+    ):
+        action()
+        new_version = wait_for_change(status, folder, version)
+        check(f"{name}后版本号增加", new_version is not None and new_version != version)
+        version = new_version
+
+    refs = os.path.join(root, f'{mode}-refs')
+    os.makedirs(os.path.join(refs, 'heads'))
+    version = status.watch_version(refs, recursive=True)
+    os.makedirs(os.path.join(refs, 'heads', 'feature'))
+    version = wait_for_change(status, refs, version, True)
+    append(os.path.join(refs, 'heads', 'feature', 'x'), 'a' * 40)
+    new_version = wait_for_change(status, refs, version, True)
+    check("新建子目录中的引用变化也能发现", new_version != version)
+
+    shutil.rmtree(folder)
+    gone = wait_for_change(status, folder, status.watch_version(folder))
+    check("目录删除后不再返回版本号", gone is None)
+    os.makedirs(folder)
+    check("目录重建后重新监听", status.watch_version(folder) is not None)
+
+def check_project_usage(status, root, lag, check):
+    """项目用量：文件夹没有变化时不再查询，其他会话写入后重新汇总（轮询模式下等待 lag 秒）"""
+    folder = os.path.join(root, 'project')
+    os.makedirs(folder)
+    active = os.path.join(folder, 'active.jsonl')
+    other = os.path.join(folder, 'other.jsonl')
+    append(active, assistant_line(100))
+    append(other, assistant_line(10))
+    status.find_project_folders = lambda: [folder]
+    status.load_claude_input(json.dumps({'transcript_path': active}))
+
+    queries = []
+    query = status.get_project_usage_from_db
+    status.get_project_usage_from_db = lambda folders: queries.append(folders) or query(folders)
+
+    def usage():
+        status.reset_render_state()
+        return status.get_project_usage()['tokens']
+
+    first = usage()
+    check("首次汇总", first == 110 and len(queries) == 1, f"({first} tokens，查询 {len(queries)} 次)")
+    second = usage()
+    check("文件夹没有变化时直接复用", second == 110 and len(queries) == 1, f"(查询 {len(queries)} 次)")
+    append(other, assistant_line(5))
+    time.sleep(lag)
+    third = usage()
+    check("其他会话写入后重新汇总", third == 115 and len(queries) == 2, f"({third} tokens)")
+    append(active, assistant_line(1))
+    fourth = usage()
+    check("当前会话写入后重新汇总", fourth == 116, f"({fourth} tokens)")
+
+def check_git_key(status, root, check):
+    """仓库指纹：.git 没有变化时不遍历 refs，切换分支和提交后指纹变化"""
+    repo_dir = os.path.join(root, 'repo')
+    os.makedirs(repo_dir)
+    git(repo_dir, 'init', '-q')
+    append(os.path.join(repo_dir, 'a.txt'), 'a')
+    git(repo_dir, 'add', 'a.txt')
+    git(repo_dir, 'commit', '-q', '-m', 'init')
+    repo = status.locate_git_dir(repo_dir)
+
+    walks = []
+    walk = status.os.walk
+    status.os.walk = lambda *args, **kwargs: walks.append(args) or walk(*args, **kwargs)
+    try:
+        first = status.git_cache_key(repo)
+        walks.clear()
+        second = status.git_cache_key(repo)
+        check("没有变化时沿用指纹，不遍历 refs", second == first and not walks, f"(遍历 {len(walks)} 次)")
+        git(repo_dir, 'checkout', '-q', '-b', 'feature/x')
+        time.sleep(POLL_INTERVAL * 3)
+        third = status.git_cache_key(repo)
+        check("切换分支后指纹变化", third != second)
+        append(os.path.join(repo_dir, 'a.txt'), 'b')
+        git(repo_dir, 'commit', '-q', '-am', 'change')
+        time.sleep(POLL_INTERVAL * 3)
+        check("提交后指纹变化", status.git_cache_key(repo) != third)
+    finally:
+        status.os.walk = walk
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检查守护进程的目录变更监听（inotify 与回退轮询）")
+    parser.add_argument('--mode', choices=['inotify', 'polling', 'limit', 'all'], default='all',
+                        help="inotify：正常监听；polling：inotify 不可用；limit：超出监听数上限")
+    args = parser.parse_args()
+
+    print_header("目录变更监听测试")
+
+    root = tempfile.mkdtemp(prefix='claude-status-watch-')
+    failed = []
+
+    def check(name, ok, detail=''):
+        if ok:
+            print_success(name)
+        else:
+            print_error(f"{name} {detail}")
+            failed.append(name)
+
+    try:
+        modes = ['inotify', 'polling', 'limit'] if args.mode == 'all' else [args.mode]
+        for mode in modes:
+            status = load_status_script(os.path.join(root, f'{mode}-home'), f'status_final_{mode}')
+            if mode == 'inotify':
+                if not status.init_inotify():
+                    print_warning("当前系统不支持 inotify，跳过")
+                    continue
+            elif mode == 'polling':
+                status._inotify = False
+            else:
+                # 模拟 inotify_add_watch 返回 ENOSPC（超出 max_user_watches）
+                status.inotify_add_tree = lambda group, path, recursive: False
+
+            print_step(mode, "目录监听")
+            check_watcher(status, root, mode, check)
+            print_step(mode, "项目用量")
+            lag = 0 if mode == 'inotify' else POLL_INTERVAL * 3
+            check_project_usage(status, os.path.join(root, f'{mode}-usage'), lag, check)
+            print_step(mode, "仓库指纹")
+            check_git_key(status, os.path.join(root, f'{mode}-git'), check)
+            groups = status._watch_groups.values()
+            print_info("监听组", f"{sum(1 for g in groups if g['signature'] is None)} 个 inotify，"
+                                f"{sum(1 for g in groups if g['signature'] is not None)} 个轮询")
+            print()
+
+        print("="*60)
+        if failed:
+            print(f"{Colors.RED}{Colors.BOLD}测试未通过 ✗（{len(failed)} 项失败）{Colors.RESET}")
+        else:
+            print(f"{Colors.GREEN}{Colors.BOLD}测试通过 ✓{Colors.RESET}")
+        print("="*60 + "\n")
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
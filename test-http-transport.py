@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP 传输层测试工具
+在本机启动一个模拟 Cubence 的 HTTP 服务，检查状态栏的连接复用、gzip、
+ETag/Last-Modified 条件请求（304 复用缓存）以及空闲连接被服务器关闭后的重试
+"""
+
+import sys
+import os
+import json
+import gzip
+import shutil
+import tempfile
+import threading
+import argparse
+import importlib.util
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SUBSCRIPTION_PATH = '/api/v1/user/subscription-info'
+LAST_MODIFIED = 'Sat, 17 Oct 2026 08:00:00 GMT'
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def print_warning(text):
+    """打印警告信息"""
+    print(f"{Colors.YELLOW}⚠ {text}{Colors.RESET}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+class StandIn:
+    """模拟服务的状态：当前配额、计数器和故障注入开关"""
+    def __init__(self):
+        self.used = 40
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.gzipped = 0
+        self.posts = 0
+        self.validator = 'etag'      # 'etag' / 'last-modified'：只发送其中一种校验头
+        self.drop_after_next = False  # 下一次响应后直接断开（不发送 Connection: close）
+        self.lock = threading.Lock()
+
+    def payload(self):
+        window = {'limit': 100, 'remaining': 100 - self.used, 'used': self.used, 'reset_at': 1792400000}
+        return json.dumps({'subscription_window': {'five_hour': window, 'weekly': window}}).encode('utf-8')
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state.lock:
+                state.requests += 1
+            if self.path != SUBSCRIPTION_PATH:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            body = state.payload()
+            etag = f'"{zlib.crc32(body):08x}"'
+            if state.validator == 'etag':
+                fresh = self.headers.get('If-None-Match') == etag
+            else:
+                fresh = self.headers.get('If-Modified-Since') == LAST_MODIFIED and state.used == 40
+
+            if fresh:
+                with state.lock:
+                    state.not_modified += 1
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+            else:
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    with state.lock:
+                        state.gzipped += 1
+                    self.send_response(200)
+                    self.send_header('Content-Encoding', 'gzip')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+            if state.validator == 'etag':
+                self.send_header('ETag', etag)
+            else:
+                self.send_header('Last-Modified', LAST_MODIFIED)
+            self.end_headers()
+            if not fresh:
+                self.wfile.write(body)
+
+            if state.drop_after_next:
+                state.drop_after_next = False
+                self.close_connection = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with state.lock:
+                state.requests += 1
+                state.posts += 1
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def load_status_script(home):
+    """在临时 HOME 下导入状态栏脚本（缓存文件写到临时目录）"""
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    os.makedirs(os.path.join(home, '.claude'), exist_ok=True)
+    spec = importlib.util.spec_from_file_location('status_final', os.path.join(SCRIPT_DIR, 'status-final.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="用本地模拟服务检查状态栏的 HTTP 传输层")
+    parser.add_argument('--transport', choices=['stdlib', 'requests', 'all'], default='all', help="要检查的传输方式")
+    args = parser.parse_args()
+
+    print_header("HTTP 传输层测试")
+
+    state = StandIn()
+    server = StandInServer(('127.0.0.1', 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    root = tempfile.mkdtemp(prefix='claude-status-http-')
+    failed = []
+
+    def check(name, ok, detail=''):
+        if ok:
+            print_success(name)
+        else:
+            print_error(f"{name} {detail}")
+            failed.append(name)
+
+    try:
+        status = load_status_script(os.path.join(root, 'home'))
+        status.CUBENCE_API_BASE = base
+        url = base + SUBSCRIPTION_PATH
+        print_info("模拟服务", base)
+        print()
+
+        transports = ['stdlib', 'requests'] if args.transport == 'all' else [args.transport]
+        for transport in transports:
+            if transport == 'requests':
+                try:
+                    import requests  # noqa: F401
+                except ImportError:
+                    print_warning("未安装 requests，跳过 requests 传输")
+                    continue
+            status.HTTP_TRANSPORT = transport
+            status._http_cache = None
+            status._http_pool.clear()
+            try:
+                os.remove(status.HTTP_CACHE_FILE)
+            except OSError:
+                pass
+            state.used = 40
+            state.validator = 'etag'
+
+            print_step(transport, "ETag 条件请求")
+            before = (state.connections, state.gzipped)
+            first = status.http_get(url, timeout=5)
+            check("首次请求返回 200 并正确解压", first.status_code == 200 and not first.not_modified
+                  and first.json()['subscription_window']['five_hour']['used'] == 40, f"({first.status_code})")
+            check("请求声明接受 gzip", state.gzipped > before[1])
+            second = status.http_get(url, timeout=5)
+            check("数据未变化时服务器返回 304，复用缓存的响应体",
+                  second.not_modified and second.status_code == 200 and second.content == first.content)
+            check("两次请求复用同一个连接", state.connections - before[0] == 1,
+                  f"(新建了 {state.connections - before[0]} 个连接)")
+
+            state.used = 55
+            third = status.http_get(url, timeout=5)
+            check("数据变化后返回新的响应体", not third.not_modified
+                  and third.json()['subscription_window']['five_hour']['used'] == 55)
+
+            # 模拟新进程：清空内存中的连接池和缓存，校验头应从磁盘读取
+            status._http_cache = None
+            status._http_pool.clear()
+            fourth = status.http_get(url, timeout=5)
+            check("新进程从磁盘读取 ETag 后仍得到 304", fourth.not_modified
+                  and fourth.json()['subscription_window']['five_hour']['used'] == 55)
+
+            print_step(transport, "Last-Modified 条件请求")
+            state.validator = 'last-modified'
+            state.used = 40
+            status.http_get(url, timeout=5)
+            fifth = status.http_get(url, timeout=5)
+            check("只有 Last-Modified 时也能得到 304", fifth.not_modified)
+
+            print_step(transport, "空闲连接被服务器关闭")
+            state.validator = 'etag'
+            state.drop_after_next = True
+            try:
+                status.http_get(url, timeout=5)
+                sixth = status.http_get(url, timeout=5)
+                check("自动换新连接重试", sixth.status_code == 200)
+            except Exception as e:
+                check("自动换新连接重试", False, f"({type(e).__name__}: {e})")
+
+            if transport == 'stdlib':
+                # POST 不能确定服务器是否已处理，复用的连接断开时不重试
+                state.drop_after_next = True
+                status.http_get(url, timeout=5)
+                posts = state.posts
+                try:
+                    status.http_post(base + '/login', json={}, timeout=5)
+                    check("复用的连接断开时 POST 不重试", False, "(请求成功，说明发生了重试)")
+                except ConnectionError:
+                    check("复用的连接断开时 POST 不重试", state.posts == posts)
+                try:
+                    check("断开的连接已丢弃，下一次 POST 正常",
+                          status.http_post(base + '/login', json={}, timeout=5).status_code == 200)
+                except Exception as e:
+                    check("断开的连接已丢弃，下一次 POST 正常", False, f"({type(e).__name__}: {e})")
+
+            print_step(transport, "配额请求")
+            state.used = 70
+            entry = status.fetch_cubence_subscription()
+            check("fetch_cubence_subscription 使用可配置的 API 地址",
+                  bool(entry) and entry['data']['five_hour']['used'] == 70)
+            print()
+
+        print_info("服务器统计", f"{state.requests} 个请求，{state.connections} 个连接，"
+                               f"{state.not_modified} 个 304，{state.gzipped} 个 gzip 响应")
+
+        print("\n" + "="*60)
+        if failed:
+            print(f"{Colors.RED}{Colors.BOLD}测试未通过 ✗（{len(failed)} 项失败）{Colors.RESET}")
+        else:
+            print(f"{Colors.GREEN}{Colors.BOLD}测试通过 ✓{Colors.RESET}")
+        print("="*60 + "\n")
+        return 1 if failed else 0
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
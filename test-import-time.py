@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+状态栏启动耗时检查工具
+用 python -X importtime 测量导入 status-final.py 的耗时，超出预算时返回非零退出码
+"""
+
+import sys
+import os
+import subprocess
+import argparse
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+# 导入耗时预算（毫秒）
+DEFAULT_BUDGET_MS = 30
+# 测量次数，取中位数以减少抖动
+DEFAULT_RUNS = 5
+# 启动阶段不允许导入的重量级模块
+FORBIDDEN_MODULES = ('requests', 'urllib3')
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+def measure_import(script_path):
+    """在全新进程中导入脚本一次，返回 [(模块名, 自身耗时us, 累计耗时us, 缩进层级)]"""
+    script_dir, script_name = os.path.split(os.path.abspath(script_path))
+    module_name = os.path.splitext(script_name)[0]
+    code = f"import sys; sys.path.insert(0, {script_dir!r}); __import__({module_name!r})"
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        encoding='utf-8', timeout=30
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return module_name, entries
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检查 status-final.py 的导入耗时")
+    parser.add_argument('script', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'status-final.py'),
+                        help="要检查的脚本路径（默认为同目录下的 status-final.py）")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS, help="导入耗时预算（毫秒）")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="测量次数")
+    args = parser.parse_args()
+
+    print_header("状态栏启动耗时检查")
+    print_info("脚本", args.script)
+    print_info("预算", f"{args.budget:.0f}ms")
+    print()
+
+    print_step("1/2", f"测量导入耗时（{args.runs} 次）...")
+    runs = []
+    for _ in range(args.runs):
+        try:
+            module_name, entries = measure_import(args.script)
+        except Exception as e:
+            print_error(f"导入失败: {e}")
+            return 1
+        index = next((i for i, entry in enumerate(entries) if entry[0] == module_name), None)
+        if index is None:
+            print_error("importtime 输出中没有找到脚本本身")
+            return 1
+        # importtime 先输出子模块再输出父模块，往前取缩进更深的连续行即为脚本触发的导入
+        _, _, total, depth = entries[index]
+        start = index
+        while start > 0 and entries[start - 1][3] > depth:
+            start -= 1
+        runs.append((total, entries[start:index + 1]))
+
+    runs.sort(key=lambda run: run[0])
+    median_total, median_entries = runs[len(runs) // 2]
+    print_info("中位数", f"{median_total / 1000:.1f}ms")
+    print_info("最快/最慢", f"{runs[0][0] / 1000:.1f}ms / {runs[-1][0] / 1000:.1f}ms")
+
+    print("\n  最慢的导入（自身耗时）:")
+    for name, self_us, cumulative_us, depth in sorted(median_entries, key=lambda e: -e[1])[:10]:
+        print(f"    {self_us / 1000:6.2f}ms  {name}")
+    print()
+
+    print_step("2/2", "检查重量级依赖...")
+    imported = {name for name, _, _, _ in median_entries}
+    failed = False
+    for module in FORBIDDEN_MODULES:
+        if module in imported:
+            print_error(f"启动阶段导入了 {module}，应在真正发请求时再导入")
+            failed = True
+    if not failed:
+        print_success("启动阶段未导入 " + "、".join(FORBIDDEN_MODULES))
+
+    if median_total / 1000 > args.budget:
+        print_error(f"导入耗时 {median_total / 1000:.1f}ms 超出预算 {args.budget:.0f}ms")
+        failed = True
+    else:
+        print_success(f"导入耗时 {median_total / 1000:.1f}ms 在预算 {args.budget:.0f}ms 以内")
+
+    print("\n" + "="*60)
+    if failed:
+        print(f"{Colors.RED}{Colors.BOLD}检查未通过 ✗{Colors.RESET}")
+    else:
+        print(f"{Colors.GREEN}{Colors.BOLD}检查通过 ✓{Colors.RESET}")
+    print("="*60 + "\n")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配额历史环形缓冲区测试工具
+在临时目录中写入配额样本，检查绕回后的顺序、容量变化时重建、读写加锁，
+以及窗口重置、额度变化时的消耗速度和用完时间估算
+"""
+
+import sys
+import os
+import re
+import shutil
+import tempfile
+import threading
+import importlib.util
+import time
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 测试中使用的环形缓冲区容量（调小以便绕回）
+CAPACITY = 8
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def load_status_script(home):
+    """在临时 HOME 下导入状态栏脚本"""
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    os.makedirs(os.path.join(home, '.claude'), exist_ok=True)
+    spec = importlib.util.spec_from_file_location('status_final', os.path.join(SCRIPT_DIR, 'status-final.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.QUOTA_RING_CAPACITY = CAPACITY
+    return module
+
+def sample(fetched_at, five_used, five_limit=100, week_used=0, week_limit=1000, reset_at=0):
+    """构造一条和 fetch_cubence_subscription 返回值相同结构的缓存条目"""
+    return {'fetched_at': fetched_at, 'data': {
+        'five_hour': {'used': five_used, 'limit': five_limit, 'reset_at': reset_at},
+        'weekly': {'used': week_used, 'limit': week_limit, 'reset_at': reset_at},
+    }}
+
+def reset_ring(status):
+    if os.path.exists(status.QUOTA_RING_FILE):
+        os.remove(status.QUOTA_RING_FILE)
+
+def check_ring(status, check):
+    """绕回后的顺序、容量变化时清空重建"""
+    reset_ring(status)
+    check("没有历史时返回空列表", status.read_quota_samples() == [])
+    for i in range(3):
+        status.append_quota_sample(sample(1000 + i, i))
+    times = [s[0] for s in status.read_quota_samples()]
+    check("未绕回时按时间排列", times == [1000, 1001, 1002], f"({times})")
+
+    for i in range(3, CAPACITY * 2 + 3):
+        status.append_quota_sample(sample(1000 + i, i))
+    times = [s[0] for s in status.read_quota_samples()]
+    expected = [1000 + i for i in range(CAPACITY + 3, CAPACITY * 2 + 3)]
+    check("绕回后只保留最近的样本，按时间从旧到新排列", times == expected, f"({times})")
+    size = os.path.getsize(status.QUOTA_RING_FILE)
+    check("文件大小固定", size == 12 + CAPACITY * 56, f"({size} 字节)")
+
+    status.QUOTA_RING_CAPACITY = CAPACITY // 2
+    try:
+        check("容量变化后不读取旧格式的数据", status.read_quota_samples() == [])
+        status.append_quota_sample(sample(2000, 1))
+        times = [s[0] for s in status.read_quota_samples()]
+        check("容量变化后清空重建", times == [2000], f"({times})")
+    finally:
+        status.QUOTA_RING_CAPACITY = CAPACITY
+
+def check_lock(status, check):
+    """写入方持有排他锁期间，读取等待写完再读"""
+    reset_ring(status)
+    status.append_quota_sample(sample(1000, 1))
+    result = []
+    with open(status.QUOTA_RING_FILE, 'r+b') as f:
+        status.lock_file_exclusive(f)
+        reader = threading.Thread(target=lambda: result.append(status.read_quota_samples()), daemon=True)
+        reader.start()
+        reader.join(0.3)
+        check("写入期间读取被阻塞", reader.is_alive() and not result)
+    reader.join(2)
+    check("写入结束后读取完成", len(result) == 1 and len(result[0]) == 1)
+
+def check_burn(status, check):
+    """窗口重置、额度变化时只用重置/变化之后的样本估算"""
+    now = 100000
+    reset_ring(status)
+    # 前两条属于上一个窗口（用量回落说明窗口已重置）
+    for offset, used in ((-3000, 50), (-2400, 80), (-1800, 0), (-1200, 10), (-600, 20)):
+        status.append_quota_sample(sample(now + offset, used))
+    rate, exhaust_at = status.quota_burn_rate(status.read_quota_samples(), 'five_hour')
+    check("窗口重置前的样本不参与估算", abs(rate - 0.6) < 1e-9, f"({rate:.3f}/h)")
+    check("用完时间从最新样本算起", abs(exhaust_at - (now - 600 + 80 / (20 / 1200))) < 1e-6)
+
+    reset_ring(status)
+    # 额度从 50 提到 100 之后用量照常增长
+    for offset, used, limit in ((-1800, 0, 50), (-1200, 30, 100), (-600, 35, 100), (0, 40, 100)):
+        status.append_quota_sample(sample(now + offset, used, limit))
+    rate, exhaust_at = status.quota_burn_rate(status.read_quota_samples(), 'five_hour')
+    check("额度变化前的样本不参与估算", abs(rate - 0.3) < 1e-9, f"({rate:.3f}/h)")
+
+    reset_ring(status)
+    for offset, used in ((-200, 10), (0, 20)):
+        status.append_quota_sample(sample(now + offset, used))
+    check("样本跨度不足时不估算", status.quota_burn_rate(status.read_quota_samples(), 'five_hour') is None)
+
+    reset_ring(status)
+    for offset, used in ((-1200, 10), (0, 10)):
+        status.append_quota_sample(sample(now + offset, used))
+    check("用量没有增长时速度为 0", status.quota_burn_rate(status.read_quota_samples(), 'five_hour') == (0.0, None))
+
+def check_eta_display(status, check):
+    """最新样本已经过去一段时间时，显示的用完时间要扣掉这段时间"""
+    now = time.time()
+    reset_ring(status)
+    # 每 600 秒用掉 10，剩余 80 需要 4800 秒；最新样本在 570 秒前，距现在约 1h10m
+    for offset, used in ((-1170, 10), (-570, 20)):
+        status.append_quota_sample(sample(now + offset, used, reset_at=now + 5 * 3600))
+    data = sample(now, 20, reset_at=now + 5 * 3600)['data']
+    data['burn'] = status.get_quota_burn()
+    text = re.sub(r'\033\[[0-9;]*m', '', status.format_total_cost_display(data))
+    check("用完时间相对当前时间显示", "+60%/h→100% 1h10m" in text, f"({text})")
+
+    data['five_hour']['reset_at'] = now + 3600
+    text = re.sub(r'\033\[[0-9;]*m', '', status.format_total_cost_display(data))
+    check("重置前用不完时不显示用完时间", "+60%/h" in text and "→100%" not in text, f"({text})")
+
+def main():
+    """主函数"""
+    print_header("配额历史测试")
+
+    home = tempfile.mkdtemp(prefix='claude-status-quota-')
+    failed = []
+
+    def check(name, ok, detail=''):
+        if ok:
+            print_success(name)
+        else:
+            print_error(f"{name} {detail}")
+            failed.append(name)
+
+    try:
+        status = load_status_script(home)
+        print_step("1/4", "环形缓冲区")
+        check_ring(status, check)
+        print_step("2/4", "读写加锁")
+        check_lock(status, check)
+        print_step("3/4", "消耗速度")
+        check_burn(status, check)
+        print_step("4/4", "用完时间显示")
+        check_eta_display(status, check)
+
+        print("\n" + "="*60)
+        if failed:
+            print(f"{Colors.RED}{Colors.BOLD}测试未通过 ✗（{len(failed)} 项失败）{Colors.RESET}")
+        else:
+            print(f"{Colors.GREEN}{Colors.BOLD}测试通过 ✓{Colors.RESET}")
+        print("="*60 + "\n")
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Transcript 解析一致性检查
+用很小的读取块分块解析同一批 transcript 文件（行跨块边界），与逐行 json.loads 的参考结果
+逐文件比较聚合结果，要求完全一致；同时检查 token 字段按实际字段名解析
+"""
+
+import sys
+import os
+import glob
+import shutil
+import tempfile
+import argparse
+import importlib.util
+import json
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# ANSI 颜色代码
+class Colors:
+    RESET = '\033[0m'
+    RED = '\033[31m'
+    GREEN = '\033[32m'
+    YELLOW = '\033[33m'
+    BLUE = '\033[34m'
+    CYAN = '\033[36m'
+    BOLD = '\033[1m'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 手写的边界情况：转义书写的键名/取值、非对象 JSON、空白行、截断行、不含会话信息的记录
+EDGE_CASE_LINES = [
+    b'{"type":"\\u0075ser","sessionId":"s1","timestamp":"2025-01-01T00:00:00.000Z"}',
+    b'{"type":"user"}',
+    b'{"\\u0073essionId":"s2","timestamp":"2025-01-01T00:00:01.000Z"}',
+    b'{"type":"assistant","message":{"\\u0075sage":{"input_tokens":5,"output_tokens":7}}}',
+    b'{"type":"assistant","message":{"usage":{"input_tokens":1,"output_tokens":2,"cache_read_input_tokens":3,"cache_create_input_tokens":4}}}',
+    b'{"type":"assistant","message":{"usage":{}},"sessionId":"s3","timestamp":"2025-01-01T00:00:02.000Z"}',
+    b'{"type":"assistant","message":{"content":"no usage"},"sessionId":"s3","timestamp":"not a date"}',
+    b'{"type":"mode","mode":"plan"}',
+    b'{"type":"file-history-snapshot","snapshot":{"timestamp":"2025-01-01T00:00:03.000Z"}}',
+    b'{"type":"summary","summary":"\\u4f60\\u597d","leafUuid":"x"}',
+    b'[1, 2, 3]',
+    b'"user"',
+    b'null',
+    b'',
+    b'   ',
+    b'{"type":"user","sessionId":"s4","timestamp":"2025-01-01T00:00:04.000Z","message":{"content":"cut',
+    b'{"sessionId": "s5", "timestamp": "2025-01-01T00:00:05.000Z", "type": "user"}',
+]
+
+# 与 Claude Code 写入的字段名一致的 assistant 记录，以及期望解析出的 4 种 token
+USAGE_LINE = (b'{"type":"assistant","sessionId":"s1","timestamp":"2025-01-01T00:00:00.000Z",'
+              b'"message":{"model":"claude-sonnet-4-5","usage":{"input_tokens":10,"output_tokens":20,'
+              b'"cache_read_input_tokens":300,"cache_creation_input_tokens":4000}}}')
+USAGE_LINE_COUNTS = (10, 20, 300, 4000)
+
+# 检查时使用的读取块大小（调小以便行跨块边界）
+READ_CHUNK = 4096
+
+def print_header(text):
+    """打印标题"""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{text:^60}{Colors.RESET}")
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+
+def print_step(step, text):
+    """打印步骤"""
+    print(f"{Colors.BLUE}[{step}]{Colors.RESET} {text}")
+
+def print_success(text):
+    """打印成功信息"""
+    print(f"{Colors.GREEN}✓ {text}{Colors.RESET}")
+
+def print_error(text):
+    """打印错误信息"""
+    print(f"{Colors.RED}✗ {text}{Colors.RESET}")
+
+def print_info(key, value):
+    """打印信息"""
+    print(f"  {Colors.CYAN}{key}:{Colors.RESET} {value}")
+
+def load_script(name, file_name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def reference_agg(status, path):
+    """逐行 json.loads 得到的参考聚合"""
+    agg = status.new_transcript_agg()
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n') or not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                status.feed_transcript_line(agg, data)
+    return agg
+
+def check_usage_fields(status, root):
+    """检查 4 种 token 按 transcript 的实际字段名解析（缓存写入不能是 0），返回失败项列表"""
+    failed = []
+    path = os.path.join(root, 'usage-fields.jsonl')
+    with open(path, 'wb') as f:
+        f.write(USAGE_LINE + b'\n')
+
+    counts = status.usage_token_counts(json.loads(USAGE_LINE)['message']['usage'])
+    if counts != USAGE_LINE_COUNTS:
+        failed.append(f"usage_token_counts: {counts}，期望 {USAGE_LINE_COUNTS}")
+
+    agg = status.scan_transcript_file(path, None)['agg']
+    if agg['tokens'] != sum(USAGE_LINE_COUNTS) or agg['cost'] != status.token_cost(*USAGE_LINE_COUNTS):
+        failed.append(f"检查点聚合: {agg['tokens']} tokens / ${agg['cost']:.6f}")
+
+    rollup = status.new_rollup_agg()
+    status.feed_rollup_line(rollup, json.loads(USAGE_LINE))
+    cache_create = sum(values[3] for values in rollup['usage'].values())
+    if cache_create != USAGE_LINE_COUNTS[3]:
+        failed.append(f"数据库汇总的 cache_create: {cache_create}，期望 {USAGE_LINE_COUNTS[3]}")
+    return failed
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检查 transcript 分块解析与逐行解析的结果是否一致")
+    parser.add_argument('--sessions', type=int, default=10, help="模拟语料中每个项目的会话文件数")
+    parser.add_argument('--lines', type=int, default=500, help="每个会话文件的行数")
+    parser.add_argument('--malformed', type=float, default=0.05, help="损坏行的比例")
+    parser.add_argument('--real', action='store_true', help="同时检查本机 ~/.claude/projects 下的真实 transcript（只读）")
+    args = parser.parse_args()
+
+    print_header("Transcript 解析一致性检查")
+
+    real_files = []
+    if args.real:
+        real_files = sorted(glob.glob(os.path.join(os.path.expanduser('~/.claude/projects'), '*', '*.jsonl')))
+
+    root = tempfile.mkdtemp(prefix='claude-status-parse-')
+    try:
+        # 状态栏脚本在导入时按 HOME 确定缓存路径，先指向临时目录
+        os.environ['HOME'] = os.path.join(root, 'home')
+        os.environ['USERPROFILE'] = os.environ['HOME']
+        bench = load_script('bench_transcripts', 'bench-transcripts.py')
+        status = load_script('status_final', 'status-final.py')
+
+        print_step("1/3", "准备语料...")
+        info = bench.generate_corpus(root, projects=2, sessions=args.sessions, lines=args.lines,
+                                     agent_files=1, malformed=args.malformed, tool_result_kb=5)
+        edge_file = os.path.join(root, 'edge-cases.jsonl')
+        with open(edge_file, 'wb') as f:
+            f.write(b'\n'.join(EDGE_CASE_LINES) + b'\n')
+        files = sorted(glob.glob(os.path.join(info['home'], '.claude', 'projects', '*', '*.jsonl'))) + [edge_file]
+        print_info("模拟语料", f"{len(files)} 个文件，{info['bytes'] / 1024 / 1024:.1f}MB（含 {len(EDGE_CASE_LINES)} 行边界情况）")
+        if args.real:
+            print_info("真实语料", f"{len(real_files)} 个文件")
+        print()
+
+        print_step("2/3", "比较分块解析与逐行解析的聚合结果...")
+        status.TRANSCRIPT_READ_CHUNK = READ_CHUNK
+        failed = False
+        for label, corpus in (('模拟语料', files), ('真实语料', real_files)):
+            if not corpus:
+                continue
+            mismatches = []
+            for path in corpus:
+                expected = reference_agg(status, path)
+                actual = status.scan_transcript_file(path, None)['agg']
+                if actual != expected:
+                    mismatches.append((path, expected, actual))
+            print(f"\n  {Colors.BOLD}{label}{Colors.RESET}")
+            if mismatches:
+                failed = True
+                for path, expected, actual in mismatches[:10]:
+                    print_error(f"结果不一致: {path}")
+                    print(f"      逐行解析: {expected}")
+                    print(f"      分块解析: {actual}")
+            else:
+                print_success(f"{len(corpus)} 个文件的聚合结果完全一致")
+
+        print()
+        print_step("3/3", "检查 token 字段解析...")
+        field_errors = check_usage_fields(status, root)
+        for error in field_errors:
+            print_error(error)
+        if field_errors:
+            failed = True
+        else:
+            print_success(f"缓存写入 {USAGE_LINE_COUNTS[3]} tokens 计入检查点聚合和数据库汇总")
+
+        print("\n" + "="*60)
+        if failed:
+            print(f"{Colors.RED}{Colors.BOLD}检查未通过 ✗{Colors.RESET}")
+        else:
+            print(f"{Colors.GREEN}{Colors.BOLD}检查通过 ✓{Colors.RESET}")
+        print("="*60 + "\n")
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Colors.YELLOW}用户中断{Colors.RESET}")
+        sys.exit(1)